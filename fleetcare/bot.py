@@ -1,5 +1,8 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
+import contextvars
 import os
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 from dotenv import load_dotenv
 import httpx
 from telegram import (
@@ -15,16 +18,68 @@ from telegram.ext import (
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
+    TypeHandler,
     filters,
     ContextTypes,
 )
 import logging, re
+from bot_updates import PerUserUpdateProcessor
+from profiler import Profiler, profiled
 
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
 API_BASE = os.getenv("API_BASE", "http://127.0.0.1:8000/api")
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
+# Адрес Bot API (для нагрузочных прогонов - локальная замена, см. loadtest/)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Параллельная обработка обновлений: сколько одновременно, сколько в очереди,
+# как часто писать метрики очередей в лог (0 - только при остановке)
+BOT_CONCURRENCY = int(os.getenv("BOT_CONCURRENCY", "32"))
+BOT_MAX_PENDING = int(os.getenv("BOT_MAX_PENDING", "1024"))
+BOT_STATS_INTERVAL = float(os.getenv("BOT_STATS_INTERVAL", "60"))
+
+# Выборочное профилирование обработчиков: доля обновлений 0..1 (0 - выключено),
+# каталог .prof-файлов и минимальная длительность (мс), см. profiler.py
+PROFILER = Profiler(
+    float(os.getenv("BOT_PROFILE_SAMPLE_RATE", "0")),
+    os.getenv("PROFILE_DIR", "profiles"),
+    float(os.getenv("PROFILE_MIN_MS", "0")),
+)
+
+# Попыток для POST с Idempotency-Key (запись/отмена) при сетевых ошибках
+API_POST_ATTEMPTS = int(os.getenv("API_POST_ATTEMPTS", "3"))
+
+# Формат ответов API: json (по умолчанию) или msgpack (нужен пакет msgpack)
+API_FORMAT = os.getenv("API_FORMAT", "json")
+if API_FORMAT == "msgpack":
+    import msgpack
+
+    API_HEADERS = {"Accept": "application/msgpack"}
+else:
+    API_HEADERS = {"Accept": "application/json"}
+
+# Лимиты частоты API (см. core/throttling.py): с токеном бота лимит считается
+# по водителю (X-Client-Id), а не по IP бота. На 429 бот ждет Retry-After,
+# если это не дольше API_RETRY_AFTER_MAX секунд, и повторяет запрос
+THROTTLE_BOT_TOKEN = os.getenv("THROTTLE_BOT_TOKEN", "")
+if THROTTLE_BOT_TOKEN:
+    API_HEADERS["X-Bot-Token"] = THROTTLE_BOT_TOKEN
+API_RETRY_AFTER_MAX = float(os.getenv("API_RETRY_AFTER_MAX", "10"))
+API_THROTTLE_RETRIES = int(os.getenv("API_THROTTLE_RETRIES", "2"))
+
+# Telegram id водителя, чье обновление сейчас обрабатывается (в своей задаче)
+API_CLIENT = contextvars.ContextVar("api_client", default=None)
+
+# Один HTTP-клиент API на весь бот (keep-alive, без нового соединения на запрос),
+# создается в post_init. После записи сервер ставит cookie закрепления за основной
+# БД (fleetcare_primary, см. core/db_routing.py): храним их по водителю, чтобы его
+# следующие чтения видели запись, а чтения остальных водителей шли в реплики.
+# Общий cookie jar клиента ничего не хранит
+API = None
+API_COOKIES = {}  # telegram id -> httpx.Cookies
+
 # Ключи callback_data для маршрутизации
 CB_BOOK = "BOOK"
 CB_CANCEL = "CANCEL"
@@ -33,37 +88,120 @@ CB_BOOK_DATE = "BOOK_DATE"  # BOOK_DATE|2025-09-25
 CB_BOOK_TIME = "BOOK_TIME"  # BOOK_TIME|slot_id
 CB_CANCEL_PICK = "CANCEL_PICK"  # CANCEL_PICK|ap_id
 CB_INFO_PICK = "INFO_PICK"  # INFO_PICK|last|next
+CB_WAITLIST = "WAITLIST"  # встать в лист ожидания на ближайшую неделю
+CB_CALENDAR = "CALENDAR"  # ссылка на календарь с записями (.ics)
+CB_WL_TAKE = "WL_TAKE"  # WL_TAKE|offer_id - записаться на предложенное место
+CB_WL_SKIP = "WL_SKIP"  # WL_SKIP|offer_id - отказаться от предложенного места
 
 # Храним телефон пользователя в памяти (для простоты)
 # В проде - можно хранить в БД
 AUTH = {}  # tele_user_id -> phone
 
 
+# Разбор ответа API в зависимости от Content-Type
+def api_decode(r: httpx.Response):
+    if r.headers.get("content-type", "").startswith("application/msgpack"):
+        return msgpack.unpackb(r.content)
+    return r.json()
+
+
+# Секунды из Retry-After ответа 429 (None - запрос не ограничен)
+def retry_after(r: httpx.Response):
+    if r.status_code != 429:
+        return None
+    try:
+        return float(r.headers.get("Retry-After", "1"))
+    except ValueError:
+        return 1.0
+
+
+async def open_api(app):
+    global API
+    API = httpx.AsyncClient(
+        timeout=10,
+        follow_redirects=True,
+        headers=API_HEADERS,
+        cookies=CookieJar(DefaultCookiePolicy(allowed_domains=[])),
+    )
+
+
+async def close_api(app):
+    await API.aclose()
+
+
+# Cookie водителя для запроса (просроченные - удаляются)
+def client_cookies(client_id):
+    cookies = API_COOKIES.get(client_id)
+    if cookies is not None:
+        cookies.jar.clear_expired_cookies()
+        if not cookies:
+            del API_COOKIES[client_id]
+            return None
+    return cookies
+
+
+# Запрос к API от имени водителя текущего обновления. На 429 ждет Retry-After
+# и повторяет: отклоненный запрос не выполнялся, повтор безопасен и для POST
+async def api_request(method: str, path: str, headers: dict = None, **kwargs):
+    client_id = API_CLIENT.get()
+    headers = dict(headers or {})
+    if client_id:
+        headers["X-Client-Id"] = client_id
+    for attempt in range(API_THROTTLE_RETRIES + 1):
+        request = API.build_request(
+            method, f"{API_BASE}{path}", headers=headers, **kwargs
+        )
+        cookies = client_cookies(client_id) if client_id else None
+        if cookies is not None:
+            cookies.set_cookie_header(request)
+        r = await API.send(request)
+        if client_id and r.cookies:
+            API_COOKIES.setdefault(client_id, httpx.Cookies()).extract_cookies(r)
+        delay = retry_after(r)
+        if delay is None or delay > API_RETRY_AFTER_MAX:
+            return r
+        if attempt < API_THROTTLE_RETRIES:
+            logging.info("API %s %s: 429, повтор через %.0f с", method, path, delay)
+            await asyncio.sleep(delay)
+    return r
+
+
 # Отправляет GET-запрос к серверу Django и возвращает данные в виде JSON
 # (используется для получения информации)
 async def api_get(path: str, params: dict = None):
-    async with httpx.AsyncClient(timeout=10, follow_redirects=True) as client:
-        r = await client.get(f"{API_BASE}{path}", params=params or {})
-        r.raise_for_status()
-        return r.json()
+    r = await api_request("GET", path, params=params or {})
+    r.raise_for_status()
+    return api_decode(r)
 
 
 # Отправляет POST-запрос на сервер
-# (создание новых записей, например, при записи на ТО)
-async def api_post(path: str, json: dict = None):
-    async with httpx.AsyncClient(timeout=10, follow_redirects=True) as client:
-        r = await client.post(f"{API_BASE}{path}", json=json or {})
-        r.raise_for_status()
-        return r.json()
+# (создание новых записей, например, при записи на ТО).
+# С idempotency_key запрос безопасно повторяется при таймауте/обрыве:
+# сервер вернет сохраненный ответ, а не выполнит запись второй раз
+async def api_post(path: str, json: dict = None, idempotency_key: str = None):
+    headers = {}
+    attempts = 1
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+        attempts = API_POST_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            r = await api_request("POST", path, headers=headers, json=json or {})
+            break
+        except httpx.TransportError:
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(0.5 * (attempt + 1))
+    r.raise_for_status()
+    return api_decode(r)
 
 
 # Отправляет PATCH-запрос для частичного обновления данных
 # (например, сохранение chat_id водителя)
 async def api_patch(path: str, json: dict = None):
-    async with httpx.AsyncClient(timeout=10, follow_redirects=True) as client:
-        r = await client.patch(f"{API_BASE}{path}", json=json or {})
-        r.raise_for_status()
-        return r.json()
+    r = await api_request("PATCH", path, json=json or {})
+    r.raise_for_status()
+    return api_decode(r)
 
 
 # Нормализация номера тел.
@@ -85,10 +223,27 @@ def main_menu_kb():
             [
                 InlineKeyboardButton("Информация о ТО", callback_data=CB_INFO),
             ],
+            [
+                InlineKeyboardButton("Записи в календаре", callback_data=CB_CALENDAR),
+            ],
         ]
     )
 
 
+# Лист ожидания + главное меню
+def waitlist_kb():
+    return InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    "Ждать освободившееся место", callback_data=CB_WAITLIST
+                )
+            ]
+        ]
+        + list(main_menu_kb().inline_keyboard)
+    )
+
+
 # Кнопки да/нет
 def yes_no_kb(yes_cb, no_cb):
     return InlineKeyboardMarkup(
@@ -102,6 +257,7 @@ def yes_no_kb(yes_cb, no_cb):
 
 
 # Авторизация (/start)
+@profiled(PROFILER)
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Просим контакт с телефона (кнопка Телефон появляется только на мобильном Telegram)
@@ -118,6 +274,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Передача номера по кнопке
+@profiled(PROFILER)
 async def contact_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Пользователь поделился контактом
@@ -126,6 +283,7 @@ async def contact_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Передача номера через ввод
+@profiled(PROFILER)
 async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (update.message.text or "").strip()
 
@@ -185,6 +343,13 @@ async def auth_by_phone(update: Update, context: ContextTypes.DEFAULT_TYPE, phon
     await update.message.reply_text("Выберите действие:", reply_markup=main_menu_kb())
 
 
+# Запоминает водителя обновления для заголовка X-Client-Id. Выполняется в
+# группе -1, до обработчиков и в той же задаче, что и они
+async def remember_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user:
+        API_CLIENT.set(str(update.effective_user.id))
+
+
 # Декоратор, проверяющий, что пользователь авторизован в боте
 def ensure_auth(fn):
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -206,9 +371,10 @@ def ensure_auth(fn):
 
 
 # Проверка связи между ботом и сервером
+@profiled(PROFILER)
 async def ping(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        _ = await api_get("/slots/free_dates/", {"days": 1})
+        _ = await api_get("/")
         await update.message.reply_text("Пинг ок - бот видит API.")
     except Exception:
         logging.exception("Ping failed")
@@ -217,6 +383,7 @@ async def ping(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Обработчики меню
 @ensure_auth
+@profiled(PROFILER)
 async def on_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -234,11 +401,15 @@ async def on_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        # Список свободных дат на ближайшую неделю
-        dates = await api_get("/slots/free_dates/", {"days": 7})
+        # Список свободных дат компании водителя на ближайшую неделю
+        dates = await api_get(
+            "/slots/free_dates/", {"days": 7, "tenant": drv["tenant"]}
+        )
         if not dates:
             await q.edit_message_text(
-                "Нет свободных дат на ближайшую неделю.", reply_markup=main_menu_kb()
+                "Нет свободных дат на ближайшую неделю. Встаньте в лист ожидания - "
+                "пришлем предложение, как только освободится место.",
+                reply_markup=waitlist_kb(),
             )
             return
 
@@ -260,12 +431,16 @@ async def on_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Показать клавиатуру дат
         rows = []
-        for d in dates:
+        for item in dates:
+            d = item["date"]
             dt = datetime.fromisoformat(d)
-            caption = f"{dt.day} {MONTHS_RU[dt.month]}"
+            caption = f"{dt.day} {MONTHS_RU[dt.month]} (мест: {item['available']})"
             rows.append(
                 [InlineKeyboardButton(caption, callback_data=f"{CB_BOOK_DATE}|{d}")]
             )
+        rows.append(
+            [InlineKeyboardButton("Нет подходящей даты", callback_data=CB_WAITLIST)]
+        )
         await q.edit_message_text(
             "Выберите дату:", reply_markup=InlineKeyboardMarkup(rows)
         )
@@ -297,6 +472,50 @@ async def on_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    if cb == CB_WAITLIST:
+
+        # Встаем в очередь на неделю: освободившееся место придет сообщением
+        phone = AUTH[update.effective_user.id]
+        today = datetime.now().date()
+        try:
+            entry = await api_post(
+                "/waitlist/",
+                {
+                    "phone": phone,
+                    "date_from": str(today),
+                    "date_to": str(today + timedelta(days=7)),
+                },
+            )
+        except httpx.HTTPStatusError as e:
+            await q.edit_message_text(
+                f"Не удалось встать в лист ожидания: {e.response.text}",
+                reply_markup=main_menu_kb(),
+            )
+            return
+        await q.edit_message_text(
+            f"Вы в листе ожидания с {entry['date_from']} по {entry['date_to']}.\n"
+            "Как только освободится место, пришлем предложение - записаться "
+            "можно будет одной кнопкой.",
+            reply_markup=main_menu_kb(),
+        )
+        return
+
+    if cb == CB_CALENDAR:
+
+        # Ссылка на ленту .ics: календарь сам подтягивает новые записи и отмены
+        phone = AUTH[update.effective_user.id]
+        drv = await api_get("/drivers/by_phone/", {"phone": phone})
+        feed = await api_get(f"/drivers/{drv['id']}/calendar/")
+        await q.edit_message_text(
+            "Добавьте эту ссылку в календарь как подписку (Google Календарь: "
+            "«Другие календари» → «Добавить по URL»; iPhone: «Настройки» → "
+            "«Календарь» → «Учетные записи» → «Подписной календарь»):\n"
+            f"{feed['url']}\n\n"
+            "Записи на ТО появятся в календаре и будут обновляться сами.",
+            reply_markup=main_menu_kb(),
+        )
+        return
+
     if cb == CB_INFO:
 
         # Две уточняющие кнопки
@@ -318,11 +537,16 @@ async def on_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Выбор даты -> показываем время
 @ensure_auth
+@profiled(PROFILER)
 async def on_pick_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     _, iso_date = q.data.split("|", 1)
-    slots = await api_get("/slots/", {"date": iso_date})
+
+    # Слоты компании водителя (by_phone отдается из кэша)
+    phone = AUTH[update.effective_user.id]
+    drv = await api_get("/drivers/by_phone/", {"phone": phone})
+    slots = await api_get("/slots/", {"date": iso_date, "tenant": drv["tenant"]})
     if not slots:
         await q.edit_message_text(
             "На выбранную дату времени нет. Попробуйте другую дату.",
@@ -333,8 +557,13 @@ async def on_pick_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Кнопки времени
     rows = []
     for s in slots:
+        caption = datetime.strptime(s["time"], "%H:%M:%S").strftime("%H:%M")
+
+        # Для слотов на несколько боксов - сколько мест осталось
+        if s.get("capacity", 1) > 1:
+            caption += f" (мест: {s['available']})"
         btn = InlineKeyboardButton(
-            datetime.strptime(s["time"], "%H:%M:%S").strftime("%H:%M"),
+            caption,
             callback_data=f"{CB_BOOK_TIME}|{s['id']}",
         )
         rows.append([btn])
@@ -345,6 +574,7 @@ async def on_pick_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Выбор времени -> создаём запись (POST /appointments/)
 @ensure_auth
+@profiled(PROFILER)
 async def on_pick_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -368,7 +598,7 @@ async def on_pick_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "status": "active",
     }
     try:
-        ap = await api_post("/appointments/", payload)
+        ap = await api_post("/appointments/", payload, idempotency_key=f"book:{q.id}")
     except httpx.HTTPStatusError as e:
         await q.edit_message_text(
             f"Не удалось создать запись: {e.response.text}", reply_markup=main_menu_kb()
@@ -387,6 +617,7 @@ async def on_pick_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Отмена записи (подтверждение)
 @ensure_auth
+@profiled(PROFILER)
 async def on_cancel_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -401,6 +632,7 @@ async def on_cancel_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Отмена
 @ensure_auth
+@profiled(PROFILER)
 async def on_cancel_yes_no(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -411,7 +643,9 @@ async def on_cancel_yes_no(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # POST /appointments/{id}/cancel_user/
     try:
-        await api_post(f"/appointments/{ap_id}/cancel_user/", {})
+        await api_post(
+            f"/appointments/{ap_id}/cancel_user/", {}, idempotency_key=f"cancel:{q.id}"
+        )
     except httpx.HTTPStatusError as e:
         await q.edit_message_text(
             f"Не удалось отменить: {e.response.text}", reply_markup=main_menu_kb()
@@ -422,6 +656,7 @@ async def on_cancel_yes_no(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Информация о ТО
 @ensure_auth
+@profiled(PROFILER)
 async def on_info_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     try:
@@ -455,17 +690,75 @@ async def on_info_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Справка о доступных командах бота
+@profiled(PROFILER)
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Команды: /start - авторизация; меню - через кнопки ниже."
     )
 
 
+# Ответ на предложение места из листа ожидания
+@ensure_auth
+@profiled(PROFILER)
+async def on_waitlist_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    action, offer_id = q.data.split("|", 1)
+    payload = {"phone": AUTH[update.effective_user.id]}
+    try:
+        if action == CB_WL_SKIP:
+            await api_post(f"/waitlist-offers/{offer_id}/decline/", payload)
+            await q.edit_message_text(
+                "Хорошо, пришлем следующее освободившееся место.",
+                reply_markup=main_menu_kb(),
+            )
+            return
+        ap = await api_post(
+            f"/waitlist-offers/{offer_id}/accept/",
+            payload,
+            idempotency_key=f"waitlist:{q.id}",
+        )
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 409:
+            text = "Это место уже заняли. Вы остаетесь в листе ожидания."
+        elif e.response.status_code == 410:
+            text = "Предложение больше не действует."
+        else:
+            text = f"Не удалось записаться: {e.response.text}"
+        await q.edit_message_text(text, reply_markup=main_menu_kb())
+        return
+
+    slot = ap["slot"]
+    await q.edit_message_text(
+        f"Отлично! Вы записаны на ТО {slot['date']} {slot['time'][:5]}.\n"
+        f"Номер записи: #{ap['id']}.",
+        reply_markup=main_menu_kb(),
+    )
+
+
 # Главная функция
 def main():
     if not BOT_TOKEN:
         raise RuntimeError("Не задан TELEGRAM_BOT_TOKEN")
-    app = Application.builder().token(BOT_TOKEN).build()
+
+    # Обновления разных водителей обрабатываются параллельно,
+    # одного водителя - строго по порядку
+    processor = PerUserUpdateProcessor(
+        BOT_CONCURRENCY, BOT_MAX_PENDING, log_interval=BOT_STATS_INTERVAL
+    )
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .concurrent_updates(processor)
+        .post_init(open_api)
+        .post_shutdown(close_api)
+        .build()
+    )
+
+    # Водитель обновления - для лимитов частоты API
+    app.add_handler(TypeHandler(Update, remember_client), group=-1)
 
     # Команды
     app.add_handler(CommandHandler("start", start))
@@ -477,7 +770,11 @@ def main():
 
     # Кнопки главного меню
     app.add_handler(
-        CallbackQueryHandler(on_menu, pattern=f"^{CB_BOOK}$|^{CB_CANCEL}$|^{CB_INFO}$")
+        CallbackQueryHandler(
+            on_menu,
+            pattern=f"^{CB_BOOK}$|^{CB_CANCEL}$|^{CB_INFO}$|^{CB_WAITLIST}$"
+            f"|^{CB_CALENDAR}$",
+        )
     )
 
     # Последовательности бронирования
@@ -498,6 +795,13 @@ def main():
     # Инфо
     app.add_handler(CallbackQueryHandler(on_info_pick, pattern=f"^{CB_INFO_PICK}\|"))
 
+    # Лист ожидания: ответ на предложение места
+    app.add_handler(
+        CallbackQueryHandler(
+            on_waitlist_offer, pattern=f"^{CB_WL_TAKE}\||^{CB_WL_SKIP}\|"
+        )
+    )
+
     # Проверка "жив" сервер или нет
     app.add_handler(CommandHandler("ping", ping))
     app.run_polling(allowed_updates=Update.ALL_TYPES)
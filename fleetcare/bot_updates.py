@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+# Параллельная обработка обновлений бота с сохранением порядка для каждого пользователя.
+# Обновления разных водителей идут одновременно (не более max_concurrent_updates),
+# обновления одного водителя - строго по очереди, в порядке поступления
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        max_pending: int = 1024,
+        log_interval: float = 0,
+    ):
+
+        # Семафор базового класса ограничивает число принятых обновлений
+        # (в работе + в очереди), свой - число одновременно выполняемых
+        super().__init__(max(max_pending, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._user_locks = {}  # user_id -> [lock, число ожидающих+выполняемых]
+        self._log_interval = log_interval
+        self._log_task = None
+        self._stats = {
+            "processed": 0,
+            "in_flight": 0,
+            "waiting_user": 0,
+            "waiting_worker": 0,
+            "max_user_queue": 0,
+            "max_wait_ms": 0.0,
+        }
+
+    @staticmethod
+    def user_key(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.user_key(update)
+        started = time.perf_counter()
+        if key is None:
+            await self._run(coroutine, started)
+            return
+
+        entry = self._user_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        self._stats["max_user_queue"] = max(self._stats["max_user_queue"], entry[1])
+        self._stats["waiting_user"] += 1
+        try:
+            async with entry[0]:
+                self._stats["waiting_user"] -= 1
+                await self._run(coroutine, started)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[key]
+
+    async def _run(self, coroutine, started):
+        self._stats["waiting_worker"] += 1
+        async with self._running:
+            self._stats["waiting_worker"] -= 1
+            self._record_wait(started)
+            self._stats["in_flight"] += 1
+            try:
+                await coroutine
+            finally:
+                self._stats["in_flight"] -= 1
+                self._stats["processed"] += 1
+
+    def _record_wait(self, started):
+        wait_ms = (time.perf_counter() - started) * 1000
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], wait_ms)
+
+    # Метрики очередей (backpressure)
+    def stats(self):
+        return {**self._stats, "active_users": len(self._user_locks)}
+
+    async def _log_stats(self):
+        while True:
+            await asyncio.sleep(self._log_interval)
+            logging.info("Update processor stats: %s", self.stats())
+
+    async def initialize(self):
+        if self._log_interval > 0:
+            self._log_task = asyncio.create_task(self._log_stats())
+
+    async def shutdown(self):
+        if self._log_task:
+            self._log_task.cancel()
+            self._log_task = None
+        logging.info("Update processor stats: %s", self.stats())
@@ -1,20 +1,61 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html
 from .models import (
     Automobile,
+    Broadcast,
+    DailyUtilization,
     Driver,
     Slot,
     Appointment,
+    AppointmentHistory,
     Notification,
+    NotificationArchive,
     AppointmentStatus,
+    ServiceRecord,
     SlotStatus,
+    Tenant,
+    WaitlistEntry,
+    WaitlistOffer,
 )
-from .forms import SlotBulkForm, DriverAdminForm
+from .forms import SlotBulkForm, DriverAdminForm, BroadcastForm, ServiceCompleteForm
+from .search import TrigramSearchMixin
+from .api_cache import invalidate_slots
+from .board import board_snapshot
+from .broadcast import start_broadcast
+from .rollups import COUNTERS, rebuild_days
+from .service import complete_appointment
+from .tenants import TenantAdminMixin, user_tenant_ids
+
+# Главная страница: сводка по записям и уведомлениям над списком разделов
+admin.site.index_template = "admin/core/index.html"
+
+
+# Компании-клиенты и их менеджеры (менеджер видит только свои компании)
+@admin.register(Tenant)
+class TenantAdmin(admin.ModelAdmin):
+    list_display = ("name", "slug", "created_at")
+    search_fields = ("name", "slug")
+    prepopulated_fields = {"slug": ("name",)}
+    filter_horizontal = ("managers",)
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        tenant_ids = user_tenant_ids(request)
+        return qs if tenant_ids is None else qs.filter(pk__in=tenant_ids)
 
 
 # Авто
 @admin.register(Automobile)
-class AutomobileAdmin(admin.ModelAdmin):
+class AutomobileAdmin(TenantAdminMixin, admin.ModelAdmin):
     list_display = (
         "plate_number",
         "make",
@@ -27,7 +68,7 @@ class AutomobileAdmin(admin.ModelAdmin):
     list_filter = ("make",)
     readonly_fields = ("next_service_mileage",)
     fieldsets = (
-        ("Основное", {"fields": ("plate_number", "make", "model")}),
+        ("Основное", {"fields": ("tenant", "plate_number", "make", "model")}),
         (
             "ТО",
             {
@@ -43,38 +84,96 @@ class AutomobileAdmin(admin.ModelAdmin):
 
 # Водитель
 @admin.register(Driver)
-class DriverAdmin(admin.ModelAdmin):
+class DriverAdmin(TenantAdminMixin, TrigramSearchMixin, admin.ModelAdmin):
 
     # Форма с фильтрацией свободных авто
     form = DriverAdminForm
     list_display = ("last_name", "first_name", "phone", "car")
+    list_filter = ("car__make",)
     search_fields = ("last_name", "first_name", "phone", "car__plate_number")
+    actions = ["broadcast"]
+
+    @admin.action(description="Отправить сообщение выбранным водителям")
+    def broadcast(self, request, queryset):
+
+        # Сначала страница с текстом сообщения, после подтверждения - рассылка
+        form = BroadcastForm(request.POST if "confirm" in request.POST else None)
+        if form.is_valid():
+            item = start_broadcast(form.cleaned_data["text"], queryset)
+            self.message_user(request, f"Рассылка запущена: {item.total} получателей")
+            return redirect("admin:core_broadcast_change", item.pk)
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Рассылка водителям",
+            "opts": self.model._meta,
+            "form": form,
+            "recipients_count": queryset.exclude(chat_id=None).count(),
+            "select_across": request.POST.get("select_across") == "1",
+            "selected": request.POST.getlist(ACTION_CHECKBOX_NAME),
+            "action_checkbox_name": ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, "admin/core/driver/broadcast.html", context)
 
 
 # Слот
 @admin.register(Slot)
-class SlotAdmin(admin.ModelAdmin):
+class SlotAdmin(TenantAdminMixin, admin.ModelAdmin):
 
     # Поддержка множественного создания слотов через поле bulk_times
     form = SlotBulkForm
-    list_display = ("date", "time", "status")
+    list_display = ("date", "time", "status", "places")
     list_filter = ("status", "date")
     search_fields = ("date", "time")
     actions = ["mark_free", "mark_busy"]
 
+    def places(self, obj):
+        return f"{obj.available} / {obj.capacity}"
+
+    places.short_description = "Свободно мест"
+
     @admin.action(description="Пометить выбранные слоты как свободные")
     def mark_free(self, request, queryset):
-        queryset.update(status=SlotStatus.FREE)
+
+        # Свободно столько мест, сколько не занято активными записями
+        active = (
+            Appointment.objects.filter(
+                slot=OuterRef("pk"), status=AppointmentStatus.ACTIVE
+            )
+            .order_by()
+            .values("slot")
+            .annotate(n=Count("pk"))
+            .values("n")
+        )
+        queryset.update(
+            status=SlotStatus.FREE,
+            available=Greatest(F("capacity") - Coalesce(Subquery(active), 0), 0),
+        )
+        queryset.filter(available=0).update(status=SlotStatus.BUSY)
+        self.slots_changed(queryset)
 
     @admin.action(description="Пометить выбранные слоты как занятые")
     def mark_busy(self, request, queryset):
-        queryset.update(status=SlotStatus.BUSY)
+        queryset.update(status=SlotStatus.BUSY, available=0)
+        self.slots_changed(queryset)
+
+    # update() не вызывает сигналы: кэш слотов компаний и сводки дней - явно
+    def slots_changed(self, queryset):
+        tenants = queryset.order_by().values_list("tenant", flat=True).distinct()
+        invalidate_slots(*tenants)
+        rebuild_days(queryset.values_list("date", flat=True).distinct())
 
 
 # Запись
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
-    list_display = ("slot_date", "slot_time", "driver", "car", "status_badge")
+class AppointmentAdmin(TenantAdminMixin, TrigramSearchMixin, admin.ModelAdmin):
+    list_display = (
+        "slot_date",
+        "slot_time",
+        "driver",
+        "car",
+        "status_badge",
+        "complete_link",
+    )
     list_filter = ("status", "slot__date")
     search_fields = ("driver__last_name", "driver__first_name", "car__plate_number")
     autocomplete_fields = ("slot", "driver", "car")
@@ -95,6 +194,7 @@ class AppointmentAdmin(admin.ModelAdmin):
             "active": "green",
             "cancelled_manager": "tomato",
             "cancelled_user": "gray",
+            "completed": "steelblue",
         }.get(obj.status, "black")
         return format_html(
             '<b style="color:{}">{}</b>', color, obj.get_status_display()
@@ -102,23 +202,282 @@ class AppointmentAdmin(admin.ModelAdmin):
 
     status_badge.short_description = "Статус"
 
+    def complete_link(self, obj):
+        if obj.status != AppointmentStatus.ACTIVE:
+            return ""
+        return format_html(
+            '<a href="{}">Завершить</a>',
+            reverse("admin:core_appointment_complete", args=[obj.pk]),
+        )
+
+    complete_link.short_description = "ТО"
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:object_id>/complete/",
+                self.admin_site.admin_view(self.complete_view),
+                name="core_appointment_complete",
+            ),
+            path(
+                "today/",
+                self.admin_site.admin_view(self.board_view),
+                name="core_appointment_board",
+            ),
+        ] + super().get_urls()
+
+    # Табло на сегодня: снимок дня, дальше изменения по событиям (core/board.py)
+    def board_view(self, request):
+        if not self.has_view_permission(request):
+            return redirect("admin:index")
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Записи на сегодня",
+            "opts": self.model._meta,
+            "snapshot": board_snapshot(timezone.localdate(), user_tenant_ids(request)),
+            "events_url": reverse("board_events") if settings.ASYNC_API else None,
+        }
+        return TemplateResponse(request, "admin/core/appointment/board.html", context)
+
+    # Завершение записи: запись истории ТО и пробег автомобиля одной транзакцией
+    def complete_view(self, request, object_id):
+        appointment = get_object_or_404(
+            self.get_queryset(request).select_related("slot", "driver", "car"),
+            pk=object_id,
+        )
+        if not self.has_change_permission(request, appointment):
+            return redirect("admin:core_appointment_changelist")
+        form = ServiceCompleteForm(
+            request.POST or None,
+            initial={
+                "date": appointment.slot.date,
+                "mileage": appointment.car.last_service_mileage,
+            },
+        )
+        if form.is_valid():
+            try:
+                record = complete_appointment(appointment.pk, **form.cleaned_data)
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                self.message_user(
+                    request, f"ТО выполнено: {record.car}, {record.mileage} км"
+                )
+                return redirect("admin:core_appointment_changelist")
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Завершение записи на ТО",
+            "opts": self.model._meta,
+            "original": appointment,
+            "form": form,
+        }
+        return TemplateResponse(
+            request, "admin/core/appointment/complete.html", context
+        )
+
     @admin.action(description="Отменить выбранные записи менеджером")
     def cancel_by_manager(self, request, queryset):
 
-        # Массовая отмена с уведомлением
-        for ap in queryset.select_related("slot", "driver"):
+        # Массовая отмена с уведомлением; выполненные и отмененные не меняются
+        active = queryset.filter(status=AppointmentStatus.ACTIVE)
+        cancelled = 0
+        for ap in active.select_related("slot", "driver"):
             ap.status = AppointmentStatus.CANCELLED_MANAGER
             ap.save()
+            cancelled += 1
+        self.message_user(request, f"Отменено записей: {cancelled}")
 
 
 # Уведомление
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
-    list_display = ("created_at", "driver", "short_text")
-    list_filter = ("created_at",)
+class NotificationAdmin(TenantAdminMixin, TrigramSearchMixin, admin.ModelAdmin):
+    list_display = ("created_at", "driver", "short_text", "delivered")
+    list_filter = ("created_at", "delivered")
     search_fields = ("driver__last_name", "driver__first_name", "text")
+    list_select_related = ("driver",)
+
+    # Без COUNT(*) по всему журналу на каждой странице
+    show_full_result_count = False
+
+    def short_text(self, obj):
+        return (obj.text or "")[:60]
+
+    short_text.short_description = "Текст"
+
+
+# Архив уведомлений (только просмотр)
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(TenantAdminMixin, admin.ModelAdmin):
+    list_display = ("created_at", "driver", "short_text", "delivered", "archived_at")
+    list_filter = ("delivered",)
+    list_select_related = ("driver",)
+    raw_id_fields = ("driver", "broadcast")
+    show_full_result_count = False
+
+    def short_text(self, obj):
+        return (obj.text or "")[:60]
+
+    short_text.short_description = "Текст"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# Рассылки (создаются действием в списке водителей, здесь - прогресс)
+@admin.register(Broadcast)
+class BroadcastAdmin(TenantAdminMixin, admin.ModelAdmin):
+    list_display = ("created_at", "short_text", "status", "progress", "sent", "failed")
+    list_filter = ("status",)
+    readonly_fields = (
+        "text",
+        "status",
+        "progress",
+        "total",
+        "sent",
+        "failed",
+        "created_at",
+        "finished_at",
+    )
 
     def short_text(self, obj):
         return (obj.text or "")[:60]
 
     short_text.short_description = "Текст"
+
+    def progress(self, obj):
+        done = obj.sent + obj.failed
+        percent = round(done * 100 / obj.total) if obj.total else 100
+        return format_html(
+            '<progress value="{}" max="100"></progress> {} / {}',
+            percent,
+            done,
+            obj.total,
+        )
+
+    progress.short_description = "Прогресс"
+
+    def has_add_permission(self, request):
+        return False
+
+
+# Дашборд загрузки: читает только дневные сводки, итоги - по выбранному периоду
+@admin.register(DailyUtilization)
+class DailyUtilizationAdmin(TenantAdminMixin, admin.ModelAdmin):
+    list_display = (
+        "day",
+        "booked",
+        "cancelled_user",
+        "cancelled_manager",
+        "free",
+        "utilization_bar",
+    )
+    date_hierarchy = "day"
+    list_per_page = 62
+
+    def utilization_bar(self, obj):
+        value = obj.utilization
+        if value is None:
+            return "—"
+        return format_html(
+            '<progress value="{}" max="100"></progress> {}%',
+            round(value * 100),
+            round(value * 100),
+        )
+
+    utilization_bar.short_description = "Загрузка"
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        cl = getattr(response, "context_data", {}).get("cl")
+        if cl is not None:
+            totals = cl.queryset.aggregate(**{c: Sum(c) for c in COUNTERS})
+            totals = {k: v or 0 for k, v in totals.items()}
+            total = totals["booked"] + totals["free"]
+            totals["utilization"] = (
+                round(totals["booked"] * 100 / total) if total else None
+            )
+            response.context_data["totals"] = totals
+        return response
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# История ТО (создается завершением записи, можно внести и вручную)
+@admin.register(ServiceRecord)
+class ServiceRecordAdmin(TenantAdminMixin, admin.ModelAdmin):
+    list_display = ("date", "car", "mileage", "short_work")
+    list_select_related = ("car",)
+    search_fields = ("car__plate_number",)
+    date_hierarchy = "date"
+    autocomplete_fields = ("car",)
+    raw_id_fields = ("appointment",)
+    show_full_result_count = False
+
+    def short_work(self, obj):
+        return (obj.work_done or "")[:60]
+
+    short_work.short_description = "Работы"
+
+
+# Вся история записей (рабочие + архивные), только просмотр
+@admin.register(AppointmentHistory)
+class AppointmentHistoryAdmin(TenantAdminMixin, admin.ModelAdmin):
+    list_display = ("slot_date", "slot_time", "driver", "car", "status", "archived")
+    list_filter = ("archived", "status")
+    list_select_related = ("slot", "driver", "car")
+    search_fields = ("driver__last_name", "car__plate_number")
+    date_hierarchy = "slot__date"
+    show_full_result_count = False
+
+    def slot_date(self, obj):
+        return obj.slot.date
+
+    slot_date.short_description = "Дата"
+
+    def slot_time(self, obj):
+        return obj.slot.time
+
+    slot_time.short_description = "Время"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# Лист ожидания: очередь и выданные предложения мест
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(TenantAdminMixin, admin.ModelAdmin):
+    list_display = ("driver", "date_from", "date_to", "status", "created_at")
+    list_filter = ("status",)
+    list_select_related = ("driver",)
+    search_fields = ("driver__last_name", "driver__phone")
+    autocomplete_fields = ("driver",)
+
+
+@admin.register(WaitlistOffer)
+class WaitlistOfferAdmin(TenantAdminMixin, admin.ModelAdmin):
+    tenant_field = "entry__tenant"
+    list_display = ("slot", "entry", "status", "created_at", "expires_at")
+    list_filter = ("status",)
+    list_select_related = ("slot", "entry__driver")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
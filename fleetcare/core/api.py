@@ -1,15 +1,58 @@
-from rest_framework import viewsets, routers, mixins
+from rest_framework import viewsets, routers, mixins, permissions
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from datetime import date, timedelta
-from .models import Automobile, Driver, Slot, Appointment, SlotStatus, AppointmentStatus
+from django.conf import settings
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from .models import (
+    Automobile,
+    Driver,
+    Slot,
+    Appointment,
+    DailyUtilization,
+    SlotStatus,
+    AppointmentStatus,
+)
 import re
+from .api_cache import cached, driver_ns, slots_ns
+from .ical import driver_feed_path
+from .idempotency import (
+    HEADER as IDEMPOTENCY_HEADER,
+    REPLAYED_HEADER,
+    idempotent,
+    request_client,
+)
+from .rollups import COUNTERS
+from .search import SEARCH_MIN_LENGTH, search_automobiles, search_drivers
 from .serializers import (
     AutomobileSerializer,
     DriverSerializer,
     SlotSerializer,
     AppointmentSerializer,
+    WaitlistEntrySerializer,
+    DRIVER_FAST,
+    SLOT_FAST,
 )
+from .service import history_page, parse_page_key
+from .tenants import tenant_param, user_tenant_ids
+from .throttling import is_bot
+from . import waitlist
+
+
+# Бот (X-Bot-Token) или сотрудник сервиса, вошедший в админку
+# (объекты - только своих компаний)
+class IsBotOrStaff(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return is_bot(request) or bool(request.user and request.user.is_staff)
+
+    def has_object_permission(self, request, view, obj):
+        if is_bot(request):
+            return True
+        tenant_ids = user_tenant_ids(request)
+        return tenant_ids is None or obj.tenant_id in tenant_ids
 
 
 # CRUD над машинами
@@ -23,6 +66,15 @@ class DriverViewSet(viewsets.ModelViewSet):
     queryset = Driver.objects.select_related("car")
     serializer_class = DriverSerializer
 
+    # GET /api/drivers/?tenant=<id> - водители компании
+    def get_queryset(self):
+        try:
+            tenant = tenant_param(self.request.query_params)
+        except ValueError:
+            raise ValidationError({"tenant": "must be an integer"})
+        qs = super().get_queryset()
+        return qs if tenant is None else qs.for_tenant(tenant)
+
     @action(detail=False, methods=["get"])
     def by_phone(self, request):
         phone = (request.query_params.get("phone") or "").strip()
@@ -32,12 +84,56 @@ class DriverViewSet(viewsets.ModelViewSet):
         # Нормализуем: оставляем только цифры
         norm = re.sub(r"\D+", "", phone)
 
-        # Обходим водителей и сравниваем нормализованные номера
-        for d in Driver.objects.select_related("car").all():
-            db_norm = re.sub(r"\D+", "", d.phone or "")
-            if db_norm == norm:
-                return Response(DriverSerializer(d).data)
-        return Response({"detail": "not found"}, status=404)
+        def build():
+
+            # Обходим водителей и сравниваем нормализованные номера
+            for pk, db_phone in Driver.objects.values_list("id", "phone"):
+                db_norm = re.sub(r"\D+", "", db_phone or "")
+                if db_norm == norm:
+                    return 200, DRIVER_FAST.rows(Driver.objects.filter(pk=pk))[0]
+            return 404, {"detail": "not found"}
+
+        status, data = cached("by_phone", [driver_ns(norm)], norm, build)
+        return Response(data, status=status)
+
+    # GET /api/drivers/{id}/calendar/ - ссылка на ленту .ics с записями водителя.
+    # Ссылка подписана и открывает ленту без входа, поэтому выдается только
+    # боту и сотрудникам
+    @action(
+        detail=True,
+        methods=["get"],
+        authentication_classes=[SessionAuthentication],
+        permission_classes=[IsBotOrStaff],
+    )
+    def calendar(self, request, pk=None):
+        driver = self.get_object()
+        path = driver_feed_path(driver.pk)
+        if settings.PUBLIC_URL:
+            return Response({"url": settings.PUBLIC_URL + path})
+        return Response({"url": request.build_absolute_uri(path)})
+
+
+# Свободные места компании по датам: (date, available)
+def free_dates_qs(tenant_id, since, until):
+    return (
+        Slot.objects.for_tenant(tenant_id)
+        .filter(status=SlotStatus.FREE, date__gte=since, date__lte=until)
+        .values("date")
+        .annotate(places=Sum("available"))
+        .order_by("date")
+        .values_list("date", "places")
+    )
+
+
+# Компания из ?tenant= - обязательна для слотов (у каждой компании свои)
+def required_tenant(request):
+    try:
+        tenant = tenant_param(request.query_params)
+    except ValueError:
+        tenant = None
+    if tenant is None:
+        raise ValidationError({"tenant": ["tenant required"]})
+    return tenant
 
 
 # CRUD над слотами
@@ -47,30 +143,86 @@ class SlotViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
 
     def list(self, request, *args, **kwargs):
 
-        # GET /api/slots?date=YYYY-MM-DD - свободные на дату (если не указана, то все свободные)
+        # GET /api/slots?tenant=<id>&date=YYYY-MM-DD - свободные слоты компании
+        # на дату (если не указана, то все свободные)
+        tenant = required_tenant(request)
         want_date = request.query_params.get("date")
-        qs = self.get_queryset().filter(status=SlotStatus.FREE)
-        if want_date:
-            qs = qs.filter(date=want_date)
-        qs = qs.order_by("date", "time")
-        return Response(self.get_serializer(qs, many=True).data)
+
+        def build():
+            qs = self.get_queryset().for_tenant(tenant).filter(status=SlotStatus.FREE)
+            if want_date:
+                qs = qs.filter(date=want_date)
+            qs = qs.order_by("date", "time")
+            return 200, SLOT_FAST.rows(qs)
+
+        status, data = cached("slots", [slots_ns(tenant)], (tenant, want_date), build)
+        return Response(data, status=status)
 
     @action(detail=False, methods=["get"])
     def free_dates(self, request):
 
-        # GET /api/slots/free_dates?days=7 - свободные даты (агрегировано), по умолчанию 7 дней
+        # GET /api/slots/free_dates?tenant=<id>&days=7 - свободные даты компании
+        # и число свободных мест (агрегировано), по умолчанию 7 дней
+        tenant = required_tenant(request)
         days = int(request.query_params.get("days", "7"))
         today = date.today()
         until = today + timedelta(days=days)
-        qs = (
-            Slot.objects.filter(
-                status=SlotStatus.FREE, date__gte=today, date__lte=until
-            )
-            .values_list("date", flat=True)
-            .distinct()
-            .order_by("date")
+
+        def build():
+            return 200, [
+                {"date": str(d), "available": available}
+                for d, available in free_dates_qs(tenant, today, until)
+            ]
+
+        status, data = cached(
+            "free_dates", [slots_ns(tenant)], (tenant, today, until), build
         )
-        return Response([str(d) for d in qs])
+        return Response(data, status=status)
+
+
+# Запись и отмена: (status, data), ошибки - кодом ответа, а не исключением,
+# чтобы ответ можно было сохранить для повторов по Idempotency-Key
+def create_appointment(payload):
+    serializer = AppointmentSerializer(data=payload)
+    if not serializer.is_valid():
+        return 400, serializer.errors
+    try:
+        serializer.save()
+    except ValidationError as e:
+        return 400, e.detail
+    return 201, serializer.data
+
+
+def cancel_appointment(pk):
+    ap = (
+        Appointment.objects.select_related("slot", "driver", "car")
+        .filter(pk=pk)
+        .first()
+    )
+    if ap is None:
+        return 404, {"detail": "No Appointment matches the given query."}
+
+    # Выполненную или уже отмененную запись не отменить
+    if ap.status != AppointmentStatus.ACTIVE:
+        return 409, {"detail": "appointment is not active", "status": ap.status}
+    ap.status = AppointmentStatus.CANCELLED_USER
+    ap.save()
+    return 200, AppointmentSerializer(ap).data
+
+
+# Ответ с пометкой, что он повторен из сохраненного по Idempotency-Key
+def idempotent_response(request, scope, payload, handler):
+    status, data, replayed = idempotent(
+        request.headers.get(IDEMPOTENCY_HEADER),
+        scope,
+        payload,
+        handler,
+        client=request_client(request),
+    )
+    response = Response(data, status=status)
+    if replayed:
+        response[REPLAYED_HEADER] = "true"
+    return response
 
 
 # CRUD над записями
@@ -90,35 +242,195 @@ class AppointmentViewSet(
         phone = request.query_params.get("phone")
         if not phone:
             return Response({"detail": "phone required"}, status=400)
+
+        def build():
+            try:
+                d = Driver.objects.get(phone=phone)
+            except Driver.DoesNotExist:
+                return 404, {"detail": "driver not found"}
+            qs = (
+                Appointment.objects.filter(driver=d, status=AppointmentStatus.ACTIVE)
+                .order_by("slot__date", "slot__time")
+                .values_list("id", "slot__date", "slot__time", "car__plate_number")
+            )
+            data = [
+                {
+                    "id": ap_id,
+                    "date": str(ap_date),
+                    "time": ap_time.strftime("%H:%M"),
+                    "car_plate": plate,
+                }
+                for ap_id, ap_date, ap_time, plate in qs
+            ]
+            return 200, data
+
+        status, data = cached("active_by_phone", [driver_ns(phone)], phone, build)
+        return Response(data, status=status)
+
+    # POST /api/appointments/ (повтор с тем же Idempotency-Key не создает дубль)
+    def create(self, request, *args, **kwargs):
+        payload = request.data
+        return idempotent_response(
+            request,
+            "appointments.create",
+            payload,
+            lambda: create_appointment(payload),
+        )
+
+    @action(detail=True, methods=["post"])
+    def cancel_user(self, request, pk=None):
+
+        # POST /api/appointments/{id}/cancel_user/
+        return idempotent_response(
+            request,
+            f"appointments.cancel_user:{pk}",
+            None,
+            lambda: cancel_appointment(pk),
+        )
+
+
+# Нечеткий поиск по госномеру и водителям
+class SearchViewSet(viewsets.ViewSet):
+    def list(self, request):
+
+        # GET /api/search/?q=А123&tenant=<id> - автомобили и водители, похожие
+        # на запрос (tenant - необязательно)
+        q = (request.query_params.get("q") or "").strip()
+        if len(q) < SEARCH_MIN_LENGTH:
+            return Response(
+                {"detail": f"q must be at least {SEARCH_MIN_LENGTH} characters"},
+                status=400,
+            )
         try:
-            d = Driver.objects.get(phone=phone)
-        except Driver.DoesNotExist:
-            return Response({"detail": "driver not found"}, status=404)
-        qs = (
-            self.get_queryset()
-            .filter(driver=d, status=AppointmentStatus.ACTIVE)
-            .order_by("slot__date", "slot__time")
+            tenant = tenant_param(request.query_params)
+        except ValueError:
+            return Response({"detail": "tenant must be an integer"}, status=400)
+        return Response(
+            {
+                "automobiles": search_automobiles(q, tenant=tenant),
+                "drivers": search_drivers(q, tenant=tenant),
+            }
         )
+
+
+# Загрузка сервиса по дням/месяцам - только из дневных сводок, O(дней)
+class UtilizationViewSet(viewsets.ViewSet):
+    def list(self, request):
+
+        # GET /api/utilization/?since=YYYY-MM-DD&until=YYYY-MM-DD&group=day|month
+        # &tenant=<id>; по умолчанию - последние 30 дней по дням, все компании
+        try:
+            tenant = tenant_param(request.query_params)
+        except ValueError:
+            return Response({"detail": "tenant must be an integer"}, status=400)
+        try:
+            until = date.fromisoformat(request.query_params.get("until") or "")
+        except ValueError:
+            until = date.today()
+        try:
+            since = date.fromisoformat(request.query_params.get("since") or "")
+        except ValueError:
+            since = until - timedelta(days=30)
+        group = request.query_params.get("group", "day")
+        if group not in ("day", "month"):
+            return Response({"detail": "group must be day or month"}, status=400)
+
+        qs = DailyUtilization.objects.filter(day__gte=since, day__lte=until)
+        if tenant is not None:
+            qs = qs.for_tenant(tenant)
+        if group == "month":
+            qs = qs.annotate(period=TruncMonth("day")).values("period")
+        else:
+            qs = qs.annotate(period=F("day")).values("period")
+        qs = qs.annotate(**{c: Sum(c) for c in COUNTERS}).order_by("period")
         data = []
-        for ap in qs:
+        for row in qs:
+            total = row["booked"] + row["free"]
             data.append(
                 {
-                    "id": ap.id,
-                    "date": str(ap.slot.date),
-                    "time": ap.slot.time.strftime("%H:%M"),
-                    "car_plate": ap.car.plate_number,
+                    **row,
+                    "period": str(row["period"]),
+                    "utilization": round(row["booked"] / total, 4) if total else None,
                 }
             )
         return Response(data)
 
+
+# История ТО: последние ТО автомобиля или всего автопарка, постранично по ключу
+class ServiceRecordViewSet(viewsets.ViewSet):
+    max_limit = 100
+
+    def list(self, request):
+
+        # GET /api/service-records/?car=<id>&tenant=<id>&limit=N&before=<ключ
+        # из "next">
+        params = request.query_params
+        try:
+            car_id = int(params["car"]) if params.get("car") else None
+            tenant = tenant_param(params)
+            limit = min(int(params.get("limit") or 20), self.max_limit)
+            before = parse_page_key(params["before"]) if params.get("before") else None
+        except ValueError:
+            return Response(
+                {"detail": "invalid car, tenant, limit or before"}, status=400
+            )
+        if limit < 1:
+            return Response({"detail": "limit must be positive"}, status=400)
+        rows, next_key = history_page(limit, car_id, before, tenant)
+        return Response({"results": rows, "next": next_key})
+
+
+# Лист ожидания: водитель (по телефону, как в остальных endpoints бота)
+# встает в очередь на дату или диапазон дат
+class WaitlistViewSet(viewsets.ViewSet):
+    def create(self, request):
+
+        # POST /api/waitlist/ {"phone", "date_from", "date_to"} (date_to - необязательно)
+        driver = Driver.objects.filter(phone=request.data.get("phone") or "").first()
+        if driver is None:
+            return Response({"detail": "driver not found"}, status=404)
+        try:
+            date_from = date.fromisoformat(request.data.get("date_from") or "")
+            date_to = date.fromisoformat(request.data.get("date_to") or str(date_from))
+        except ValueError:
+            return Response({"detail": "dates must be YYYY-MM-DD"}, status=400)
+        if date_to < date_from or date_to < date.today():
+            return Response({"detail": "invalid date range"}, status=400)
+        entry, created = waitlist.join(driver, max(date_from, date.today()), date_to)
+        return Response(
+            WaitlistEntrySerializer(entry).data, status=201 if created else 200
+        )
+
+    @action(detail=False, methods=["post"])
+    def leave(self, request):
+
+        # POST /api/waitlist/leave/ {"phone"}
+        driver = Driver.objects.filter(phone=request.data.get("phone") or "").first()
+        if driver is None:
+            return Response({"detail": "driver not found"}, status=404)
+        return Response({"left": waitlist.leave(driver)})
+
+
+# Ответ на предложение места из листа ожидания
+class WaitlistOfferViewSet(viewsets.ViewSet):
     @action(detail=True, methods=["post"])
-    def cancel_user(self, request, pk=None):
+    def accept(self, request, pk=None):
 
-        # POST /api/appointments/{id}/cancel_user/
-        ap = self.get_object()
-        ap.status = AppointmentStatus.CANCELLED_USER
-        ap.save()
-        return Response(self.get_serializer(ap).data)
+        # POST /api/waitlist-offers/{id}/accept/ {"phone"} - запись в одно нажатие
+        phone = request.data.get("phone") or ""
+        return idempotent_response(
+            request,
+            f"waitlist.accept:{pk}",
+            {"phone": phone},
+            lambda: waitlist.accept_offer(pk, phone),
+        )
+
+    @action(detail=True, methods=["post"])
+    def decline(self, request, pk=None):
+
+        # POST /api/waitlist-offers/{id}/decline/ {"phone"}
+        status, data = waitlist.decline_offer(pk, request.data.get("phone") or "")
+        return Response(data, status=status)
 
 
 # Регистрация классов
@@ -127,3 +439,8 @@ router.register(r"automobiles", AutomobileViewSet, basename="automobiles")
 router.register(r"drivers", DriverViewSet, basename="drivers")
 router.register(r"slots", SlotViewSet, basename="slots")
 router.register(r"appointments", AppointmentViewSet, basename="appointments")
+router.register(r"search", SearchViewSet, basename="search")
+router.register(r"utilization", UtilizationViewSet, basename="utilization")
+router.register(r"service-records", ServiceRecordViewSet, basename="service-records")
+router.register(r"waitlist", WaitlistViewSet, basename="waitlist")
+router.register(r"waitlist-offers", WaitlistOfferViewSet, basename="waitlist-offers")
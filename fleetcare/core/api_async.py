@@ -0,0 +1,216 @@
+import functools
+import json
+import re
+from datetime import date, timedelta
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.urls import path
+from rest_framework.exceptions import Throttled
+from . import throttling
+from .api import cancel_appointment, create_appointment, free_dates_qs
+from .api_cache import acached, driver_ns, slots_ns
+from .idempotency import HEADER, REPLAYED_HEADER, idempotent, request_client
+from .models import Appointment, AppointmentStatus, Driver, Slot, SlotStatus
+from .renderers import MsgpackRenderer, ORJSONRenderer, msgpack
+from .serializers import DRIVER_FAST, SLOT_FAST
+from .tenants import tenant_param
+
+# Асинхронные версии endpoints бота для запуска под ASGI (ASYNC_API=1).
+# Пути и формат ответов те же, что у DRF-версий в api.py
+
+_json = ORJSONRenderer()
+_msgpack = MsgpackRenderer()
+
+
+# Ответ в формате, который просит клиент (JSON или MessagePack)
+def render(request, data, status=200):
+    accept = request.headers.get("Accept", "")
+    renderer = _msgpack if msgpack and _msgpack.media_type in accept else _json
+    response = HttpResponse(
+        renderer.render(data), status=status, content_type=renderer.media_type
+    )
+    response["Vary"] = "Accept"
+    return response
+
+
+# Async-представление с проверкой метода и лимитов частоты, без CSRF (как у
+# DRF-представлений). Декораторы Django 4.2 (require_GET, csrf_exempt) не
+# поддерживают async. throttle - scope лимита endpoint, как у DRF-версии.
+# Ведра - в памяти или в кэше, проверка не обращается к БД
+def async_view(*methods, throttle=None):
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def view(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            wait = throttling.check(request, "client", throttle)
+            if wait:
+                detail = Throttled(wait).detail
+                response = render(request, {"detail": detail}, 429)
+                response["Retry-After"] = str(wait)
+                return response
+            return await fn(request, *args, **kwargs)
+
+        view.csrf_exempt = True
+        return view
+
+    return decorator
+
+
+# GET /api/drivers/by_phone/?phone=...
+@async_view("GET", throttle="drivers.by_phone")
+async def by_phone(request):
+    phone = (request.GET.get("phone") or "").strip()
+    if not phone:
+        return render(request, {"detail": "phone required"}, 400)
+    norm = re.sub(r"\D+", "", phone)
+
+    async def build():
+        async for pk, db_phone in Driver.objects.values_list("id", "phone"):
+            if re.sub(r"\D+", "", db_phone or "") == norm:
+                return 200, (await DRIVER_FAST.arows(Driver.objects.filter(pk=pk)))[0]
+        return 404, {"detail": "not found"}
+
+    status, data = await acached("by_phone", [driver_ns(norm)], norm, build)
+    return render(request, data, status)
+
+
+# ?tenant=<id> - обязателен для слотов, как в DRF-версии
+def _tenant(request):
+    try:
+        return tenant_param(request.GET)
+    except ValueError:
+        return None
+
+
+# GET /api/slots/?tenant=<id>&date=YYYY-MM-DD
+@async_view("GET", throttle="slots.list")
+async def slot_list(request):
+    tenant = _tenant(request)
+    if tenant is None:
+        return render(request, {"tenant": ["tenant required"]}, 400)
+    want_date = request.GET.get("date")
+
+    async def build():
+        qs = Slot.objects.for_tenant(tenant).filter(status=SlotStatus.FREE)
+        if want_date:
+            qs = qs.filter(date=want_date)
+        return 200, await SLOT_FAST.arows(qs.order_by("date", "time"))
+
+    status, data = await acached(
+        "slots", [slots_ns(tenant)], (tenant, want_date), build
+    )
+    return render(request, data, status)
+
+
+# GET /api/slots/free_dates/?tenant=<id>&days=7
+@async_view("GET", throttle="slots.free_dates")
+async def free_dates(request):
+    tenant = _tenant(request)
+    if tenant is None:
+        return render(request, {"tenant": ["tenant required"]}, 400)
+    days = int(request.GET.get("days", "7"))
+    today = date.today()
+    until = today + timedelta(days=days)
+
+    async def build():
+        return 200, [
+            {"date": str(d), "available": available}
+            async for d, available in free_dates_qs(tenant, today, until)
+        ]
+
+    status, data = await acached(
+        "free_dates", [slots_ns(tenant)], (tenant, today, until), build
+    )
+    return render(request, data, status)
+
+
+# GET /api/appointments/active_by_phone/?phone=+7...
+@async_view("GET", throttle="appointments.active_by_phone")
+async def active_by_phone(request):
+    phone = request.GET.get("phone")
+    if not phone:
+        return render(request, {"detail": "phone required"}, 400)
+
+    async def build():
+        d = await Driver.objects.filter(phone=phone).values("id").afirst()
+        if d is None:
+            return 404, {"detail": "driver not found"}
+        qs = (
+            Appointment.objects.filter(
+                driver_id=d["id"], status=AppointmentStatus.ACTIVE
+            )
+            .order_by("slot__date", "slot__time")
+            .values_list("id", "slot__date", "slot__time", "car__plate_number")
+        )
+        return 200, [
+            {
+                "id": ap_id,
+                "date": str(ap_date),
+                "time": ap_time.strftime("%H:%M"),
+                "car_plate": plate,
+            }
+            async for ap_id, ap_date, ap_time, plate in qs
+        ]
+
+    status, data = await acached("active_by_phone", [driver_ns(phone)], phone, build)
+    return render(request, data, status)
+
+
+# Запись и отмена идут через сериализатор и Appointment.save() в потоке:
+# им нужны транзакции и сигналы, которые в Django 4.2 синхронные
+def _idempotent(request, scope, payload, handler):
+    return idempotent(
+        request.headers.get(HEADER),
+        scope,
+        payload,
+        handler,
+        client=request_client(request),
+    )
+
+
+def _replay(request, result):
+    status, data, replayed = result
+    response = render(request, data, status)
+    if replayed:
+        response[REPLAYED_HEADER] = "true"
+    return response
+
+
+# POST /api/appointments/
+@async_view("POST", throttle="appointments.create")
+async def appointment_create(request):
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError as e:
+        return render(request, {"detail": f"JSON parse error - {e}"}, 400)
+    result = await sync_to_async(_idempotent)(
+        request,
+        "appointments.create",
+        payload,
+        lambda: create_appointment(payload),
+    )
+    return _replay(request, result)
+
+
+# POST /api/appointments/{id}/cancel_user/
+@async_view("POST", throttle="appointments.cancel_user")
+async def cancel_user(request, pk):
+    result = await sync_to_async(_idempotent)(
+        request,
+        f"appointments.cancel_user:{pk}",
+        None,
+        lambda: cancel_appointment(pk),
+    )
+    return _replay(request, result)
+
+
+# Подключаются в fleetcare/urls.py перед DRF-маршрутами
+urlpatterns = [
+    path("drivers/by_phone/", by_phone),
+    path("slots/", slot_list),
+    path("slots/free_dates/", free_dates),
+    path("appointments/", appointment_create),
+    path("appointments/active_by_phone/", active_by_phone),
+    path("appointments/<int:pk>/cancel_user/", cancel_user),
+]
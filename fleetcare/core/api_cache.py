@@ -0,0 +1,125 @@
+import hashlib
+import re
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .db_routing import use_primary
+
+# Кэш ответов горячих endpoints бота.
+# Ключ содержит версии "пространств" (слоты компании, конкретный водитель):
+# инвалидация - это увеличение версии, старые ключи просто доживают свой TTL.
+# Версия увеличивается после COMMIT, а ответ строится по основной БД: иначе
+# параллельный запрос успел бы положить под новую версию данные до записи
+# (или с отстающей реплики), и они жили бы весь API_CACHE_TTL.
+# SLOTS_NS меняется при изменении слотов любой компании (сводка в админке)
+SLOTS_NS = "slots"
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def slots_ns(tenant_id) -> str:
+    return f"slots:{tenant_id}"
+
+
+def driver_ns(phone: str) -> str:
+    return "driver:" + re.sub(r"\D+", "", phone or "")
+
+
+def _version_key(ns: str) -> str:
+    return f"api:ver:{ns}"
+
+
+# Начальная версия - от времени, чтобы после вытеснения ключа версии
+# не вернуться к значению, под которым еще лежат устаревшие ответы
+def _initial_version():
+    return time.time_ns() // 1000
+
+
+def get_versions(namespaces):
+    keys = [_version_key(ns) for ns in namespaces]
+    found = cache.get_many(keys)
+    for k in keys:
+        if k not in found:
+            cache.add(k, _initial_version(), None)
+            found[k] = cache.get(k)
+    return [found[k] for k in keys]
+
+
+def _bump(namespaces):
+    for ns in namespaces:
+        key = _version_key(ns)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+
+
+# Вне транзакции - сразу, внутри - после ее фиксации (при откате - никогда)
+def bump(*namespaces):
+    transaction.on_commit(lambda: _bump(namespaces))
+
+
+# Явные хуки для массовых операций, которые не вызывают сигналы
+def invalidate_slots(*tenant_ids):
+    bump(SLOTS_NS, *(slots_ns(t) for t in tenant_ids))
+
+
+def invalidate_drivers(phones):
+    bump(*(driver_ns(p) for p in phones))
+
+
+def _response_key(name, versions, params):
+    versions = ".".join(str(v) for v in versions)
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    return f"api:{name}:{versions}:{digest}"
+
+
+# Ответ из кэша или build() -> (status, data); кэшируется вместе со статусом
+def cached(name: str, namespaces, params, build):
+    key = _response_key(name, get_versions(namespaces), params)
+    result = cache.get(key)
+    with _stats_lock:
+        _stats["hits" if result is not None else "misses"] += 1
+    if result is None:
+        with use_primary():
+            result = build()
+        cache.set(key, result, settings.API_CACHE_TTL)
+    return result
+
+
+# Асинхронные варианты для async-представлений (build - корутина)
+async def aget_versions(namespaces):
+    keys = [_version_key(ns) for ns in namespaces]
+    found = await cache.aget_many(keys)
+    for k in keys:
+        if k not in found:
+            await cache.aadd(k, _initial_version(), None)
+            found[k] = await cache.aget(k)
+    return [found[k] for k in keys]
+
+
+async def acached(name: str, namespaces, params, build):
+    key = _response_key(name, await aget_versions(namespaces), params)
+    result = await cache.aget(key)
+    with _stats_lock:
+        _stats["hits" if result is not None else "misses"] += 1
+    if result is None:
+        with use_primary():
+            result = await build()
+        await cache.aset(key, result, settings.API_CACHE_TTL)
+    return result
+
+
+# Статистика попаданий текущего процесса
+def cache_stats():
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
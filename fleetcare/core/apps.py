@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+
+        # Инвалидация кэша API по сигналам моделей
+        from . import signals  # noqa: F401
@@ -0,0 +1,124 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import (
+    Appointment,
+    AppointmentArchive,
+    Notification,
+    NotificationArchive,
+    Slot,
+    SlotArchive,
+    WaitlistOffer,
+)
+
+ARCHIVE_BATCH_SIZE = 1000
+
+
+# Граница хранения уведомлений в основной таблице
+def notification_cutoff(days: int = None):
+    if days is None:
+        days = settings.NOTIFICATION_RETENTION_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+# Перенос одной пачки уведомлений старше cutoff в архив.
+# Каждая пачка - отдельная короткая транзакция, блокируются только её строки
+def archive_notifications_batch(cutoff, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.filter(created_at__lt=cutoff)
+            .order_by("created_at")
+            .select_for_update(skip_locked=True)
+            .values(
+                "id",
+                "tenant_id",
+                "driver_id",
+                "text",
+                "created_at",
+                "broadcast_id",
+                "delivered",
+            )[:batch_size]
+        )
+        if not rows:
+            return 0
+        NotificationArchive.objects.bulk_create(
+            [NotificationArchive(**row) for row in rows], ignore_conflicts=True
+        )
+        Notification.objects.filter(id__in=[row["id"] for row in rows]).delete()
+    return len(rows)
+
+
+# Перенос всех устаревших уведомлений пачками
+def archive_notifications(cutoff, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    total = 0
+    while True:
+        moved = archive_notifications_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+# Граница хранения слотов: прошедшие раньше этой даты уходят в архив
+def slot_cutoff(days: int = None):
+    if days is None:
+        days = settings.SLOT_RETENTION_DAYS
+    return timezone.localdate() - timedelta(days=days)
+
+
+# Перенос пачки прошедших слотов вместе с их записями в архив.
+# Слоты и записи переносятся в одной транзакции, так что архивные записи
+# всегда ссылаются на архивные слоты. Удаление - без сигналов: это не отмена
+# записи, места и сводки загрузки не меняются
+def archive_slots_batch(cutoff, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    with transaction.atomic():
+        slots = list(
+            Slot.objects.filter(date__lt=cutoff)
+            .order_by("date", "time")
+            .select_for_update(skip_locked=True)
+            .values(
+                "id", "tenant_id", "date", "time", "status", "capacity", "available"
+            )[:batch_size]
+        )
+        if not slots:
+            return 0
+        slot_ids = [row["id"] for row in slots]
+        appointments = Appointment.objects.filter(slot_id__in=slot_ids)
+        rows = list(
+            appointments.order_by()
+            .select_for_update()
+            .values(
+                "id",
+                "tenant_id",
+                "slot_id",
+                "driver_id",
+                "car_id",
+                "status",
+                "created_at",
+                "updated_at",
+            )
+        )
+        SlotArchive.objects.bulk_create(
+            [SlotArchive(**row) for row in slots], ignore_conflicts=True
+        )
+        AppointmentArchive.objects.bulk_create(
+            [AppointmentArchive(**row) for row in rows], ignore_conflicts=True
+        )
+        appointments._raw_delete(appointments.db)
+
+        # Предложения листа ожидания на прошедшие слоты давно неактуальны
+        offers = WaitlistOffer.objects.filter(slot_id__in=slot_ids)
+        offers._raw_delete(offers.db)
+        done = Slot.objects.filter(id__in=slot_ids)
+        done._raw_delete(done.db)
+    return len(slots)
+
+
+# Перенос всех прошедших слотов пачками
+def archive_slots(cutoff, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    total = 0
+    while True:
+        moved = archive_slots_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
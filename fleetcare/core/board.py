@@ -0,0 +1,250 @@
+import asyncio
+import json
+import logging
+import psycopg
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .db_routing import use_primary
+from .models import Appointment, AppointmentStatus, Slot, SlotStatus
+from .tenants import user_tenant_ids
+
+# Табло записей на сегодня для сервиса: страница в админке получает снимок дня
+# и дальше только изменения через server-sent events (GET /board/events/, под
+# ASGI). Источник изменений - триггеры БД (миграция 0016) и LISTEN на канале
+# CHANNEL: одно соединение на процесс, строка по уведомлению читается один раз
+# и раздается подписчикам процесса через очереди (каждому - его компании).
+# Django 4.2 не замечает отключения клиента от потокового ответа, поэтому
+# поток закрывается через BOARD_STREAM_SECONDS, EventSource переподключается
+# сам и получает свежий снимок; так же восстанавливаются пропущенные события
+CHANNEL = "fleetcare_board"
+HEARTBEAT_SECONDS = 15  # комментарий в потоке, чтобы прокси не рвали соединение
+QUEUE_LIMIT = 500  # подписчик отстал: поток закрывается, клиент берет снимок
+RECONNECT_SECONDS = 3
+RESET = {"kind": "reset"}
+
+SLOT_FIELDS = ("id", "tenant_id", "time", "status", "capacity", "available")
+APPOINTMENT_FIELDS = (
+    "id",
+    "tenant_id",
+    "slot_id",
+    "slot__time",
+    "status",
+    "car__plate_number",
+    "driver__last_name",
+    "driver__first_name",
+    "driver__phone",
+)
+
+
+def slot_row(row):
+    return {
+        **row,
+        "time": f"{row['time']:%H:%M}",
+        "status_label": str(SlotStatus(row["status"]).label),
+    }
+
+
+def appointment_row(row):
+    return {
+        "id": row["id"],
+        "tenant_id": row["tenant_id"],
+        "slot_id": row["slot_id"],
+        "time": f"{row['slot__time']:%H:%M}",
+        "status": row["status"],
+        "status_label": str(AppointmentStatus(row["status"]).label),
+        "car": row["car__plate_number"],
+        "driver": f"{row['driver__last_name']} {row['driver__first_name']}",
+        "phone": row["driver__phone"],
+    }
+
+
+# Слоты и записи дня в компаниях tenant_ids (None - все)
+def board_snapshot(day, tenant_ids=None):
+    slots = (
+        Slot.objects.for_tenants(tenant_ids)
+        .filter(date=day)
+        .order_by("time", "id")
+        .values(*SLOT_FIELDS)
+    )
+    appointments = (
+        Appointment.objects.for_tenants(tenant_ids)
+        .filter(slot__date=day)
+        .order_by("slot__time", "id")
+        .values(*APPOINTMENT_FIELDS)
+    )
+    with use_primary():
+        return {
+            "kind": "snapshot",
+            "day": day.isoformat(),
+            "slots": [slot_row(row) for row in slots],
+            "appointments": [appointment_row(row) for row in appointments],
+        }
+
+
+# Уведомление триггера -> событие табло: строка на сегодня, удаление или
+# None (строка не относится к сегодняшнему дню). Читается с основной БД:
+# реплика может еще не содержать изменение
+def board_event(payload, day):
+    kind, op = payload["kind"], payload["op"]
+    event = {"kind": kind, "op": "DELETE", "id": payload["id"]}
+    if op != "DELETE":
+        if kind == "slot":
+            qs = Slot.objects.filter(pk=payload["id"], date=day).values(*SLOT_FIELDS)
+            make_row = slot_row
+        else:
+            qs = Appointment.objects.filter(pk=payload["id"], slot__date=day).values(
+                *APPOINTMENT_FIELDS
+            )
+            make_row = appointment_row
+        with use_primary():
+            row = qs.first()
+        if row is not None:
+            return {**event, "op": op, "row": make_row(row)}
+
+        # Перенесена с сегодняшнего дня (или уже удалена) - убрать с табло
+        if op == "INSERT":
+            return None
+    return event
+
+
+# Параметры отдельного соединения для LISTEN (вне пула и ORM Django)
+def listen_params():
+    params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+    for key in ("cursor_factory", "context", "prepare_threshold"):
+        params.pop(key, None)
+    return params
+
+
+# Строки по уведомлениям читаются в одном отдельном потоке. Его соединение
+# живет, как у обработки запросов: закрывается (или возвращается в пул),
+# только когда устарело по CONN_MAX_AGE или сломалось
+_fetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="board")
+
+
+def _fetch_event(payload):
+    close_old_connections()
+    try:
+        return board_event(payload, timezone.localdate())
+    finally:
+        close_old_connections()
+
+
+class BoardHub:
+    def __init__(self):
+        self.subscribers = {}  # очередь -> компании подписчика (None - все)
+        self.task = None
+        self.ready = asyncio.Event()
+
+    # Очередь событий для компаний tenant_ids; возвращается после LISTEN,
+    # чтобы снимок, снятый следом, не пропустил изменения между ними
+    async def subscribe(self, tenant_ids):
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.ready = asyncio.Event()
+            self.task = loop.create_task(self.listen())
+        queue = asyncio.Queue()
+        self.subscribers[queue] = tenant_ids
+        await self.ready.wait()
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.pop(queue, None)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def listen(self):
+        fetch = sync_to_async(
+            _fetch_event, thread_sensitive=False, executor=_fetch_executor
+        )
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    **listen_params(), autocommit=True
+                ) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+
+                    # После переподключения подписчики могли пропустить события
+                    if self.ready.is_set():
+                        self.publish(RESET)
+                    self.ready.set()
+                    async for notify in conn.notifies():
+                        payload = json.loads(notify.payload)
+                        if self.wanted(payload["tenant"]):
+                            event = await fetch(payload)
+                            if event is not None:
+                                self.publish(event, payload["tenant"])
+            except psycopg.Error:
+                logging.exception("Табло: соединение LISTEN потеряно")
+                await asyncio.sleep(RECONNECT_SECONDS)
+
+    def wanted(self, tenant_id) -> bool:
+        return any(t is None or tenant_id in t for t in self.subscribers.values())
+
+    # Событие в очереди подписчиков компании (tenant_id=None - всем).
+    # Отставший подписчик отключается: его поток закроется после RESET
+    def publish(self, event, tenant_id=None):
+        for queue, tenant_ids in list(self.subscribers.items()):
+            if tenant_id is not None and tenant_ids is not None:
+                if tenant_id not in tenant_ids:
+                    continue
+            if queue.qsize() >= QUEUE_LIMIT:
+                del self.subscribers[queue]
+                queue.put_nowait(RESET)
+            else:
+                queue.put_nowait(event)
+
+
+hub = BoardHub()
+
+
+def sse(event) -> str:
+    return f"event: {event['kind']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def board_stream(tenant_ids):
+    queue = await hub.subscribe(tenant_ids)
+    try:
+        snapshot = await sync_to_async(board_snapshot)(timezone.localdate(), tenant_ids)
+        yield f"retry: {RECONNECT_SECONDS * 1000}\n\n" + sse(snapshot)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.BOARD_STREAM_SECONDS
+        while (left := deadline - loop.time()) > 0:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), min(HEARTBEAT_SECONDS, left)
+                )
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event is RESET:
+                return
+            yield sse(event)
+    finally:
+        hub.unsubscribe(queue)
+
+
+# Доступ к табло - как к списку записей в админке, компании - менеджера
+def board_tenants(request):
+    user = request.user
+    if not (
+        user.is_active and user.is_staff and user.has_perm("core.view_appointment")
+    ):
+        raise PermissionDenied
+    return user_tenant_ids(request)
+
+
+# GET /board/events/ - поток событий табло (text/event-stream)
+async def board_events(request):
+    tenant_ids = await sync_to_async(board_tenants)(request)
+    response = StreamingHttpResponse(
+        board_stream(tenant_ids), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import threading
+from datetime import timedelta
+import httpx
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+from .dashboard import invalidate_dashboard
+from .models import (
+    Broadcast,
+    BroadcastStatus,
+    Driver,
+    Notification,
+    NotificationArchive,
+)
+from .telegram import TelegramSender
+
+# Рассылка сообщений водителям с соблюдением лимитов Telegram.
+# Получатели выбираются одним запросом, отправка идет в фоновом потоке,
+# результаты пишутся пачками (bulk_create) вместе с прогрессом рассылки.
+# Очередь потока живет только в процессе, поэтому список получателей хранится
+# в рассылке, а каждая пачка отмечает время прогресса. Рассылку без прогресса
+# дольше BROADCAST_STALE_SECONDS (процесс перезапущен или упал) продолжает
+# команда resume_broadcasts - тем, у кого еще нет уведомления этой рассылки.
+# Результаты последней незаписанной пачки теряются: эти сообщения уйдут повторно
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "30"))
+BROADCAST_FLUSH_SIZE = 100
+BROADCAST_STALE_SECONDS = int(os.getenv("BROADCAST_STALE_SECONDS", "300"))
+UNFINISHED = (BroadcastStatus.QUEUED, BroadcastStatus.RUNNING)
+
+
+# (driver_id, tenant_id, chat_id) всех водителей выборки с привязанным Telegram
+def recipients(drivers_qs):
+    return list(
+        drivers_qs.exclude(chat_id=None)
+        .order_by()
+        .values_list("id", "tenant_id", "chat_id")
+    )
+
+
+# Создать рассылку и запустить отправку в фоне. Рассылка по водителям одной
+# компании видна ее менеджерам
+def start_broadcast(text: str, drivers_qs) -> Broadcast:
+    targets = recipients(drivers_qs)
+    tenants = {tenant_id for _, tenant_id, _ in targets}
+    broadcast = Broadcast.objects.create(
+        text=text,
+        total=len(targets),
+        tenant_id=tenants.pop() if len(tenants) == 1 else None,
+        recipients=[driver_id for driver_id, _, _ in targets],
+        progress_at=timezone.now(),
+    )
+    threading.Thread(
+        target=run_broadcast,
+        args=(broadcast.pk, text, targets),
+        name=f"broadcast-{broadcast.pk}",
+        daemon=True,
+    ).start()
+    return broadcast
+
+
+# Получатели рассылки, которым она еще не отправлена (уведомления могли уже
+# уйти в архив)
+def pending_targets(broadcast: Broadcast):
+    sent = Notification.objects.filter(broadcast=broadcast).values("driver_id")
+    archived = NotificationArchive.objects.filter(broadcast=broadcast).values(
+        "driver_id"
+    )
+    return recipients(
+        Driver.objects.filter(pk__in=broadcast.recipients)
+        .exclude(pk__in=sent)
+        .exclude(pk__in=archived)
+    )
+
+
+# Продолжить прерванные рассылки (команда resume_broadcasts) в текущем потоке.
+# Рассылка забирается условным UPDATE времени прогресса: два процесса команды
+# не продолжат одну рассылку дважды
+def resume_broadcasts() -> int:
+    stale = Q(
+        progress_at__lt=timezone.now() - timedelta(seconds=BROADCAST_STALE_SECONDS)
+    )
+    stale |= Q(progress_at=None)
+    resumed = 0
+    for broadcast in Broadcast.objects.filter(stale, status__in=UNFINISHED):
+        claimed = Broadcast.objects.filter(
+            stale, pk=broadcast.pk, status__in=UNFINISHED
+        ).update(progress_at=timezone.now())
+        if not claimed:
+            continue
+
+        # Рассылка без сохраненных получателей (до их хранения) не продолжается
+        if broadcast.total and not broadcast.recipients:
+            logging.error(
+                "Рассылку %s нельзя продолжить: нет получателей", broadcast.pk
+            )
+            Broadcast.objects.filter(pk=broadcast.pk).update(
+                status=BroadcastStatus.FAILED, finished_at=timezone.now()
+            )
+            continue
+        run_broadcast(broadcast.pk, broadcast.text, pending_targets(broadcast))
+        resumed += 1
+    return resumed
+
+
+def run_broadcast(broadcast_id: int, text: str, targets):
+    try:
+        Broadcast.objects.filter(pk=broadcast_id).update(
+            status=BroadcastStatus.RUNNING, progress_at=timezone.now()
+        )
+        token = os.getenv("TELEGRAM_BOT_TOKEN")
+        if not token:
+            raise RuntimeError("TELEGRAM_BOT_TOKEN не задан")
+        asyncio.run(_send_all(broadcast_id, text, targets, TelegramSender(token)))
+        status = BroadcastStatus.DONE
+    except Exception:
+        logging.exception("Рассылка %s прервана", broadcast_id)
+        status = BroadcastStatus.FAILED
+    try:
+        Broadcast.objects.filter(pk=broadcast_id).update(
+            status=status, finished_at=timezone.now()
+        )
+    finally:
+        connection.close()
+
+
+# Результаты пачки: уведомления одним INSERT, счетчики - атомарным UPDATE
+# (выполняется в потоке sync_to_async, соединение за собой закрываем)
+def _flush(broadcast_id: int, text: str, results):
+    now = timezone.now()
+    sent = sum(1 for *_, ok in results if ok)
+    try:
+        Notification.objects.bulk_create(
+            [
+                Notification(
+                    driver_id=driver_id,
+                    tenant_id=tenant_id,
+                    text=text,
+                    created_at=now,
+                    broadcast_id=broadcast_id,
+                    delivered=ok,
+                )
+                for driver_id, tenant_id, ok in results
+            ]
+        )
+        Broadcast.objects.filter(pk=broadcast_id).update(
+            sent=F("sent") + sent,
+            failed=F("failed") + len(results) - sent,
+            progress_at=now,
+        )
+        if sent < len(results):
+            invalidate_dashboard()
+    finally:
+        connection.close()
+
+
+async def _send_all(broadcast_id, text, targets, sender: TelegramSender):
+    queue = asyncio.Queue()
+    for target in targets:
+        queue.put_nowait(target)
+    results = []
+    flush = sync_to_async(_flush)
+
+    async def worker(client):
+        while True:
+            try:
+                driver_id, tenant_id, chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            ok = await sender.send(client, chat_id, text)
+            results.append((driver_id, tenant_id, ok))
+            if len(results) >= BROADCAST_FLUSH_SIZE:
+                batch = results[:]
+                results.clear()
+                await flush(broadcast_id, text, batch)
+
+    # Скорость задают ведра отправителя, воркеры лишь держат запросы в полете
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        await asyncio.gather(
+            *(worker(client) for _ in range(min(BROADCAST_CONCURRENCY, len(targets))))
+        )
+    if results:
+        await flush(broadcast_id, text, results)
@@ -0,0 +1,97 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from .api_cache import SLOTS_NS, bump, get_versions
+from .models import (
+    Appointment,
+    AppointmentStatus,
+    DailyUtilization,
+    Driver,
+    Notification,
+)
+
+# Сводка на главной странице админки: записи, отмены и свободные места
+# за сегодня и текущую неделю, автомобили без записи на ТО, недоставленные
+# уведомления. Несколько агрегирующих запросов (сводка загрузки по дням,
+# автомобили, уведомления по частичному индексу), результат кэшируется на
+# DASHBOARD_CACHE_TTL секунд. Изменения слотов и записей сбрасывают его
+# вместе с кэшем API (версия SLOTS_NS), автомобилей и уведомлений - своей версией.
+# Менеджер видит сводку по своим компаниям (tenant_ids), суперпользователь - по всем
+DASHBOARD_NS = "dashboard"
+
+
+def invalidate_dashboard():
+    bump(DASHBOARD_NS)
+
+
+def dashboard_stats(today=None, tenant_ids=None):
+    today = today or timezone.localdate()
+    versions = ".".join(str(v) for v in get_versions([SLOTS_NS, DASHBOARD_NS]))
+    tenants = "all" if tenant_ids is None else ",".join(map(str, sorted(tenant_ids)))
+    key = f"dashboard:{today}:{tenants}:{versions}"
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_stats(today, tenant_ids)
+        cache.set(key, stats, settings.DASHBOARD_CACHE_TTL)
+    return stats
+
+
+# Автомобили водителей без предстоящей активной записи на ТО: все
+# закрепленные за водителями минус записанные. Считается по предстоящим
+# записям, а не перебором автопарка (anti-join по всем автомобилям)
+def cars_without_booking(today, tenant_ids=None) -> int:
+    booked = (
+        Appointment.objects.for_tenants(tenant_ids)
+        .filter(
+            status=AppointmentStatus.ACTIVE,
+            slot__date__gte=today,
+            car__driver__isnull=False,
+        )
+        .values("car")
+        .distinct()
+    )
+    return Driver.objects.for_tenants(tenant_ids).count() - booked.count()
+
+
+# Недоставленные уведомления начиная с since (индекс notification_failed)
+def failed_notifications(since, tenant_ids=None):
+    return Notification.objects.for_tenants(tenant_ids).filter(
+        delivered=False, created_at__gte=since
+    )
+
+
+def compute_stats(today, tenant_ids=None):
+    week_start = today - timedelta(days=today.weekday())
+    week_end = week_start + timedelta(days=6)
+    on_today = Q(day=today)
+    cancelled = F("cancelled_user") + F("cancelled_manager")
+    week = DailyUtilization.objects.for_tenants(tenant_ids).filter(
+        day__range=(week_start, week_end)
+    )
+    load = week.aggregate(
+        booked_today=Sum("booked", filter=on_today),
+        booked_week=Sum("booked"),
+        cancelled_today=Sum(cancelled, filter=on_today),
+        cancelled_week=Sum(cancelled),
+        free_today=Sum("free", filter=on_today),
+        free_week=Sum("free", filter=Q(day__gte=today)),
+    )
+
+    tz = timezone.get_current_timezone()
+    day_start = datetime.combine(today, time.min, tzinfo=tz)
+    failed = failed_notifications(
+        datetime.combine(week_start, time.min, tzinfo=tz), tenant_ids
+    ).aggregate(
+        failed_today=Count("pk", filter=Q(created_at__gte=day_start)),
+        failed_week=Count("pk"),
+    )
+    return {
+        **{k: v or 0 for k, v in load.items()},
+        **failed,
+        "cars_without_booking": cars_without_booking(today, tenant_ids),
+        "week_start": week_start,
+        "week_end": week_end,
+        "computed_at": timezone.now(),
+    }
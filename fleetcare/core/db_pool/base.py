@@ -0,0 +1,102 @@
+import threading
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base, creation
+from django.db.backends.base.base import NO_DB_ALIAS
+from psycopg_pool import ConnectionPool
+
+# Бэкенд PostgreSQL с пулом соединений psycopg 3.
+# ENGINE = "core.db_pool", параметры пула - в OPTIONS["pool"]
+
+# Пулы живут на уровне процесса: ключ - (алиас, имя БД)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Метрики всех пулов процесса (размер, ожидания, ошибки и т.п.)
+def pool_stats():
+    return {alias: pool.get_stats() for (alias, _), pool in _pools.items()}
+
+
+# Закрыть все пулы (перед удалением тестовой БД и т.п.)
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+
+        # Иначе соединения пула не дадут выполнить DROP DATABASE
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not base.is_psycopg3:
+            raise ImproperlyConfigured("core.db_pool требует psycopg 3")
+        if self.settings_dict["CONN_MAX_AGE"]:
+            raise ImproperlyConfigured(
+                "С пулом соединений CONN_MAX_AGE должен быть 0: "
+                "соединение возвращается в пул в конце каждого запроса"
+            )
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    @property
+    def pool(self):
+
+        # Служебное соединение без БД (создание тестовой БД) пул не использует
+        if self.alias == NO_DB_ALIAS:
+            return None
+        key = (self.alias, self.settings_dict["NAME"])
+        pool = _pools.get(key)
+        if pool is not None:
+            return pool
+        with _pools_lock:
+            if key not in _pools:
+                options = dict(self.settings_dict["OPTIONS"].get("pool", {}))
+
+                # Проверка соединения перед выдачей из пула
+                if options.pop("health_check", True):
+                    options["check"] = ConnectionPool.check_connection
+                _pools[key] = ConnectionPool(
+                    kwargs=self.get_connection_params(),
+                    name=self.alias,
+                    open=True,
+                    **options,
+                )
+            return _pools[key]
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.getconn()
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+        self.isolation_level = base.IsolationLevel(
+            isolation_level
+            if isolation_level is not None
+            else base.IsolationLevel.READ_COMMITTED
+        )
+        if isolation_level is not None:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if self.connection is None or pool is None:
+            return super()._close()
+
+        # Вместо закрытия - возврат в пул (пул сам откатит незавершенную транзакцию)
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
+        self.connection = None
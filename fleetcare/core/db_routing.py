@@ -0,0 +1,112 @@
+import random
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Состояние маршрутизации текущего запроса: читать ли с основной БД и была ли запись.
+# Храним изменяемый объект, чтобы изменения были видны и из потоков sync_to_async
+_state = ContextVar("db_routing_state", default=None)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RoutingState:
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.wrote = False
+
+
+def replica_aliases():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+# Все чтения внутри блока идут в основную БД
+@contextmanager
+def use_primary():
+    token = _state.set(RoutingState(primary=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+# Маршрутизация: запись - всегда в default, чтение - в случайную реплику,
+# кроме запросов, которые пишут или только что писали (read-your-writes)
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        state = _state.get()
+        if not replicas or (state and state.primary):
+            return DEFAULT_DB_ALIAS
+
+        # Внутри транзакции читаем то же, во что пишем
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+
+        # После записи остаток запроса читает с основной БД
+        state = _state.get()
+        if state:
+            state.primary = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+# Небезопасные запросы (запись, бронирование, отмена) целиком идут в основную БД,
+# после записи клиент на REPLICA_PIN_SECONDS закрепляется за основной через cookie
+class ReplicaRoutingMiddleware:
+    cookie_name = "fleetcare_primary"
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, state, response)
+
+    # Под ASGI - без перехода в поток, чтобы async-представления оставались async
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, state, response)
+
+    def start(self, request):
+        state = RoutingState(
+            primary=request.method not in SAFE_METHODS
+            or self.cookie_name in request.COOKIES
+        )
+        return state, _state.set(state)
+
+    def finish(self, request, state, response):
+        if (state.wrote or request.method not in SAFE_METHODS) and replica_aliases():
+            response.set_cookie(
+                self.cookie_name,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
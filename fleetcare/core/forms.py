@@ -1,6 +1,8 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from .models import Slot, SlotStatus, Driver, Automobile
+from .models import Slot, SlotStatus, Driver
+from .api_cache import invalidate_slots
+from .rollups import rebuild_days
 from datetime import time as dtime
 
 
@@ -16,11 +18,12 @@ class SlotBulkForm(forms.ModelForm):
 
     class Meta:
         model = Slot
-        fields = ["date", "time", "status", "bulk_times"]
+        fields = ["tenant", "date", "time", "capacity", "status", "bulk_times"]
 
     def clean(self):
         cleaned = super().clean()
         bulk = (cleaned.get("bulk_times") or "").strip()
+        tenant = cleaned.get("tenant")
         date = cleaned.get("date")
         main_time = cleaned.get("time")
 
@@ -46,11 +49,11 @@ class SlotBulkForm(forms.ModelForm):
         self._main_time = main_time
 
         # Предупредим, если какие-то из дополнительных уже есть
-        if date and times:
+        if tenant and date and times:
             existing = set(
-                Slot.objects.filter(date=date, time__in=times).values_list(
-                    "time", flat=True
-                )
+                Slot.objects.for_tenant(tenant)
+                .filter(date=date, time__in=times)
+                .values_list("time", flat=True)
             )
             if existing:
                 bad = ", ".join(sorted(t.strftime("%H:%M") for t in existing))
@@ -65,8 +68,11 @@ class SlotBulkForm(forms.ModelForm):
         instance = super().save(commit=commit)
 
         # 2) Если указаны дополнительные времена - создаём дополнительные слоты
+        tenant = self.cleaned_data.get("tenant")
         date = self.cleaned_data.get("date")
         status = self.cleaned_data.get("status") or SlotStatus.FREE
+        capacity = self.cleaned_data.get("capacity") or 1
+        available = capacity if status == SlotStatus.FREE else 0
         extras = []
 
         for t in getattr(self, "_parsed_times", []):
@@ -74,12 +80,26 @@ class SlotBulkForm(forms.ModelForm):
             # Не дублируем основной time
             if self._main_time and t == self._main_time:
                 continue
-            extras.append(Slot(date=date, time=t, status=status))
+            extras.append(
+                Slot(
+                    tenant=tenant,
+                    date=date,
+                    time=t,
+                    status=status,
+                    capacity=capacity,
+                    available=available,
+                )
+            )
 
         if extras:
 
             # Пропустим конфликты на уровне БД (если пара уже есть)
             Slot.objects.bulk_create(extras, ignore_conflicts=True)
+
+            # bulk_create не вызывает сигналы - сбрасываем кэш слотов
+            # и пересчитываем сводку загрузки дня явно
+            invalidate_slots(tenant.pk)
+            rebuild_days([date])
         return instance
 
 
@@ -87,16 +107,32 @@ class SlotBulkForm(forms.ModelForm):
 class DriverAdminForm(forms.ModelForm):
     class Meta:
         model = Driver
-        fields = ["first_name", "last_name", "phone", "car"]
+        fields = ["tenant", "first_name", "last_name", "phone", "car"]
 
     def __init__(self, *args, **kwargs):
 
         # Фильтрация списка автомобилей чтобы показать только свободные
+        # (из доступных менеджеру компаний - их уже отобрала админка)
         super().__init__(*args, **kwargs)
+        cars = self.fields["car"].queryset
         used_ids = Driver.objects.values_list("car_id", flat=True)
-        qs = Automobile.objects.exclude(id__in=used_ids)
+        qs = cars.exclude(id__in=used_ids)
 
         # Если редактируем существующего водителя то его авто разрешаем
         if self.instance and self.instance.pk and self.instance.car_id:
-            qs = qs | Automobile.objects.filter(pk=self.instance.car_id)
+            qs = qs | cars.filter(pk=self.instance.car_id)
         self.fields["car"].queryset = qs.order_by("plate_number")
+
+
+# Текст рассылки водителям (лимит длины сообщения Telegram)
+class BroadcastForm(forms.Form):
+    text = forms.CharField(
+        label="Текст сообщения", max_length=4096, widget=forms.Textarea
+    )
+
+
+# Завершение записи на ТО: данные для истории обслуживания
+class ServiceCompleteForm(forms.Form):
+    date = forms.DateField(label="Дата ТО")
+    mileage = forms.IntegerField(label="Пробег, км", min_value=0)
+    work_done = forms.CharField(label="Выполненные работы", widget=forms.Textarea)
@@ -0,0 +1,214 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
+from .api_cache import bump, get_versions
+from .models import Appointment, AppointmentStatus
+from .tenants import tenant_param
+
+# Календари iCalendar (.ics): у водителя - его активные записи на ТО, у менеджеров -
+# все записи на день работы сервиса. Календари опрашивают ленту каждые несколько
+# минут, поэтому ETag строится из версии данных (как ключи кэша API): без
+# изменений повторный запрос получает 304 без запросов к БД и рендера.
+# Текст ленты собирается из values() и кэшируется по той же версии
+CONTENT_TYPE = "text/calendar; charset=utf-8"
+DAYS_NS = "calendar:days"
+PAST_DAYS = 30  # прошедшие записи в ленте водителя
+
+_signer = signing.Signer(salt="core.ical.driver")
+
+
+def calendar_ns(driver_id) -> str:
+    return f"calendar:{driver_id}"
+
+
+# Записи водителей изменились: их ленты и ленты дней
+def invalidate_calendars(driver_ids):
+    bump(DAYS_NS, *(calendar_ns(i) for i in driver_ids))
+
+
+# Ссылка на ленту водителя: id подписан, угадать чужую ссылку нельзя
+def driver_feed_path(driver_id) -> str:
+    return reverse("driver_calendar", args=[_signer.sign(str(driver_id))])
+
+
+def _escape(text) -> str:
+    return (
+        str(text)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+# Строки длиннее 75 байт переносятся (RFC 5545), не разрезая символы UTF-8
+def _fold(line: str) -> str:
+    data = line.encode()
+    parts = []
+    limit = 75
+    while len(data) > limit:
+        cut = limit
+        while data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        limit = 74
+    parts.append(data)
+    return b"\r\n ".join(parts).decode()
+
+
+def _utc(value: datetime) -> str:
+    return value.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _event(row, summary, description):
+    start = datetime.combine(
+        row["slot__date"], row["slot__time"], tzinfo=timezone.get_current_timezone()
+    )
+    return [
+        "BEGIN:VEVENT",
+        f"UID:appointment-{row['id']}@fleetcare",
+        f"DTSTAMP:{_utc(row['updated_at'])}",
+        f"DTSTART:{_utc(start)}",
+        f"DURATION:PT{settings.SERVICE_DURATION_MINUTES}M",
+        f"SUMMARY:{_escape(summary)}",
+        f"DESCRIPTION:{_escape(description)}",
+        "END:VEVENT",
+    ]
+
+
+def render_calendar(name, events) -> str:
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//FleetCare//Service bookings//RU",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+    ]
+    for event in events:
+        lines += event
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+def driver_calendar_text(driver_id, today) -> str:
+    rows = (
+        Appointment.objects.filter(
+            driver_id=driver_id,
+            status=AppointmentStatus.ACTIVE,
+            slot__date__gte=today - timedelta(days=PAST_DAYS),
+        )
+        .order_by("slot__date", "slot__time")
+        .values(
+            "id",
+            "updated_at",
+            "slot__date",
+            "slot__time",
+            "car__plate_number",
+            "car__make",
+            "car__model",
+        )
+    )
+    return render_calendar(
+        "FleetCare: записи на ТО",
+        (
+            _event(
+                row,
+                f"ТО {row['car__plate_number']}",
+                f"{row['car__make']} {row['car__model']}, {row['car__plate_number']}",
+            )
+            for row in rows
+        ),
+    )
+
+
+# tenant - только записи компании (None - все компании)
+def day_calendar_text(day, tenant=None) -> str:
+    qs = Appointment.objects.filter(slot__date=day, status=AppointmentStatus.ACTIVE)
+    if tenant is not None:
+        qs = qs.for_tenant(tenant)
+    rows = qs.order_by("slot__time", "id").values(
+        "id",
+        "updated_at",
+        "slot__date",
+        "slot__time",
+        "car__plate_number",
+        "driver__last_name",
+        "driver__first_name",
+        "driver__phone",
+    )
+    return render_calendar(
+        f"FleetCare: записи на {day:%d.%m.%Y}",
+        (
+            _event(
+                row,
+                f"ТО {row['car__plate_number']} - {row['driver__last_name']}",
+                f"{row['driver__last_name']} {row['driver__first_name']}, "
+                f"{row['driver__phone']}",
+            )
+            for row in rows
+        ),
+    )
+
+
+# Ответ ленты с условным GET: ETag - версии пространств и текущая дата
+# (окно ленты водителя сдвигается каждый день)
+def feed_response(request, key, namespaces, build):
+    today = timezone.localdate()
+    versions = ".".join(str(v) for v in get_versions(namespaces))
+    etag = quote_etag(f"{today:%Y%m%d}.{versions}")
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cache_key = f"ical:{key}:{etag}"
+        body = cache.get(cache_key)
+        if body is None:
+            body = build(today)
+            cache.set(cache_key, body, settings.CALENDAR_CACHE_TTL)
+        response = HttpResponse(body, content_type=CONTENT_TYPE)
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# GET /calendar/driver/<подписанный id>.ics
+@require_GET
+def driver_calendar(request, token):
+    try:
+        driver_id = int(_signer.unsign(token))
+    except (signing.BadSignature, ValueError):
+        raise Http404
+    return feed_response(
+        request,
+        f"driver:{driver_id}",
+        [calendar_ns(driver_id)],
+        lambda today: driver_calendar_text(driver_id, today),
+    )
+
+
+# GET /calendar/day/<YYYY-MM-DD>.ics?token=<CALENDAR_TOKEN>[&tenant=<id>] -
+# для менеджеров
+@require_GET
+def day_calendar(request, day):
+    token = settings.CALENDAR_TOKEN
+    if not token or not constant_time_compare(request.GET.get("token", ""), token):
+        raise Http404
+    try:
+        day = date.fromisoformat(day)
+        tenant = tenant_param(request.GET)
+    except ValueError:
+        raise Http404
+    return feed_response(
+        request,
+        f"day:{day}:{tenant}",
+        [DAYS_NS],
+        lambda today: day_calendar_text(day, tenant),
+    )
@@ -0,0 +1,102 @@
+import hashlib
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import IdempotencyKey
+from .throttling import client_key
+
+# Idempotency-Key для небезопасных запросов (запись, отмена).
+# Первый запрос резервирует ключ, выполняется и сохраняет (код, тело) ответа;
+# повтор с тем же ключом получает сохраненный ответ без повторного выполнения.
+# Ключи у каждого клиента свои (водитель бота по X-Client-Id или IP, как в
+# лимитах частоты): чужой ключ не отдает чужой ответ и не блокирует запрос.
+# Изменения handler и сохраненный ответ фиксируются одной транзакцией
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+KEY_MAX_LENGTH = 64
+
+
+def fingerprint(scope: str, payload) -> str:
+    raw = json.dumps([scope, payload], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# Клиент, в пределах которого действуют ключи запроса
+def request_client(request) -> str:
+    return client_key(request)
+
+
+# Резерв ключа; если он уже есть - существующая запись
+def _reserve(client, key, digest):
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                client=client,
+                key=key,
+                fingerprint=digest,
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL),
+            )
+        return None
+    except IntegrityError:
+        pass
+    row = IdempotencyKey.objects.filter(client=client, key=key).first()
+
+    # Истекший ключ или брошенный незавершенный запрос - занимаем заново
+    stale = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    abandoned = row is not None and (
+        row.expires_at <= now or (row.status_code is None and row.created_at <= stale)
+    )
+    if row is None or abandoned:
+        IdempotencyKey.objects.filter(
+            client=client, key=key, created_at__lte=now
+        ).delete()
+        return _reserve(client, key, digest)
+    return row
+
+
+# Выполнить handler() -> (status, data) не больше одного раза на ключ клиента.
+# Возвращает (status, data, replayed)
+def idempotent(key, scope: str, payload, handler, client: str = ""):
+    if not key:
+        status, data = handler()
+        return status, data, False
+    if len(key) > KEY_MAX_LENGTH:
+        return 400, {"detail": f"{HEADER} is too long"}, False
+
+    digest = fingerprint(scope, payload)
+    row = _reserve(client, key, digest)
+    if row is not None:
+        if row.fingerprint != digest:
+            return 422, {"detail": f"{HEADER} was used with another request"}, False
+        if row.status_code is None:
+            return 409, {"detail": "request with this key is in progress"}, False
+        return row.status_code, row.response, True
+
+    # Ответ сохраняется в той же транзакции, что и изменения handler: сбой
+    # между ними не оставит выполненный запрос без ответа для повтора
+    reserved = IdempotencyKey.objects.filter(client=client, key=key)
+    try:
+        with transaction.atomic():
+            status, data = handler()
+            if status < 500:
+                reserved.update(
+                    status_code=status,
+                    response=json.loads(json.dumps(data, default=str)),
+                )
+    except Exception:
+        reserved.delete()
+        raise
+
+    # Ошибки сервера не запоминаем: повтор выполнится заново
+    if status >= 500:
+        reserved.delete()
+    return status, data, False
+
+
+# Удалить истекшие ключи (команда purge_idempotency_keys)
+def purge_expired() -> int:
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
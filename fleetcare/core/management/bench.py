@@ -0,0 +1,41 @@
+import statistics
+from urllib.parse import urlencode
+from core.models import Driver
+
+# Общие помощники для команд замера производительности
+
+
+# Горячие GET-endpoints бота (пути относительно корня сайта): слоты компании
+# и данные первого водителя
+def hot_paths(prefix="/api"):
+    paths = []
+    driver = Driver.objects.values_list("phone", "tenant_id").first()
+    if driver:
+        phone, tenant = driver
+        paths += [
+            f"{prefix}/slots/free_dates/?days=7&tenant={tenant}",
+            f"{prefix}/slots/?tenant={tenant}",
+            f"{prefix}/drivers/by_phone/?{urlencode({'phone': phone})}",
+            f"{prefix}/appointments/active_by_phone/?{urlencode({'phone': phone})}",
+        ]
+    return paths
+
+
+# Заголовки бота для замеров: каждый запрос - от имени своего водителя
+# (X-Client-Id), иначе лимиты частоты на клиента превращают замер в подсчет 429
+def bot_headers(token: str, request_no: int):
+    return {"X-Bot-Token": token, "X-Client-Id": f"bench-{request_no}"}
+
+
+# Ошибка замера - любой ответ, кроме 2xx (в том числе 404 и 429)
+def is_error(status_code: int) -> bool:
+    return not 200 <= status_code < 300
+
+
+# "p50 .. мс, p95 .. мс, p99 .. мс" по списку длительностей в секундах
+def format_percentiles(timings):
+    q = statistics.quantiles(timings, n=100)
+    return (
+        f"p50 {q[49] * 1000:.2f} мс, p95 {q[94] * 1000:.2f} мс, "
+        f"p99 {q[98] * 1000:.2f} мс"
+    )
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from core.waitlist import expire_offers
+
+
+# python manage.py advance_waitlist (по cron раз в минуту)
+# или постоянным процессом: python manage.py advance_waitlist --interval 15
+class Command(BaseCommand):
+    help = (
+        "Закрывает просроченные предложения листа ожидания и предлагает места следующим"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=0, help="повторять каждые N секунд"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_offers()
+            if expired or not options["interval"]:
+                self.stdout.write(f"Истекло предложений: {expired}")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
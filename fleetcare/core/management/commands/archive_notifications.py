@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from core.archive import ARCHIVE_BATCH_SIZE, archive_notifications, notification_cutoff
+from core.models import Notification
+
+
+# python manage.py archive_notifications [--days 90] [--batch-size 1000]
+class Command(BaseCommand):
+    help = "Переносит уведомления старше срока хранения в архивную таблицу"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Срок хранения в днях (по умолчанию NOTIFICATION_RETENTION_DAYS)",
+        )
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только посчитать, сколько уведомлений будет перенесено",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = notification_cutoff(options["days"])
+        if options["dry_run"]:
+            count = Notification.objects.filter(created_at__lt=cutoff).count()
+            self.stdout.write(f"К переносу: {count} (старше {cutoff:%Y-%m-%d %H:%M})")
+            return
+        moved = archive_notifications(cutoff, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Перенесено в архив: {moved}"))
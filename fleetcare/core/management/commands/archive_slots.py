@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from core.archive import ARCHIVE_BATCH_SIZE, archive_slots, slot_cutoff
+from core.models import Appointment, Slot
+
+
+# python manage.py archive_slots [--days 30] [--batch-size 1000]
+class Command(BaseCommand):
+    help = "Переносит прошедшие слоты и их записи в архивные таблицы"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Через сколько дней после даты слота (по умолчанию SLOT_RETENTION_DAYS)",
+        )
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только посчитать, сколько слотов и записей будет перенесено",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = slot_cutoff(options["days"])
+        if options["dry_run"]:
+            slots = Slot.objects.filter(date__lt=cutoff).count()
+            appointments = Appointment.objects.filter(slot__date__lt=cutoff).count()
+            self.stdout.write(
+                f"К переносу: слотов {slots}, записей {appointments} (до {cutoff})"
+            )
+            return
+        moved = archive_slots(cutoff, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Перенесено в архив слотов: {moved}"))
@@ -0,0 +1,68 @@
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+from core.management.bench import (
+    bot_headers,
+    format_percentiles,
+    hot_paths,
+    is_error,
+)
+
+
+# Замер пропускной способности API бота внутри процесса (без сети).
+# Сравнение с пулом и без:
+#   DB_POOL=0 DB_CONN_MAX_AGE=0 python manage.py bench_api
+#   DB_POOL=0 python manage.py bench_api
+#   DB_POOL=1 python manage.py bench_api
+# Запросы идут как от бота (X-Bot-Token): без THROTTLE_BOT_TOKEN на время
+# замера задается случайный токен
+class Command(BaseCommand):
+    help = "Нагрузочный замер API бота: запросов в секунду и задержки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Путь для запросов (можно несколько), по умолчанию - горячие endpoints бота",
+        )
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or hot_paths()
+        threads = options["threads"]
+        per_thread = max(1, options["requests"] // threads)
+
+        token = settings.THROTTLE_BOT_TOKEN or secrets.token_hex(16)
+
+        def worker(offset):
+            client = Client()
+            timings, errors = [], 0
+            for i in range(per_thread):
+                headers = bot_headers(token, offset * per_thread + i)
+                started = time.perf_counter()
+                resp = client.get(paths[(offset + i) % len(paths)], headers=headers)
+                timings.append(time.perf_counter() - started)
+                errors += is_error(resp.status_code)
+            connections.close_all()
+            return timings, errors
+
+        with override_settings(THROTTLE_BOT_TOKEN=token):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                results = list(pool.map(worker, range(threads)))
+            elapsed = time.perf_counter() - started
+
+        timings = sorted(t for r in results for t in r[0])
+        errors = sum(r[1] for r in results)
+        db = settings.DATABASES["default"]
+        self.stdout.write(
+            f"БД: {db['ENGINE']}, CONN_MAX_AGE={db.get('CONN_MAX_AGE', 0)}\n"
+            f"Запросов: {len(timings)} в {threads} потоков, ошибок: {errors}\n"
+            f"{len(timings) / elapsed:.0f} req/s, {format_percentiles(timings)}"
+        )
@@ -0,0 +1,68 @@
+import asyncio
+import time
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.management.bench import bot_headers, format_percentiles, hot_paths, is_error
+
+
+# Нагрузка по HTTP на уже запущенный сервер: тысячи одновременных клиентов.
+# Сравнение WSGI и ASGI:
+#   gunicorn fleetcare.wsgi -w 4 --threads 8
+#   ASYNC_API=1 uvicorn fleetcare.asgi:application --workers 4
+#   python manage.py bench_http --base http://127.0.0.1:8000 --clients 2000
+# Запросы идут как от бота: нужен тот же THROTTLE_BOT_TOKEN, что у сервера
+# (--bot-token или из окружения), иначе сервер ограничит их по IP
+class Command(BaseCommand):
+    help = "HTTP-нагрузка на запущенный сервер: req/s и задержки при N клиентах"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base", default="http://127.0.0.1:8000")
+        parser.add_argument("--clients", type=int, default=1000)
+        parser.add_argument("--requests", type=int, default=10000)
+        parser.add_argument("--timeout", type=float, default=60)
+        parser.add_argument("--path", action="append", dest="paths")
+        parser.add_argument("--bot-token", default=settings.THROTTLE_BOT_TOKEN)
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or hot_paths()
+        if not options["bot_token"]:
+            self.stderr.write(
+                "THROTTLE_BOT_TOKEN не задан: запросы ограничиваются лимитом одного IP"
+            )
+        elapsed, timings, errors = asyncio.run(self.run(paths, options))
+        self.stdout.write(
+            f"Клиентов: {options['clients']}, запросов: {len(timings)}, "
+            f"ошибок: {errors}\n"
+            f"{len(timings) / elapsed:.0f} req/s, {format_percentiles(timings)}"
+        )
+
+    async def run(self, paths, options):
+        clients = options["clients"]
+        per_client = max(1, options["requests"] // clients)
+        timings, errors = [], 0
+        limits = httpx.Limits(
+            max_connections=clients, max_keepalive_connections=clients
+        )
+
+        async with httpx.AsyncClient(
+            base_url=options["base"], limits=limits, timeout=options["timeout"]
+        ) as client:
+
+            async def virtual_client(offset):
+                nonlocal errors
+                for i in range(per_client):
+                    headers = bot_headers(options["bot_token"], offset * per_client + i)
+                    started = time.perf_counter()
+                    try:
+                        r = await client.get(
+                            paths[(offset + i) % len(paths)], headers=headers
+                        )
+                        errors += is_error(r.status_code)
+                    except httpx.HTTPError:
+                        errors += 1
+                    timings.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(virtual_client(n) for n in range(clients)))
+            return time.perf_counter() - started, timings, errors
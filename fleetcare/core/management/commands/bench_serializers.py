@@ -0,0 +1,59 @@
+import time
+from datetime import date, time as dtime, timedelta
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from core.models import Slot, SlotStatus
+from core.renderers import ORJSONRenderer
+from core.serializers import SLOT_FAST, SlotSerializer
+
+
+# Сравнение сериализации списка слотов: ModelSerializer + JSONRenderer
+# против values_list() + ValuesSerializer + ORJSONRenderer (без обращения к БД)
+class Command(BaseCommand):
+    help = "Замер сериализации больших списков слотов (стандартный и быстрый путь)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def best_of(self, repeat, fn):
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        start = date.today()
+        slots = [
+            Slot(
+                id=i + 1,
+                date=start + timedelta(days=i // 20),
+                time=dtime(8 + i % 10, 30 * (i % 2)),
+                status=SlotStatus.FREE,
+                capacity=1 + i % 3,
+                available=1 + i % 3,
+            )
+            for i in range(options["rows"])
+        ]
+
+        # Кортежи, которые вернул бы values_list(*SLOT_FAST.lookups)
+        rows = [tuple(getattr(s, name) for name in SLOT_FAST.lookups) for s in slots]
+
+        slow, slow_bytes = self.best_of(
+            options["repeat"],
+            lambda: JSONRenderer().render(SlotSerializer(slots, many=True).data),
+        )
+        fast, fast_bytes = self.best_of(
+            options["repeat"],
+            lambda: ORJSONRenderer().render(SLOT_FAST.from_tuples(rows)),
+        )
+        self.stdout.write(
+            f"Строк: {len(slots)}, ответ {len(fast_bytes)} байт, "
+            f"совпадает: {'да' if slow_bytes == fast_bytes else 'НЕТ'}\n"
+            f"ModelSerializer + JSONRenderer: {slow * 1000:.1f} мс\n"
+            f"ValuesSerializer + ORJSONRenderer: {fast * 1000:.1f} мс "
+            f"(x{slow / fast:.1f})"
+        )
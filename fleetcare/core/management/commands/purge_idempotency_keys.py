@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.idempotency import purge_expired
+
+
+# python manage.py purge_idempotency_keys (например, раз в час по cron)
+class Command(BaseCommand):
+    help = "Удаляет истекшие ключи идемпотентности"
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Удалено ключей: {purge_expired()}"))
@@ -0,0 +1,28 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from core.rollups import rebuild_days
+from core.models import SlotHistory
+
+
+# python manage.py rebuild_utilization [--since 2025-01-01] [--until 2025-12-31]
+class Command(BaseCommand):
+    help = "Пересчитывает дневные сводки загрузки из слотов и записей"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=date.fromisoformat, default=None)
+        parser.add_argument("--until", type=date.fromisoformat, default=None)
+
+    def handle(self, *args, **options):
+        since, until = options["since"], options["until"]
+        if since is None and until is None:
+            count = rebuild_days()
+        else:
+            days = (
+                SlotHistory.objects.order_by().values_list("date", flat=True).distinct()
+            )
+            if since:
+                days = days.filter(date__gte=since)
+            if until:
+                days = days.filter(date__lte=until)
+            count = rebuild_days(list(days))
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано дней: {count}"))
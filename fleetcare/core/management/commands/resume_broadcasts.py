@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from core.broadcast import resume_broadcasts
+
+
+# python manage.py resume_broadcasts (по cron раз в несколько минут и после
+# перезапуска): продолжает рассылки, прерванные остановкой процесса
+class Command(BaseCommand):
+    help = "Продолжает рассылки, отправка которых прервалась"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Продолжено рассылок: {resume_broadcasts()}")
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.23 on 2026-10-19 18:35
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    # Индексы строятся CONCURRENTLY, без блокировки записи в таблицы
+    atomic = False
+
+    dependencies = [
+        ("core", "0002_driver_chat_id"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="automobile",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("plate_number"),
+                    name="gin_trgm_ops",
+                ),
+                name="automobile_plate_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="driver",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("last_name"),
+                    name="gin_trgm_ops",
+                ),
+                name="driver_last_name_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="driver",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("first_name"),
+                    name="gin_trgm_ops",
+                ),
+                name="driver_first_name_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="driver",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("phone"), name="gin_trgm_ops"
+                ),
+                name="driver_phone_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="notification",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("text"), name="gin_trgm_ops"
+                ),
+                name="notification_text_trgm",
+            ),
+        ),
+    ]
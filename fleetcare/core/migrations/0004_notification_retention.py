@@ -0,0 +1,54 @@
+# Generated by Django 4.2.23 on 2026-10-19 18:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_search_trgm_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationArchive",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("text", models.TextField(verbose_name="Текст")),
+                ("created_at", models.DateTimeField(verbose_name="Создано")),
+                (
+                    "archived_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="В архиве с"),
+                ),
+            ],
+            options={
+                "verbose_name": "Уведомление (архив)",
+                "verbose_name_plural": "Уведомления (архив)",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(fields=["-created_at"], name="notification_created"),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["driver", "-created_at"], name="notification_driver_created"
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationarchive",
+            name="driver",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to="core.driver"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notificationarchive",
+            index=models.Index(
+                fields=["driver", "-created_at"], name="notif_archive_driver_created"
+            ),
+        ),
+    ]
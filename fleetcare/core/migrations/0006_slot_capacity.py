@@ -0,0 +1,55 @@
+# Generated by Django 4.2.23 on 2026-10-19 18:54
+
+import django.core.validators
+from django.db import migrations, models
+
+
+# Существующие занятые слоты - без свободных мест
+def busy_slots_full(apps, schema_editor):
+    Slot = apps.get_model("core", "Slot")
+    Slot.objects.filter(status="busy").update(available=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_broadcast"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="slot",
+            name="available",
+            field=models.PositiveSmallIntegerField(
+                default=1, editable=False, verbose_name="Свободно мест"
+            ),
+        ),
+        migrations.AddField(
+            model_name="slot",
+            name="capacity",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                validators=[django.core.validators.MinValueValidator(1)],
+                verbose_name="Мест (боксов)",
+            ),
+        ),
+        migrations.RunPython(busy_slots_full, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="slot",
+            name="status",
+            field=models.CharField(
+                choices=[("free", "Свободен"), ("busy", "Занят")],
+                default="free",
+                help_text="«Занят» закрывает слот для записи целиком",
+                max_length=8,
+                verbose_name="Статус",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="slot",
+            constraint=models.CheckConstraint(
+                check=models.Q(("available__lte", models.F("capacity"))),
+                name="slot_available_lte_capacity",
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.23 on 2026-10-19 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_slot_capacity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyUtilization",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(unique=True, verbose_name="День")),
+                (
+                    "booked",
+                    models.IntegerField(default=0, verbose_name="Активных записей"),
+                ),
+                (
+                    "cancelled_user",
+                    models.IntegerField(default=0, verbose_name="Отменено водителями"),
+                ),
+                (
+                    "cancelled_manager",
+                    models.IntegerField(default=0, verbose_name="Отменено менеджерами"),
+                ),
+                ("free", models.IntegerField(default=0, verbose_name="Свободных мест")),
+            ],
+            options={
+                "verbose_name": "Загрузка за день",
+                "verbose_name_plural": "Загрузка по дням",
+                "ordering": ["-day"],
+            },
+        ),
+    ]
@@ -0,0 +1,193 @@
+# Generated by Django 4.2.23 on 2026-10-19 18:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Представления "вся история": рабочие таблицы + архив
+HISTORY_VIEWS = """
+CREATE VIEW core_slot_history AS
+    SELECT id, date, time, status, capacity, available, FALSE AS archived
+    FROM core_slot
+    UNION ALL
+    SELECT id, date, time, status, capacity, available, TRUE AS archived
+    FROM core_slotarchive;
+
+CREATE VIEW core_appointment_history AS
+    SELECT id, slot_id, driver_id, car_id, status, created_at, updated_at,
+           FALSE AS archived
+    FROM core_appointment
+    UNION ALL
+    SELECT id, slot_id, driver_id, car_id, status, created_at, updated_at,
+           TRUE AS archived
+    FROM core_appointmentarchive;
+"""
+
+DROP_HISTORY_VIEWS = """
+DROP VIEW IF EXISTS core_appointment_history;
+DROP VIEW IF EXISTS core_slot_history;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppointmentHistory",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("active", "Активна"),
+                            ("cancelled_manager", "Отменена менеджером"),
+                            ("cancelled_user", "Отменена пользователем"),
+                        ],
+                        max_length=32,
+                        verbose_name="Статус",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(verbose_name="Обновлено")),
+                ("archived", models.BooleanField(verbose_name="В архиве")),
+            ],
+            options={
+                "verbose_name": "Запись (история)",
+                "verbose_name_plural": "Записи (история)",
+                "db_table": "core_appointment_history",
+                "ordering": ["slot__date", "slot__time"],
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="SlotHistory",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("date", models.DateField(verbose_name="Дата")),
+                ("time", models.TimeField(verbose_name="Время")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("free", "Свободен"), ("busy", "Занят")],
+                        max_length=8,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "capacity",
+                    models.PositiveSmallIntegerField(verbose_name="Мест (боксов)"),
+                ),
+                (
+                    "available",
+                    models.PositiveSmallIntegerField(verbose_name="Свободно мест"),
+                ),
+                ("archived", models.BooleanField(verbose_name="В архиве")),
+            ],
+            options={
+                "verbose_name": "Слот (история)",
+                "verbose_name_plural": "Слоты (история)",
+                "db_table": "core_slot_history",
+                "ordering": ["date", "time"],
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="SlotArchive",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("date", models.DateField(verbose_name="Дата")),
+                ("time", models.TimeField(verbose_name="Время")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("free", "Свободен"), ("busy", "Занят")],
+                        max_length=8,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "capacity",
+                    models.PositiveSmallIntegerField(verbose_name="Мест (боксов)"),
+                ),
+                (
+                    "available",
+                    models.PositiveSmallIntegerField(verbose_name="Свободно мест"),
+                ),
+                (
+                    "archived_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="В архиве с"),
+                ),
+            ],
+            options={
+                "verbose_name": "Слот (архив)",
+                "verbose_name_plural": "Слоты (архив)",
+                "ordering": ["date", "time"],
+                "indexes": [
+                    models.Index(fields=["date", "time"], name="slot_archive_date")
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="AppointmentArchive",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("active", "Активна"),
+                            ("cancelled_manager", "Отменена менеджером"),
+                            ("cancelled_user", "Отменена пользователем"),
+                        ],
+                        max_length=32,
+                        verbose_name="Статус",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(verbose_name="Обновлено")),
+                (
+                    "archived_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="В архиве с"),
+                ),
+                (
+                    "car",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="core.automobile",
+                        verbose_name="Автомобиль",
+                    ),
+                ),
+                (
+                    "driver",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="core.driver",
+                        verbose_name="Водитель",
+                    ),
+                ),
+                (
+                    "slot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="core.slotarchive",
+                        verbose_name="Слот",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Запись (архив)",
+                "verbose_name_plural": "Записи (архив)",
+                "ordering": ["slot__date", "slot__time"],
+                "indexes": [
+                    models.Index(
+                        fields=["driver", "slot"], name="appt_archive_driver_slot"
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(HISTORY_VIEWS, DROP_HISTORY_VIEWS),
+    ]
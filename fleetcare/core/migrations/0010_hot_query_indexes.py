@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-19 19:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_slot_archive"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["driver", "status"], name="appointment_driver_status"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="slot",
+            index=models.Index(
+                condition=models.Q(("status", "free")),
+                fields=["date", "time"],
+                name="slot_free_date_time",
+            ),
+        ),
+        # Одиночный индекс по водителю убираем после создания составного
+        # (без пересоздания внешнего ключа, которое делает AlterField)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="appointment",
+                    name="driver",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="core.driver",
+                        verbose_name="Водитель",
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    "DROP INDEX IF EXISTS core_appointment_driver_id_cb0e4a22",
+                    "CREATE INDEX core_appointment_driver_id_cb0e4a22 "
+                    "ON core_appointment (driver_id)",
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,160 @@
+# Generated by Django 4.2.23 on 2026-10-19 19:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WaitlistEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date_from", models.DateField(verbose_name="С даты")),
+                ("date_to", models.DateField(verbose_name="По дату")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("waiting", "В очереди"),
+                            ("offered", "Предложено место"),
+                            ("booked", "Записан"),
+                            ("cancelled", "Покинул очередь"),
+                        ],
+                        default="waiting",
+                        max_length=16,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="В очереди с"
+                    ),
+                ),
+                (
+                    "driver",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="waitlist",
+                        to="core.driver",
+                        verbose_name="Водитель",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Заявка в листе ожидания",
+                "verbose_name_plural": "Лист ожидания",
+                "ordering": ["created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="WaitlistOffer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ждет ответа"),
+                            ("accepted", "Принято"),
+                            ("declined", "Отклонено"),
+                            ("expired", "Истекло"),
+                            ("taken", "Место уже занято"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Предложено"
+                    ),
+                ),
+                ("expires_at", models.DateTimeField(verbose_name="Действует до")),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="offers",
+                        to="core.waitlistentry",
+                        verbose_name="Заявка",
+                    ),
+                ),
+                (
+                    "slot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="waitlist_offers",
+                        to="core.slot",
+                        verbose_name="Слот",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Предложение места",
+                "verbose_name_plural": "Предложения мест",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "pending")),
+                        fields=["expires_at"],
+                        name="waitlist_offer_pending",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="waitlistoffer",
+            constraint=models.UniqueConstraint(
+                fields=("entry", "slot"), name="waitlist_offer_once"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="waitlistentry",
+            index=models.Index(
+                condition=models.Q(("status", "waiting")),
+                fields=["created_at", "date_from", "date_to"],
+                name="waitlist_queue",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="waitlistentry",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["waiting", "offered"])),
+                fields=("driver",),
+                name="waitlist_one_active_per_driver",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="waitlistentry",
+            constraint=models.CheckConstraint(
+                check=models.Q(("date_from__lte", models.F("date_to"))),
+                name="waitlist_date_range",
+            ),
+        ),
+    ]
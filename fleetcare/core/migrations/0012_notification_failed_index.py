@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-19 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_waitlist"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                condition=models.Q(("delivered", False)),
+                fields=["created_at"],
+                name="notification_failed",
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.23 on 2026-10-19 19:35
+
+from django.db import migrations
+
+# Пробег следующего ТО считает сама БД: триггер пересчитывает его при любой
+# вставке и изменении строки, в том числе при queryset.update() и bulk_update
+NEXT_SERVICE_TRIGGER = """
+CREATE FUNCTION core_automobile_next_service() RETURNS trigger AS $$
+BEGIN
+    NEW.next_service_mileage := NEW.last_service_mileage + NEW.service_interval_km;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER automobile_next_service
+    BEFORE INSERT OR UPDATE ON core_automobile
+    FOR EACH ROW EXECUTE FUNCTION core_automobile_next_service();
+
+UPDATE core_automobile
+SET next_service_mileage = last_service_mileage + service_interval_km
+WHERE next_service_mileage <> last_service_mileage + service_interval_km;
+"""
+
+DROP_NEXT_SERVICE_TRIGGER = """
+DROP TRIGGER IF EXISTS automobile_next_service ON core_automobile;
+DROP FUNCTION IF EXISTS core_automobile_next_service();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_notification_failed_index"),
+    ]
+
+    operations = [
+        migrations.RunSQL(NEXT_SERVICE_TRIGGER, DROP_NEXT_SERVICE_TRIGGER),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.23 on 2026-10-19 19:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_next_service_trigger"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="appointment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("active", "Активна"),
+                    ("cancelled_manager", "Отменена менеджером"),
+                    ("cancelled_user", "Отменена пользователем"),
+                    ("completed", "Выполнена"),
+                ],
+                default="active",
+                max_length=32,
+                verbose_name="Статус",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="appointmentarchive",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("active", "Активна"),
+                    ("cancelled_manager", "Отменена менеджером"),
+                    ("cancelled_user", "Отменена пользователем"),
+                    ("completed", "Выполнена"),
+                ],
+                max_length=32,
+                verbose_name="Статус",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ServiceRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата ТО")),
+                ("mileage", models.PositiveIntegerField(verbose_name="Пробег")),
+                ("work_done", models.TextField(verbose_name="Выполненные работы")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создано"),
+                ),
+                (
+                    "appointment",
+                    models.OneToOneField(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="service_record",
+                        to="core.appointmenthistory",
+                        verbose_name="Запись на ТО",
+                    ),
+                ),
+                (
+                    "car",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="service_records",
+                        to="core.automobile",
+                        verbose_name="Автомобиль",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Выполненное ТО",
+                "verbose_name_plural": "История ТО",
+                "ordering": ["-date", "-id"],
+                "indexes": [
+                    models.Index(
+                        fields=["car", "-date", "-id"], name="service_car_date"
+                    ),
+                    models.Index(fields=["-date", "-id"], name="service_date"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,335 @@
+# Generated by Django 4.2.23 on 2026-10-19 19:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Существующие данные переходят в компанию по умолчанию (id=1): колонки
+# tenant добавляются со значением по умолчанию, без перезаписи таблиц
+DEFAULT_TENANT = """
+INSERT INTO core_tenant (id, name, slug, created_at)
+VALUES (1, 'Основная компания', 'default', now());
+SELECT setval(pg_get_serial_sequence('core_tenant', 'id'), 1);
+"""
+
+# Представления истории (0009) - с компанией
+HISTORY_VIEWS = """
+CREATE VIEW core_slot_history AS
+    SELECT id, tenant_id, date, time, status, capacity, available,
+           FALSE AS archived
+    FROM core_slot
+    UNION ALL
+    SELECT id, tenant_id, date, time, status, capacity, available,
+           TRUE AS archived
+    FROM core_slotarchive;
+
+CREATE VIEW core_appointment_history AS
+    SELECT id, tenant_id, slot_id, driver_id, car_id, status, created_at,
+           updated_at, FALSE AS archived
+    FROM core_appointment
+    UNION ALL
+    SELECT id, tenant_id, slot_id, driver_id, car_id, status, created_at,
+           updated_at, TRUE AS archived
+    FROM core_appointmentarchive;
+"""
+
+OLD_HISTORY_VIEWS = """
+CREATE VIEW core_slot_history AS
+    SELECT id, date, time, status, capacity, available, FALSE AS archived
+    FROM core_slot
+    UNION ALL
+    SELECT id, date, time, status, capacity, available, TRUE AS archived
+    FROM core_slotarchive;
+
+CREATE VIEW core_appointment_history AS
+    SELECT id, slot_id, driver_id, car_id, status, created_at, updated_at,
+           FALSE AS archived
+    FROM core_appointment
+    UNION ALL
+    SELECT id, slot_id, driver_id, car_id, status, created_at, updated_at,
+           TRUE AS archived
+    FROM core_appointmentarchive;
+"""
+
+DROP_HISTORY_VIEWS = """
+DROP VIEW IF EXISTS core_appointment_history;
+DROP VIEW IF EXISTS core_slot_history;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("core", "0014_service_records"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tenant",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=128, verbose_name="Название")),
+                ("slug", models.SlugField(unique=True, verbose_name="Код")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создано"),
+                ),
+            ],
+            options={
+                "verbose_name": "Компания",
+                "verbose_name_plural": "Компании",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AddField(
+            model_name="tenant",
+            name="managers",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="tenants",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Менеджеры",
+            ),
+        ),
+        migrations.RunSQL(DEFAULT_TENANT, migrations.RunSQL.noop),
+        migrations.RunSQL(DROP_HISTORY_VIEWS, OLD_HISTORY_VIEWS),
+        migrations.AddField(
+            model_name="appointment",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="appointmentarchive",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="automobile",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="broadcast",
+            name="tenant",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+        ),
+        migrations.AddField(
+            model_name="dailyutilization",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="driver",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="notificationarchive",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="servicerecord",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="slot",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="slotarchive",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="waitlistentry",
+            name="tenant",
+            field=models.ForeignKey(
+                db_index=False,
+                default=1,
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="core.tenant",
+                verbose_name="Компания",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name="automobile",
+            name="plate_number",
+            field=models.CharField(max_length=16, verbose_name="Госномер"),
+        ),
+        migrations.AlterField(
+            model_name="dailyutilization",
+            name="day",
+            field=models.DateField(verbose_name="День"),
+        ),
+        migrations.AlterUniqueTogether(
+            name="slot",
+            unique_together=set(),
+        ),
+        migrations.RemoveIndex(
+            model_name="slot",
+            name="slot_free_date_time",
+        ),
+        migrations.RemoveIndex(
+            model_name="waitlistentry",
+            name="waitlist_queue",
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["tenant", "status"], name="appointment_tenant_status"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="driver",
+            index=models.Index(
+                fields=["tenant", "last_name", "first_name"], name="driver_tenant_name"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["tenant", "-created_at"], name="notification_tenant_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="servicerecord",
+            index=models.Index(
+                fields=["tenant", "-date", "-id"], name="service_tenant_date"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="slot",
+            index=models.Index(
+                condition=models.Q(("status", "free")),
+                fields=["tenant", "date", "time"],
+                name="slot_free_date_time",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="waitlistentry",
+            index=models.Index(
+                condition=models.Q(("status", "waiting")),
+                fields=["tenant", "created_at", "date_from", "date_to"],
+                name="waitlist_queue",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="automobile",
+            constraint=models.UniqueConstraint(
+                fields=("tenant", "plate_number"), name="automobile_tenant_plate"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyutilization",
+            constraint=models.UniqueConstraint(
+                fields=("tenant", "day"), name="utilization_tenant_day"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="slot",
+            unique_together={("tenant", "date", "time")},
+        ),
+        migrations.RunSQL(HISTORY_VIEWS, DROP_HISTORY_VIEWS),
+    ]
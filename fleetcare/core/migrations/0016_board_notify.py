@@ -0,0 +1,76 @@
+# Generated by Django 4.2.23 on 2026-10-19 20:05
+
+from django.db import migrations
+
+# Табло записей на сегодня (core/board.py) слушает канал fleetcare_board.
+# Триггеры шлют NOTIFY при любом изменении записи или слота, в том числе при
+# queryset.update() и условном UPDATE мест в слоте. Уведомление уходит при
+# COMMIT (откаченные изменения не видны), только для слотов на вчера-завтра:
+# точный "сегодня" в часовом поясе сервиса проверяет приложение, а массовые
+# операции с будущими и архивными слотами канал не нагружают
+BOARD_TRIGGERS = """
+CREATE FUNCTION core_slot_board_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+        RETURN NULL;
+    END IF;
+    IF NEW.date BETWEEN current_date - 1 AND current_date + 1
+        OR OLD.date BETWEEN current_date - 1 AND current_date + 1 THEN
+        PERFORM pg_notify('fleetcare_board', json_build_object(
+            'kind', 'slot',
+            'op', TG_OP,
+            'id', COALESCE(NEW.id, OLD.id),
+            'tenant', COALESCE(NEW.tenant_id, OLD.tenant_id)
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION core_appointment_board_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+        RETURN NULL;
+    END IF;
+    IF EXISTS (
+        SELECT 1 FROM core_slot
+        WHERE id IN (NEW.slot_id, OLD.slot_id)
+            AND date BETWEEN current_date - 1 AND current_date + 1
+    ) THEN
+        PERFORM pg_notify('fleetcare_board', json_build_object(
+            'kind', 'appointment',
+            'op', TG_OP,
+            'id', COALESCE(NEW.id, OLD.id),
+            'tenant', COALESCE(NEW.tenant_id, OLD.tenant_id)
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER slot_board_notify
+    AFTER INSERT OR UPDATE OR DELETE ON core_slot
+    FOR EACH ROW EXECUTE FUNCTION core_slot_board_notify();
+
+CREATE TRIGGER appointment_board_notify
+    AFTER INSERT OR UPDATE OR DELETE ON core_appointment
+    FOR EACH ROW EXECUTE FUNCTION core_appointment_board_notify();
+"""
+
+DROP_BOARD_TRIGGERS = """
+DROP TRIGGER IF EXISTS appointment_board_notify ON core_appointment;
+DROP TRIGGER IF EXISTS slot_board_notify ON core_slot;
+DROP FUNCTION IF EXISTS core_appointment_board_notify();
+DROP FUNCTION IF EXISTS core_slot_board_notify();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0015_tenants"),
+    ]
+
+    operations = [
+        migrations.RunSQL(BOARD_TRIGGERS, DROP_BOARD_TRIGGERS),
+    ]
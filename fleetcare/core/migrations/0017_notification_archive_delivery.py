@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-19 20:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0016_board_notify"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notificationarchive",
+            name="broadcast",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="archived_notifications",
+                to="core.broadcast",
+                verbose_name="Рассылка",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationarchive",
+            name="delivered",
+            field=models.BooleanField(blank=True, null=True, verbose_name="Доставлено"),
+        ),
+    ]
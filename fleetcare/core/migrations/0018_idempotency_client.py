@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-19 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0017_notification_archive_delivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="client",
+            field=models.CharField(
+                blank=True, default="", max_length=80, verbose_name="Клиент"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="idempotencykey",
+            name="key",
+            field=models.CharField(max_length=64, verbose_name="Ключ"),
+        ),
+        migrations.AddConstraint(
+            model_name="idempotencykey",
+            constraint=models.UniqueConstraint(
+                fields=("client", "key"), name="idempotency_client_key"
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.23 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0018_idempotency_client"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="broadcast",
+            name="progress_at",
+            field=models.DateTimeField(
+                editable=False, null=True, verbose_name="Прогресс"
+            ),
+        ),
+        migrations.AddField(
+            model_name="broadcast",
+            name="recipients",
+            field=models.JSONField(
+                default=list, editable=False, verbose_name="Получатели"
+            ),
+        ),
+    ]
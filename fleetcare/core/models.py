@@ -1,9 +1,14 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
 import os
 import httpx
 from django.utils import timezone
+from .telegram import api_url as telegram_api_url
 
 
 # Для слота
@@ -17,11 +22,64 @@ class AppointmentStatus(models.TextChoices):
     ACTIVE = "active", _("Активна")
     CANCELLED_MANAGER = "cancelled_manager", _("Отменена менеджером")
     CANCELLED_USER = "cancelled_user", _("Отменена пользователем")
+    COMPLETED = "completed", _("Выполнена")
+
+
+# Компания-клиент: свой автопарк, водители, слоты и записи.
+# Менеджеры компании видят в админке только ее данные
+class Tenant(models.Model):
+    name = models.CharField("Название", max_length=128)
+    slug = models.SlugField("Код", unique=True)
+    managers = models.ManyToManyField(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        related_name="tenants",
+        verbose_name="Менеджеры",
+    )
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Компания"
+        verbose_name_plural = "Компании"
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+# Выборки в пределах компании: одна компания (API, бот) или компании
+# менеджера (админка, None - все компании)
+class TenantQuerySet(models.QuerySet):
+    def for_tenant(self, tenant):
+        return self.filter(tenant=tenant)
+
+    def for_tenants(self, tenant_ids):
+        return self if tenant_ids is None else self.filter(tenant__in=tenant_ids)
+
+
+TenantManager = models.Manager.from_queryset(TenantQuerySet)
+
+
+# Компания объекта, у которого она определяется водителем или автомобилем.
+# Индекс по ней - в составных индексах модели (первой колонкой)
+def derived_tenant():
+    return models.ForeignKey(
+        Tenant,
+        on_delete=models.PROTECT,
+        editable=False,
+        db_index=False,
+        verbose_name="Компания",
+    )
 
 
 # Автомобиль
 class Automobile(models.Model):
-    plate_number = models.CharField("Госномер", max_length=16, unique=True)
+
+    # Отдельный индекс не нужен: его заменяет уникальный (tenant, plate_number)
+    tenant = models.ForeignKey(
+        Tenant, on_delete=models.PROTECT, verbose_name="Компания", db_index=False
+    )
+    plate_number = models.CharField("Госномер", max_length=16)
     make = models.CharField("Марка", max_length=64)
     model = models.CharField("Модель", max_length=64)
     last_service_mileage = models.PositiveIntegerField(
@@ -30,16 +88,33 @@ class Automobile(models.Model):
     service_interval_km = models.PositiveIntegerField(
         "Интервал ТО км", default=10000, validators=[MinValueValidator(1000)]
     )
+    # Считается в БД триггером (миграция 0013) при любой записи строки, поэтому
+    # массовые update()/bulk_update пробега и интервала не оставляют его устаревшим
     next_service_mileage = models.PositiveIntegerField(
         "Пробег следующего ТО", editable=False, default=0
     )
     created_at = models.DateTimeField("Создано", auto_now_add=True)
     updated_at = models.DateTimeField("Обновлено", auto_now=True)
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Автомобиль"
         verbose_name_plural = "Автомобили"
         ordering = ["plate_number"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["tenant", "plate_number"], name="automobile_tenant_plate"
+            ),
+        ]
+
+        # Триграммный индекс под icontains и нечеткий поиск по госномеру
+        indexes = [
+            GinIndex(
+                OpClass(Upper("plate_number"), name="gin_trgm_ops"),
+                name="automobile_plate_trgm",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.plate_number} {self.make} {self.model}"
@@ -51,7 +126,7 @@ class Automobile(models.Model):
 
     def save(self, *args, **kwargs):
 
-        # Гарантия перерасчета при каждом сохранении
+        # То же значение, что запишет триггер, - чтобы объект не перечитывать
         self.recalc_next_service()
         super().save(*args, **kwargs)
 
@@ -59,9 +134,17 @@ class Automobile(models.Model):
 # Водитель
 class Driver(models.Model):
 
+    # Отдельный индекс не нужен: его заменяет (tenant, last_name, first_name)
+    tenant = models.ForeignKey(
+        Tenant, on_delete=models.PROTECT, verbose_name="Компания", db_index=False
+    )
+
     # Привязка один к одному к автомобилю
     first_name = models.CharField("Имя", max_length=64)
     last_name = models.CharField("Фамилия", max_length=64)
+
+    # Телефон уникален во всех компаниях: по нему бот узнает водителя,
+    # а по водителю - компанию
     phone = models.CharField("Телефон", max_length=32, unique=True)
     car = models.OneToOneField(
         Automobile,
@@ -71,38 +154,156 @@ class Driver(models.Model):
     )
     chat_id = models.BigIntegerField("Telegram chat ID", null=True, blank=True)
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Водитель"
         verbose_name_plural = "Водители"
         ordering = ["last_name", "first_name"]
 
+        # Список водителей компании и триграммные индексы для поиска
+        # в админке и /api/search/
+        indexes = [
+            models.Index(
+                fields=["tenant", "last_name", "first_name"], name="driver_tenant_name"
+            ),
+            GinIndex(
+                OpClass(Upper("last_name"), name="gin_trgm_ops"),
+                name="driver_last_name_trgm",
+            ),
+            GinIndex(
+                OpClass(Upper("first_name"), name="gin_trgm_ops"),
+                name="driver_first_name_trgm",
+            ),
+            GinIndex(
+                OpClass(Upper("phone"), name="gin_trgm_ops"),
+                name="driver_phone_trgm",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.last_name} {self.first_name}"
 
+    def clean(self):
+
+        # Автомобиль - той же компании, что и водитель
+        if self.tenant_id and self.car_id and self.car.tenant_id != self.tenant_id:
+            from django.core.exceptions import ValidationError
+
+            raise ValidationError("Автомобиль относится к другой компании")
+
 
 # Слот
 class Slot(models.Model):
+
+    # Отдельный индекс не нужен: его заменяет уникальный (tenant, date, time)
+    tenant = models.ForeignKey(
+        Tenant, on_delete=models.PROTECT, verbose_name="Компания", db_index=False
+    )
     date = models.DateField("Дата")
     time = models.TimeField("Время")
     status = models.CharField(
-        "Статус", max_length=8, choices=SlotStatus.choices, default=SlotStatus.FREE
+        "Статус",
+        max_length=8,
+        choices=SlotStatus.choices,
+        default=SlotStatus.FREE,
+        help_text="«Занят» закрывает слот для записи целиком",
     )
 
+    # Число боксов на это время и сколько из них еще свободно
+    capacity = models.PositiveSmallIntegerField(
+        "Мест (боксов)", default=1, validators=[MinValueValidator(1)]
+    )
+    available = models.PositiveSmallIntegerField(
+        "Свободно мест", default=1, editable=False
+    )
+
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Слот для записи"
         verbose_name_plural = "Слоты для записи"
-        unique_together = [("date", "time")]
+        unique_together = [("tenant", "date", "time")]
         ordering = ["date", "time"]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(available__lte=F("capacity")),
+                name="slot_available_lte_capacity",
+            ),
+        ]
+
+        # Бот читает только свободные слоты компании (список на дату, свободные
+        # даты): частичный индекс по ним, запросы без статуса покрывает
+        # уникальный (tenant, date, time)
+        indexes = [
+            models.Index(
+                fields=["tenant", "date", "time"],
+                condition=Q(status=SlotStatus.FREE),
+                name="slot_free_date_time",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.date} {self.time}"
 
+    def recalc_available(self):
+
+        # Свободные места: вместимость минус активные записи, у закрытого слота - 0
+        active = (
+            Appointment.objects.filter(
+                slot_id=self.pk, status=AppointmentStatus.ACTIVE
+            ).count()
+            if self.pk
+            else 0
+        )
+        self.available = (
+            max(self.capacity - active, 0) if self.status == SlotStatus.FREE else 0
+        )
+        if self.available == 0:
+            self.status = SlotStatus.BUSY
+
+    def save(self, *args, **kwargs):
+
+        # Места пересчитываются при каждом сохранении из админки/форм
+        self.recalc_available()
+        super().save(*args, **kwargs)
+
+    # Занять место: условный UPDATE без предварительной блокировки строки.
+    # Возвращает False, если свободных мест уже нет
+    @staticmethod
+    def take_place(slot_id) -> bool:
+        return (
+            Slot.objects.filter(
+                pk=slot_id, status=SlotStatus.FREE, available__gt=0
+            ).update(
+                available=F("available") - 1,
+                status=Case(
+                    When(available=1, then=Value(SlotStatus.BUSY)),
+                    default=Value(SlotStatus.FREE),
+                ),
+            )
+            == 1
+        )
+
+    # Вернуть место при отмене записи
+    @staticmethod
+    def release_place(slot_id) -> bool:
+        return (
+            Slot.objects.filter(pk=slot_id, available__lt=F("capacity")).update(
+                available=F("available") + 1, status=SlotStatus.FREE
+            )
+            == 1
+        )
+
 
 # Запись
 class Appointment(models.Model):
+    tenant = derived_tenant()
     slot = models.ForeignKey(Slot, on_delete=models.PROTECT, verbose_name="Слот")
+
+    # Отдельный индекс не нужен: его заменяет (driver, status) из Meta
     driver = models.ForeignKey(
-        Driver, on_delete=models.PROTECT, verbose_name="Водитель"
+        Driver, on_delete=models.PROTECT, verbose_name="Водитель", db_index=False
     )
     car = models.ForeignKey(
         Automobile, on_delete=models.PROTECT, verbose_name="Автомобиль"
@@ -116,11 +317,20 @@ class Appointment(models.Model):
     created_at = models.DateTimeField("Создано", auto_now_add=True)
     updated_at = models.DateTimeField("Обновлено", auto_now=True)
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Запись"
         verbose_name_plural = "Записи"
         ordering = ["slot__date", "slot__time"]
 
+        # Записи водителя по статусу (active_by_phone, кабинет водителя)
+        # и записи компании по статусу (админка, сводка на главной)
+        indexes = [
+            models.Index(fields=["driver", "status"], name="appointment_driver_status"),
+            models.Index(fields=["tenant", "status"], name="appointment_tenant_status"),
+        ]
+
     def __str__(self):
         return f"{self.slot} — {self.driver} — {self.car}"
 
@@ -132,83 +342,608 @@ class Appointment(models.Model):
 
             raise ValidationError("Выбранный автомобиль не привязан к этому водителю")
 
+        # Слот - той же компании, что и водитель
+        if self.slot_id and self.driver_id:
+            self.check_tenant()
+
         # Проверка доступности слота
-        if self.slot and self.id is None and self.slot.status != SlotStatus.FREE:
+        if (
+            self.slot
+            and self.id is None
+            and (self.slot.status != SlotStatus.FREE or self.slot.available <= 0)
+        ):
             from django.core.exceptions import ValidationError
 
             raise ValidationError("Выбранный слот уже занят")
 
+    # Компания записи - компания водителя, записаться можно только на ее слоты
+    def check_tenant(self):
+        self.tenant_id = self.driver.tenant_id
+        if self.slot.tenant_id != self.tenant_id:
+            from django.core.exceptions import ValidationError
+
+            raise ValidationError("Слот относится к другой компании")
+
     def save(self, *args, **kwargs):
+        self.check_tenant()
 
-        # Автоматическое управление статусом слота
+        # Автоматическое управление местами в слоте
         creating = self.id is None
         prev = None
         if not creating:
             prev = Appointment.objects.get(pk=self.id)
+        was_active = prev is not None and prev.status == AppointmentStatus.ACTIVE
+        taking = self.status == AppointmentStatus.ACTIVE and not was_active
+        cancelled = (
+            prev is not None
+            and prev.status != self.status
+            and self.status
+            in (AppointmentStatus.CANCELLED_MANAGER, AppointmentStatus.CANCELLED_USER)
+        )
+        from .rollups import STATUS_FIELDS, bump_day
+
+        with transaction.atomic():
+
+            # Новая активная запись занимает место в слоте
+            if taking and not Slot.take_place(self.slot_id):
+                from django.core.exceptions import ValidationError
+
+                raise ValidationError("Выбранный слот уже занят")
+            super().save(*args, **kwargs)
+
+            # Если статус изменен на отмену то освобождаем место
+            released = cancelled and was_active and Slot.release_place(self.slot_id)
+
+            # Сводка загрузки дня: запись переходит между счетчиками статусов
+            if prev is None or prev.status != self.status:
+                deltas = {
+                    STATUS_FIELDS[self.status]: 1,
+                    "free": int(released) - int(taking),
+                }
+                if prev is not None:
+                    field = STATUS_FIELDS[prev.status]
+                    deltas[field] = deltas.get(field, 0) - 1
+                bump_day(self.tenant_id, self.slot.date, **deltas)
+        if taking or cancelled:
+            self.slot.refresh_from_db(fields=["available", "status"])
+        if cancelled:
+            send_bot_notification(
+                self.driver,
+                f"Ваша запись на {self.slot.date} {self.slot.time} отменена",
+            )
+
+        # Освободившееся место - следующему водителю из листа ожидания
+        if released:
+            from .waitlist import place_released
+
+            transaction.on_commit(lambda: place_released(self.slot_id))
+
+
+# Лист ожидания
+class WaitlistStatus(models.TextChoices):
+    WAITING = "waiting", _("В очереди")
+    OFFERED = "offered", _("Предложено место")
+    BOOKED = "booked", _("Записан")
+    CANCELLED = "cancelled", _("Покинул очередь")
+
+
+class OfferStatus(models.TextChoices):
+    PENDING = "pending", _("Ждет ответа")
+    ACCEPTED = "accepted", _("Принято")
+    DECLINED = "declined", _("Отклонено")
+    EXPIRED = "expired", _("Истекло")
+    TAKEN = "taken", _("Место уже занято")
+
+
+# Заявка водителя в листе ожидания на дату или диапазон дат.
+# Очередь - по времени постановки, действующая заявка у водителя одна
+class WaitlistEntry(models.Model):
+    tenant = derived_tenant()
+    driver = models.ForeignKey(
+        Driver,
+        on_delete=models.CASCADE,
+        related_name="waitlist",
+        verbose_name="Водитель",
+    )
+    date_from = models.DateField("С даты")
+    date_to = models.DateField("По дату")
+    status = models.CharField(
+        "Статус",
+        max_length=16,
+        choices=WaitlistStatus.choices,
+        default=WaitlistStatus.WAITING,
+    )
+    created_at = models.DateTimeField("В очереди с", default=timezone.now)
+
+    objects = TenantManager()
+
+    class Meta:
+        verbose_name = "Заявка в листе ожидания"
+        verbose_name_plural = "Лист ожидания"
+        ordering = ["created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["driver"],
+                condition=Q(
+                    status__in=[WaitlistStatus.WAITING, WaitlistStatus.OFFERED]
+                ),
+                name="waitlist_one_active_per_driver",
+            ),
+            models.CheckConstraint(
+                check=Q(date_from__lte=F("date_to")), name="waitlist_date_range"
+            ),
+        ]
+
+        # Подбор следующего водителя: ожидающие компании в порядке очереди,
+        # диапазон дат проверяется по индексу, без чтения строк
+        indexes = [
+            models.Index(
+                fields=["tenant", "created_at", "date_from", "date_to"],
+                condition=Q(status=WaitlistStatus.WAITING),
+                name="waitlist_queue",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.driver}: {self.date_from} — {self.date_to}"
+
+    def save(self, *args, **kwargs):
+
+        # Очередь - в пределах компании водителя
+        if self.tenant_id is None:
+            self.tenant_id = self.driver.tenant_id
         super().save(*args, **kwargs)
 
-        # Если новая активная запись то занимаем слот
-        if creating and self.status == AppointmentStatus.ACTIVE:
-            if self.slot.status != SlotStatus.BUSY:
-                self.slot.status = SlotStatus.BUSY
-                self.slot.save(update_fields=["status"])
-
-        # Если статус изменен на отмену то освобождаем слот
-        if prev and prev.status != self.status:
-            if self.status in (
-                AppointmentStatus.CANCELLED_MANAGER,
-                AppointmentStatus.CANCELLED_USER,
-            ):
-                if self.slot.status != SlotStatus.FREE:
-                    self.slot.status = SlotStatus.FREE
-                    self.slot.save(update_fields=["status"])
-                send_bot_notification(
-                    self.driver,
-                    f"Ваша запись на {self.slot.date} {self.slot.time} отменена",
-                )
+
+# Предложение освободившегося места водителю из листа ожидания
+class WaitlistOffer(models.Model):
+    entry = models.ForeignKey(
+        WaitlistEntry,
+        on_delete=models.CASCADE,
+        related_name="offers",
+        verbose_name="Заявка",
+    )
+    slot = models.ForeignKey(
+        Slot,
+        on_delete=models.CASCADE,
+        related_name="waitlist_offers",
+        verbose_name="Слот",
+    )
+    status = models.CharField(
+        "Статус",
+        max_length=16,
+        choices=OfferStatus.choices,
+        default=OfferStatus.PENDING,
+    )
+    created_at = models.DateTimeField("Предложено", default=timezone.now)
+    expires_at = models.DateTimeField("Действует до")
+
+    class Meta:
+        verbose_name = "Предложение места"
+        verbose_name_plural = "Предложения мест"
+        ordering = ["-created_at"]
+
+        # Один слот предлагается водителю не больше одного раза
+        constraints = [
+            models.UniqueConstraint(
+                fields=["entry", "slot"], name="waitlist_offer_once"
+            ),
+        ]
+
+        # Истекающие предложения (advance_waitlist)
+        indexes = [
+            models.Index(
+                fields=["expires_at"],
+                condition=Q(status=OfferStatus.PENDING),
+                name="waitlist_offer_pending",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.slot} → {self.entry.driver}"
+
+
+# Сохраненные ответы для повторов запросов с заголовком Idempotency-Key
+class IdempotencyKey(models.Model):
+    client = models.CharField("Клиент", max_length=80, default="", blank=True)
+    key = models.CharField("Ключ", max_length=64)
+    fingerprint = models.CharField("Хэш запроса", max_length=64)
+    status_code = models.PositiveSmallIntegerField("Код ответа", null=True)
+    response = models.JSONField("Ответ", null=True)
+    created_at = models.DateTimeField("Создано", default=timezone.now)
+    expires_at = models.DateTimeField("Истекает", db_index=True)
+
+    class Meta:
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["client", "key"], name="idempotency_client_key"
+            ),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+# Дневная сводка загрузки сервиса (по дате слотов), ведется core.rollups
+class DailyUtilization(models.Model):
+    tenant = derived_tenant()
+    day = models.DateField("День")
+    booked = models.IntegerField("Активных записей", default=0)
+    cancelled_user = models.IntegerField("Отменено водителями", default=0)
+    cancelled_manager = models.IntegerField("Отменено менеджерами", default=0)
+    free = models.IntegerField("Свободных мест", default=0)
+
+    objects = TenantManager()
+
+    class Meta:
+        verbose_name = "Загрузка за день"
+        verbose_name_plural = "Загрузка по дням"
+        ordering = ["-day"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["tenant", "day"], name="utilization_tenant_day"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day}"
+
+    @property
+    def utilization(self):
+        total = self.booked + self.free
+        return self.booked / total if total else None
+
+
+# Статус рассылки
+class BroadcastStatus(models.TextChoices):
+    QUEUED = "queued", _("В очереди")
+    RUNNING = "running", _("Отправляется")
+    DONE = "done", _("Завершена")
+    FAILED = "failed", _("Ошибка")
+
+
+# Рассылка менеджера водителям (прогресс обновляется по ходу отправки)
+class Broadcast(models.Model):
+
+    # Пусто - рассылка по водителям нескольких компаний (суперпользователь)
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.PROTECT,
+        null=True,
+        editable=False,
+        verbose_name="Компания",
+    )
+    text = models.TextField("Текст")
+    status = models.CharField(
+        "Статус",
+        max_length=8,
+        choices=BroadcastStatus.choices,
+        default=BroadcastStatus.QUEUED,
+    )
+    total = models.PositiveIntegerField("Получателей", default=0)
+    sent = models.PositiveIntegerField("Доставлено", default=0)
+    failed = models.PositiveIntegerField("Ошибок", default=0)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    finished_at = models.DateTimeField("Завершено", null=True, blank=True)
+
+    # id водителей-получателей и время последней записанной пачки: по ним
+    # прерванная рассылка продолжается (core.broadcast.resume_broadcasts)
+    recipients = models.JSONField("Получатели", default=list, editable=False)
+    progress_at = models.DateTimeField("Прогресс", null=True, editable=False)
+
+    class Meta:
+        verbose_name = "Рассылка"
+        verbose_name_plural = "Рассылки"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M} {self.text[:32]}"
 
 
 # Простая модель уведомлений
 class Notification(models.Model):
+    tenant = derived_tenant()
     driver = models.ForeignKey(Driver, on_delete=models.CASCADE)
     text = models.TextField("Текст")
     created_at = models.DateTimeField("Создано", auto_now_add=True)
 
+    # Для сообщений рассылки: какая рассылка и дошло ли сообщение
+    broadcast = models.ForeignKey(
+        Broadcast,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="notifications",
+        verbose_name="Рассылка",
+    )
+    delivered = models.BooleanField("Доставлено", null=True, blank=True)
+
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Уведомление"
         verbose_name_plural = "Уведомления"
         ordering = ["-created_at"]
 
+        # Триграммный индекс для поиска по тексту уведомления,
+        # индексы под ленту в админке (всех компаний и одной компании)
+        # и историю по водителю
+        indexes = [
+            GinIndex(
+                OpClass(Upper("text"), name="gin_trgm_ops"),
+                name="notification_text_trgm",
+            ),
+            models.Index(fields=["-created_at"], name="notification_created"),
+            models.Index(
+                fields=["tenant", "-created_at"], name="notification_tenant_created"
+            ),
+            models.Index(
+                fields=["driver", "-created_at"], name="notification_driver_created"
+            ),
+            # Недоставленные сообщения (сводка на главной странице админки)
+            models.Index(
+                fields=["created_at"],
+                condition=Q(delivered=False),
+                name="notification_failed",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.created_at} {self.driver} {self.text[:32]}"
 
+    def save(self, *args, **kwargs):
+        if self.tenant_id is None:
+            self.tenant_id = self.driver.tenant_id
+        super().save(*args, **kwargs)
 
-# Отправка уведомления водителю в Telegram и запись в журнал Notification
-def send_bot_notification(driver: "Driver", text: str):
 
-    # 1. Сохраняем уведомление в БД (для менеджера в админке)
+# Архив старых уведомлений (переносится командой archive_notifications)
+class NotificationArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    tenant = derived_tenant()
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE)
+    text = models.TextField("Текст")
+    created_at = models.DateTimeField("Создано")
+    broadcast = models.ForeignKey(
+        Broadcast,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="archived_notifications",
+        verbose_name="Рассылка",
+    )
+    delivered = models.BooleanField("Доставлено", null=True, blank=True)
+    archived_at = models.DateTimeField("В архиве с", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Уведомление (архив)"
+        verbose_name_plural = "Уведомления (архив)"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["driver", "-created_at"], name="notif_archive_driver_created"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.created_at} {self.driver} {self.text[:32]}"
+
+
+# Архив прошедших слотов и их записей (переносится командой archive_slots).
+# id сохраняются, поэтому архивные записи ссылаются на архивные слоты
+class SlotArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    tenant = derived_tenant()
+    date = models.DateField("Дата")
+    time = models.TimeField("Время")
+    status = models.CharField("Статус", max_length=8, choices=SlotStatus.choices)
+    capacity = models.PositiveSmallIntegerField("Мест (боксов)")
+    available = models.PositiveSmallIntegerField("Свободно мест")
+    archived_at = models.DateTimeField("В архиве с", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Слот (архив)"
+        verbose_name_plural = "Слоты (архив)"
+        ordering = ["date", "time"]
+        indexes = [models.Index(fields=["date", "time"], name="slot_archive_date")]
+
+    def __str__(self):
+        return f"{self.date} {self.time}"
+
+
+class AppointmentArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    tenant = derived_tenant()
+    slot = models.ForeignKey(SlotArchive, on_delete=models.PROTECT, verbose_name="Слот")
+    driver = models.ForeignKey(
+        Driver, on_delete=models.PROTECT, verbose_name="Водитель"
+    )
+    car = models.ForeignKey(
+        Automobile, on_delete=models.PROTECT, verbose_name="Автомобиль"
+    )
+    status = models.CharField(
+        "Статус", max_length=32, choices=AppointmentStatus.choices
+    )
+    created_at = models.DateTimeField("Создано")
+    updated_at = models.DateTimeField("Обновлено")
+    archived_at = models.DateTimeField("В архиве с", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Запись (архив)"
+        verbose_name_plural = "Записи (архив)"
+        ordering = ["slot__date", "slot__time"]
+        indexes = [
+            models.Index(fields=["driver", "slot"], name="appt_archive_driver_slot")
+        ]
+
+    def __str__(self):
+        return f"{self.slot} — {self.driver} — {self.car}"
+
+
+# Вся история слотов и записей: представления БД (UNION ALL рабочих и архивных
+# таблиц), только для чтения. При изменении полей Slot/Appointment - обновить
+# представления миграцией
+class SlotHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name="Компания",
+    )
+    date = models.DateField("Дата")
+    time = models.TimeField("Время")
+    status = models.CharField("Статус", max_length=8, choices=SlotStatus.choices)
+    capacity = models.PositiveSmallIntegerField("Мест (боксов)")
+    available = models.PositiveSmallIntegerField("Свободно мест")
+    archived = models.BooleanField("В архиве")
+
+    class Meta:
+        managed = False
+        db_table = "core_slot_history"
+        verbose_name = "Слот (история)"
+        verbose_name_plural = "Слоты (история)"
+        ordering = ["date", "time"]
+
+    def __str__(self):
+        return f"{self.date} {self.time}"
+
+
+class AppointmentHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name="Компания",
+    )
+    slot = models.ForeignKey(
+        SlotHistory,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name="Слот",
+    )
+    driver = models.ForeignKey(
+        Driver, on_delete=models.DO_NOTHING, verbose_name="Водитель"
+    )
+    car = models.ForeignKey(
+        Automobile, on_delete=models.DO_NOTHING, verbose_name="Автомобиль"
+    )
+    status = models.CharField(
+        "Статус", max_length=32, choices=AppointmentStatus.choices
+    )
+    created_at = models.DateTimeField("Создано")
+    updated_at = models.DateTimeField("Обновлено")
+    archived = models.BooleanField("В архиве")
+
+    class Meta:
+        managed = False
+        db_table = "core_appointment_history"
+        verbose_name = "Запись (история)"
+        verbose_name_plural = "Записи (история)"
+        ordering = ["slot__date", "slot__time"]
+
+    def __str__(self):
+        return f"{self.slot} — {self.driver} — {self.car}"
+
+
+# Выполненное ТО: история обслуживания автомобиля.
+# Запись на ТО связана через историю записей: после архивации слота запись
+# переезжает в архив с тем же id, а ссылка продолжает работать
+class ServiceRecord(models.Model):
+    tenant = derived_tenant()
+
+    # Отдельный индекс не нужен: его заменяет (car, -date, -id) из Meta
+    car = models.ForeignKey(
+        Automobile,
+        on_delete=models.PROTECT,
+        related_name="service_records",
+        verbose_name="Автомобиль",
+        db_index=False,
+    )
+    appointment = models.OneToOneField(
+        AppointmentHistory,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="service_record",
+        verbose_name="Запись на ТО",
+    )
+    date = models.DateField("Дата ТО")
+    mileage = models.PositiveIntegerField("Пробег")
+    work_done = models.TextField("Выполненные работы")
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    objects = TenantManager()
+
+    class Meta:
+        verbose_name = "Выполненное ТО"
+        verbose_name_plural = "История ТО"
+        ordering = ["-date", "-id"]
+
+        # Последние ТО автомобиля и лента истории всех компаний и одной компании
+        # (постранично по ключу)
+        indexes = [
+            models.Index(fields=["car", "-date", "-id"], name="service_car_date"),
+            models.Index(fields=["-date", "-id"], name="service_date"),
+            models.Index(fields=["tenant", "-date", "-id"], name="service_tenant_date"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.car} {self.mileage} км"
+
+    def save(self, *args, **kwargs):
+        if self.tenant_id is None:
+            self.tenant_id = self.car.tenant_id
+        super().save(*args, **kwargs)
+
+
+# Отправка уведомления водителю в Telegram и запись в журнал Notification
+# (reply_markup - кнопки под сообщением в формате Bot API)
+def send_bot_notification(driver: "Driver", text: str, reply_markup: dict = None):
     from .models import Notification
 
-    Notification.objects.create(driver=driver, text=text, created_at=timezone.now())
+    created_at = timezone.now()
+    delivered = _deliver(driver, text, reply_markup)
+
+    # Сохраняем уведомление в БД (для менеджера в админке) вместе с итогом
+    # отправки: недоставленные видны в сводке на главной странице админки
+    Notification.objects.create(
+        tenant_id=driver.tenant_id,
+        driver=driver,
+        text=text,
+        created_at=created_at,
+        delivered=delivered,
+    )
+
 
-    # 2. Пытаемся отправить сообщение через Telegram Bot API
+# Отправка через Telegram Bot API: True/False - доставлено ли,
+# None - бот не настроен и отправка не выполнялась
+def _deliver(driver: "Driver", text: str, reply_markup: dict = None):
     bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not bot_token:
         print("TELEGRAM_BOT_TOKEN не задан, сообщение не отправлено.")
-        return
+        return None
     if not driver.chat_id:
         print(f"У водителя {driver} нет chat_id - невозможно отправить сообщение.")
-        return
+        return False
     message = f"{text}"
     try:
         # Используем httpx с таймаутом и обработкой ошибок
-        api_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        api_url = telegram_api_url(bot_token, "sendMessage")
         payload = {"chat_id": driver.chat_id, "text": message}
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
         with httpx.Client(timeout=5.0) as client:
             resp = client.post(api_url, json=payload)
             if resp.status_code != 200:
                 print(f"Ошибка Telegram API: {resp.status_code} -> {resp.text}")
-            else:
-                print(f"Уведомление отправлено водителю {driver} ({driver.chat_id})")
+                return False
+            print(f"Уведомление отправлено водителю {driver} ({driver.chat_id})")
+            return True
     except Exception as e:
         print(f"Ошибка при отправке уведомления: {e}")
+        return False
@@ -0,0 +1,92 @@
+import cProfile
+import sys
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.crypto import constant_time_compare
+from profiler import Profiler
+
+# Выборочное профилирование запросов: доля PROFILE_SAMPLE_RATE всех запросов
+# и любые запросы с заголовком X-Profile: <PROFILE_TOKEN>. Имя сохраненного
+# профиля для запросов с заголовком возвращается в X-Profile-File.
+# Если ни то, ни другое не настроено, middleware отключается при старте.
+# Под ASGI синхронные представления выполняются в отдельном потоке запроса
+# (sync_to_async). До Python 3.12 cProfile видит только свой поток: поток
+# запроса профилируется отдельно, и оба профиля пишутся в один файл. С 3.12
+# cProfile работает через sys.monitoring и видит все потоки, а второй профиль
+# в это время включить нельзя (ValueError)
+PER_THREAD_PROFILE = sys.version_info < (3, 12)
+
+
+class ProfilingMiddleware:
+    header = "HTTP_X_PROFILE"
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.profiler = Profiler(
+            settings.PROFILE_SAMPLE_RATE, settings.PROFILE_DIR, settings.PROFILE_MIN_MS
+        )
+        self.token = settings.PROFILE_TOKEN
+        if not (self.profiler.enabled or self.token):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        forced, profile = self.start(request)
+        if profile is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            path = self.stop(request, profile, started, forced)
+        return self.finish(response, path, forced)
+
+    async def __acall__(self, request):
+        forced, profile = self.start(request)
+        if profile is None:
+            return await self.get_response(request)
+
+        # sync_to_async (thread_sensitive) - тот же поток, где Django
+        # выполнит синхронное представление и middleware этого запроса
+        extra = ()
+        if PER_THREAD_PROFILE:
+            extra = (cProfile.Profile(),)
+            await sync_to_async(extra[0].enable)()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            for in_thread in extra:
+                await sync_to_async(in_thread.disable)()
+            path = self.stop(request, profile, started, forced, extra)
+        return self.finish(response, path, forced)
+
+    def start(self, request):
+        forced = bool(self.token) and constant_time_compare(
+            request.META.get(self.header, ""), self.token
+        )
+        if not (forced or self.profiler.sampled()):
+            return forced, None
+        return forced, self.profiler.start()
+
+    def stop(self, request, profile, started, forced, extra=()):
+        return self.profiler.stop(
+            profile,
+            f"{request.method}-{request.path}",
+            time.perf_counter() - started,
+            force=forced,
+            extra=extra,
+        )
+
+    def finish(self, response, path, forced):
+        if forced and path:
+            response["X-Profile-File"] = path.name
+        return response
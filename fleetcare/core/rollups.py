@@ -0,0 +1,87 @@
+from django.db.models import Count, F, Q, Sum
+from .models import (
+    AppointmentHistory,
+    AppointmentStatus,
+    DailyUtilization,
+    SlotHistory,
+)
+
+# Дневные сводки загрузки сервиса (DailyUtilization) по компаниям.
+# Запись и отмена меняют счетчики своего дня инкрементально, массовые
+# операции со слотами пересчитывают затронутые дни из исходных таблиц
+
+# Счетчик сводки для каждого статуса записи (выполненная запись остается
+# в числе записанных)
+STATUS_FIELDS = {
+    AppointmentStatus.ACTIVE: "booked",
+    AppointmentStatus.COMPLETED: "booked",
+    AppointmentStatus.CANCELLED_USER: "cancelled_user",
+    AppointmentStatus.CANCELLED_MANAGER: "cancelled_manager",
+}
+COUNTERS = ("booked", "cancelled_user", "cancelled_manager", "free")
+
+
+# Атомарно прибавить deltas к счетчикам дня компании (строка создается
+# при первом изменении)
+def bump_day(tenant_id, day, **deltas):
+    changes = {k: F(k) + v for k, v in deltas.items() if v}
+    if not changes:
+        return
+    row = DailyUtilization.objects.filter(tenant_id=tenant_id, day=day)
+    if not row.update(**changes):
+        DailyUtilization.objects.get_or_create(tenant_id=tenant_id, day=day)
+        row.update(**changes)
+
+
+# Пересчет сводок всех компаний из всей истории слотов и записей (рабочие
+# таблицы + архив): за указанные дни или (days=None) за все
+def rebuild_days(days=None) -> int:
+    slots = SlotHistory.objects.all()
+    appointments = AppointmentHistory.objects.all()
+    if days is not None:
+        days = set(days)
+        slots = slots.filter(date__in=days)
+        appointments = appointments.filter(slot__date__in=days)
+
+    rows = {}
+    for tenant_id, day, free in (
+        slots.order_by()
+        .values("tenant", "date")
+        .annotate(n=Sum("available"))
+        .values_list("tenant", "date", "n")
+    ):
+        row = rows.setdefault((tenant_id, day), dict.fromkeys(COUNTERS, 0))
+        row["free"] = free or 0
+    statuses = {}
+    for status, field in STATUS_FIELDS.items():
+        statuses.setdefault(field, []).append(status)
+    per_status = {
+        field: Count("pk", filter=Q(status__in=values))
+        for field, values in statuses.items()
+    }
+    per_day = appointments.order_by().values("tenant", "slot__date")
+    for item in per_day.annotate(**per_status):
+        key = (item.pop("tenant"), item.pop("slot__date"))
+        rows.setdefault(key, dict.fromkeys(COUNTERS, 0)).update(item)
+
+    DailyUtilization.objects.bulk_create(
+        [
+            DailyUtilization(tenant_id=tenant_id, day=day, **counters)
+            for (tenant_id, day), counters in rows.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["tenant", "day"],
+        update_fields=list(COUNTERS),
+    )
+
+    # Дни компаний, по которым не осталось ни слотов, ни записей
+    existing = DailyUtilization.objects.all()
+    if days is not None:
+        existing = existing.filter(day__in=days)
+    stale = [
+        pk
+        for pk, tenant_id, day in existing.values_list("pk", "tenant", "day")
+        if (tenant_id, day) not in rows
+    ]
+    DailyUtilization.objects.filter(pk__in=stale).delete()
+    return len(rows)
@@ -0,0 +1,99 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import F, Q
+from django.db.models.functions import Greatest, Upper
+from django.utils.text import smart_split, unescape_string_literal
+from .models import Automobile, Driver
+
+# Триграммы строятся по 3 символам - короче индекс не поможет
+SEARCH_MIN_LENGTH = 3
+SEARCH_LIMIT = 20
+
+
+# Объединение подзапросов по каждому полю: каждый идет по своему GIN-индексу,
+# вместо одного OR по нескольким колонкам (и JOIN), который дает seq scan
+def pk_union(model, fields, term, *extra):
+    subqueries = list(extra) + [
+        model._default_manager.filter(**{f"{f}__icontains": term})
+        .order_by()
+        .values("pk")
+        for f in fields
+    ]
+    return subqueries[0].union(*subqueries[1:])
+
+
+# Поиск в админке через триграммные индексы. Слова разбираются как в
+# ModelAdmin.get_search_results: фраза в кавычках ищется целиком
+class TrigramSearchMixin:
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        terms = [
+            (
+                unescape_string_literal(bit)
+                if bit.startswith(('"', "'")) and bit[0] == bit[-1]
+                else bit
+            )
+            for bit in smart_split(search_term)
+        ]
+        if not search_fields or not terms:
+            return super().get_search_results(request, queryset, search_term)
+
+        # Каждое слово должно найтись хотя бы в одном поле (как в стандартном поиске)
+        for term in terms:
+            queryset = queryset.filter(
+                pk__in=pk_union(queryset.model, search_fields, term)
+            )
+        return queryset, False
+
+
+# Нечеткий поиск автомобилей по госномеру (tenant - в пределах компании)
+def search_automobiles(term: str, limit: int = SEARCH_LIMIT, tenant=None):
+    term = term.upper()
+    cars = (
+        Automobile.objects.all()
+        if tenant is None
+        else Automobile.objects.for_tenant(tenant)
+    )
+    qs = (
+        cars.alias(plate_up=Upper("plate_number"))
+        .filter(Q(plate_number__icontains=term) | Q(plate_up__trigram_similar=term))
+        .annotate(similarity=TrigramSimilarity(Upper("plate_number"), term))
+        .order_by("-similarity", "plate_number")
+    )
+    return list(qs.values("id", "plate_number", "make", "model")[:limit])
+
+
+# Нечеткий поиск водителей по ФИО, телефону и госномеру авто
+def search_drivers(term: str, limit: int = SEARCH_LIMIT, tenant=None):
+    term = term.upper()
+    fuzzy = (
+        Driver.objects.alias(
+            last_up=Upper("last_name"),
+            first_up=Upper("first_name"),
+        )
+        .filter(Q(last_up__trigram_similar=term) | Q(first_up__trigram_similar=term))
+        .order_by()
+        .values("pk")
+    )
+    matched = pk_union(
+        Driver, ["last_name", "first_name", "phone", "car__plate_number"], term, fuzzy
+    )
+    drivers = (
+        Driver.objects.all() if tenant is None else Driver.objects.for_tenant(tenant)
+    )
+    qs = (
+        drivers.filter(pk__in=matched)
+        .annotate(
+            similarity=Greatest(
+                TrigramSimilarity(Upper("last_name"), term),
+                TrigramSimilarity(Upper("first_name"), term),
+                TrigramSimilarity(Upper("phone"), term),
+                TrigramSimilarity(Upper("car__plate_number"), term),
+            )
+        )
+        .order_by("-similarity", "last_name", "first_name")
+    )
+    return list(
+        qs.values(
+            "id", "first_name", "last_name", "phone", car_plate=F("car__plate_number")
+        )[:limit]
+    )
@@ -1,5 +1,6 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import Automobile, Driver, Slot, Appointment
+from .models import Automobile, Driver, Slot, Appointment, WaitlistEntry
 
 
 # Авто
@@ -24,14 +25,14 @@ class DriverSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Driver
-        fields = ["id", "first_name", "last_name", "phone", "car", "chat_id"]
+        fields = ["id", "tenant", "first_name", "last_name", "phone", "car", "chat_id"]
 
 
 # Слот
 class SlotSerializer(serializers.ModelSerializer):
     class Meta:
         model = Slot
-        fields = ["id", "date", "time", "status"]
+        fields = ["id", "date", "time", "status", "capacity", "available"]
 
 
 # Запись
@@ -44,3 +45,95 @@ class AppointmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
         fields = ["id", "slot", "slot_id", "driver", "car", "status", "created_at"]
+
+    # Нет свободных мест (условный UPDATE в Appointment.save) - ответ 400
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({"slot_id": e.messages})
+
+
+# Заявка в листе ожидания
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WaitlistEntry
+        fields = ["id", "driver", "date_from", "date_to", "status", "created_at"]
+
+
+# Быстрый путь для горячих endpoints бота: строки из values_list() превращаются
+# в словари по заранее собранному описанию полей, без ModelSerializer на каждое поле.
+# Вывод совпадает с соответствующим ModelSerializer байт в байт
+def _iso(value):
+    return value.isoformat()
+
+
+_MISSING = object()  # в строке values_list() кончились значения
+
+
+class ValuesSerializer:
+    def __init__(self, fields, converters=None, nested=None):
+
+        # fields - поля в порядке ответа, converters - {поле: функция},
+        # nested - {поле: ValuesSerializer} для вложенных объектов по FK
+        self.fields = list(fields)
+        self.converters = converters or {}
+        self.nested = nested or {}
+        self.lookups = self.build_lookups()
+
+    def build_lookups(self, prefix=""):
+        lookups = []
+        for name in self.fields:
+            if name in self.nested:
+                lookups += self.nested[name].build_lookups(f"{prefix}{name}__")
+            else:
+                lookups.append(prefix + name)
+        return lookups
+
+    def build(self, values):
+        data = {}
+        for name in self.fields:
+            if name in self.nested:
+                item = self.nested[name].build(values)
+                data[name] = None if all(v is None for v in item.values()) else item
+                continue
+            value = next(values, _MISSING)
+            if value is _MISSING:
+                raise ValueError(
+                    f"ValuesSerializer: в строке меньше значений, чем полей "
+                    f"{self.lookups}"
+                )
+            convert = self.converters.get(name)
+            data[name] = convert(value) if convert and value is not None else value
+        return data
+
+    # Строки должны идти в порядке self.lookups, по одному значению на поле
+    def from_tuples(self, tuples):
+        size = len(self.lookups)
+        data = []
+        for row in tuples:
+            if len(row) != size:
+                raise ValueError(
+                    f"ValuesSerializer: ожидалось {size} значений {self.lookups}, "
+                    f"получено {len(row)}"
+                )
+            data.append(self.build(iter(row)))
+        return data
+
+    def rows(self, queryset):
+        return self.from_tuples(queryset.values_list(*self.lookups))
+
+    async def arows(self, queryset):
+        return self.from_tuples(
+            [row async for row in queryset.values_list(*self.lookups)]
+        )
+
+
+# Аналоги SlotSerializer и DriverSerializer (с вложенным AutomobileSerializer)
+SLOT_FAST = ValuesSerializer(
+    SlotSerializer.Meta.fields, converters={"date": _iso, "time": _iso}
+)
+DRIVER_FAST = ValuesSerializer(
+    DriverSerializer.Meta.fields,
+    nested={"car": ValuesSerializer(AutomobileSerializer.Meta.fields)},
+)
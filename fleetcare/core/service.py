@@ -0,0 +1,79 @@
+from datetime import date as date_cls
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from .models import Appointment, AppointmentStatus, ServiceRecord
+
+# История обслуживания: выполненная запись на ТО становится записью истории
+# (дата, пробег, работы), пробег автомобиля обновляется в той же транзакции.
+# Выборки по истории идут по индексам service_car_date (последние ТО
+# автомобиля) и service_date (вся история автопарка) и листаются по ключу
+# (дата, id) - без OFFSET и COUNT(*) по миллионам строк
+HISTORY_FIELDS = (
+    "id",
+    "date",
+    "mileage",
+    "work_done",
+    "appointment_id",
+    "car_id",
+    "car__plate_number",
+)
+
+
+# Завершить активную запись: запись истории + статус + пробег автомобиля
+def complete_appointment(appointment_id, mileage, work_done, date=None):
+    with transaction.atomic():
+        appointment = (
+            Appointment.objects.select_for_update(of=("self", "car"))
+            .select_related("slot", "car", "driver")
+            .get(pk=appointment_id)
+        )
+        if appointment.status != AppointmentStatus.ACTIVE:
+            raise ValidationError("Завершить можно только активную запись")
+        car = appointment.car
+        if mileage < car.last_service_mileage:
+            raise ValidationError(
+                f"Пробег меньше пробега последнего ТО ({car.last_service_mileage} км)"
+            )
+        record = ServiceRecord.objects.create(
+            car=car,
+            appointment_id=appointment.pk,
+            date=date or appointment.slot.date,
+            mileage=mileage,
+            work_done=work_done,
+        )
+        appointment.status = AppointmentStatus.COMPLETED
+        appointment.save()
+        car.last_service_mileage = mileage
+        car.save(
+            update_fields=["last_service_mileage", "next_service_mileage", "updated_at"]
+        )
+    return record
+
+
+# Страница истории: новые ТО сначала, before - ключ последней строки прошлой
+# страницы, tenant - только история компании (индекс service_tenant_date);
+# (строки, ключ следующей страницы или None)
+def history_page(limit, car_id=None, before=None, tenant=None):
+    qs = ServiceRecord.objects.order_by("-date", "-id")
+    if tenant is not None:
+        qs = qs.for_tenant(tenant)
+    if car_id is not None:
+        qs = qs.filter(car_id=car_id)
+    if before is not None:
+        day, pk = before
+        qs = qs.filter(date__lte=day).filter(Q(date__lt=day) | Q(id__lt=pk))
+    rows = list(qs.values(*HISTORY_FIELDS)[: limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (page_key(rows[-1]) if more else None)
+
+
+def page_key(row) -> str:
+    return f"{row['date']:%Y-%m-%d}_{row['id']}"
+
+
+# "2026-10-19_123" -> (date, id); ValueError при неверном ключе
+def parse_page_key(value: str):
+    day, pk = value.split("_")
+    return date_cls.fromisoformat(day), int(pk)
@@ -0,0 +1,102 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .api_cache import invalidate_drivers, invalidate_slots
+from .dashboard import invalidate_dashboard
+from .ical import invalidate_calendars
+from .models import (
+    Appointment,
+    AppointmentStatus,
+    Automobile,
+    Driver,
+    Notification,
+    Slot,
+)
+from .rollups import STATUS_FIELDS, bump_day, rebuild_days
+
+
+# Слоты: запоминаем старую дату для пересчета сводки загрузки
+@receiver(pre_save, sender=Slot)
+def slot_before_save(sender, instance, **kwargs):
+    instance._old_date = (
+        Slot.objects.filter(pk=instance.pk).values_list("date", flat=True).first()
+        if instance.pk
+        else None
+    )
+
+
+# Слоты: списки слотов и свободные даты, а также записи и календари водителей
+# на этот слот
+@receiver(post_save, sender=Slot)
+@receiver(post_delete, sender=Slot)
+def slot_changed(sender, instance, **kwargs):
+    invalidate_slots(instance.tenant_id)
+    rebuild_days(d for d in (instance.date, getattr(instance, "_old_date", None)) if d)
+    drivers = list(
+        Appointment.objects.filter(slot_id=instance.pk).values_list(
+            "driver_id", "driver__phone"
+        )
+    )
+    invalidate_drivers(phone for _, phone in drivers)
+    invalidate_calendars(driver_id for driver_id, _ in drivers)
+
+
+# Записи: активные записи и календарь водителя, свободные места
+# (места в слоте меняются условным UPDATE, без сигналов Slot)
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed(sender, instance, **kwargs):
+    invalidate_slots(instance.tenant_id)
+    invalidate_drivers(
+        Driver.objects.filter(pk=instance.driver_id).values_list("phone", flat=True)
+    )
+    invalidate_calendars([instance.driver_id])
+
+
+# Удаленная активная запись возвращает место в слот
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    released = instance.status == AppointmentStatus.ACTIVE and Slot.release_place(
+        instance.slot_id
+    )
+    bump_day(
+        instance.tenant_id,
+        instance.slot.date,
+        **{STATUS_FIELDS[instance.status]: -1, "free": int(released)},
+    )
+
+
+# Водитель: запоминаем старый телефон, чтобы сбросить кэш и по нему
+@receiver(pre_save, sender=Driver)
+def driver_before_save(sender, instance, **kwargs):
+    instance._old_phone = (
+        Driver.objects.filter(pk=instance.pk).values_list("phone", flat=True).first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=Driver)
+@receiver(post_delete, sender=Driver)
+def driver_changed(sender, instance, **kwargs):
+    invalidate_drivers(
+        p for p in (instance.phone, getattr(instance, "_old_phone", None)) if p
+    )
+    invalidate_calendars([instance.pk])
+    invalidate_dashboard()
+
+
+# Автомобиль: вложен в ответ by_phone, есть в календарях и сводке админки
+@receiver(post_save, sender=Automobile)
+@receiver(post_delete, sender=Automobile)
+def automobile_changed(sender, instance, **kwargs):
+    drivers = list(Driver.objects.filter(car_id=instance.pk).values_list("id", "phone"))
+    invalidate_drivers(phone for _, phone in drivers)
+    invalidate_calendars(driver_id for driver_id, _ in drivers)
+    invalidate_dashboard()
+
+
+# Недоставленное уведомление: счетчик в сводке админки
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, **kwargs):
+    if instance.delivered is False:
+        invalidate_dashboard()
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+import httpx
+
+# Отправка сообщений через Telegram Bot API с учетом лимитов Telegram:
+# не больше ~30 сообщений в секунду всего и ~1 в секунду в один чат
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", "1"))
+
+
+def api_url(token: str, method: str) -> str:
+    return f"{TELEGRAM_API_URL}/bot{token}/{method}"
+
+
+# Token bucket: rate токенов в секунду, не больше capacity подряд.
+# pause() останавливает выдачу (ответ 429 с retry_after)
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+# Отправитель с общим и по-чатовыми ведрами; на 429 ждет retry_after и повторяет
+class TelegramSender:
+    def __init__(
+        self,
+        token: str,
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        max_retries: int = 3,
+    ):
+        self.url = api_url(token, "sendMessage")
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._chats = {}
+        self.rate_limited = 0
+
+    def chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate, 1)
+        return bucket
+
+    async def send(self, client: httpx.AsyncClient, chat_id, text: str) -> bool:
+        chat = self.chat_bucket(chat_id)
+        for _ in range(self.max_retries + 1):
+            await chat.acquire()
+            await self.global_bucket.acquire()
+            try:
+                resp = await client.post(
+                    self.url, json={"chat_id": chat_id, "text": text}
+                )
+            except httpx.HTTPError:
+                continue
+            if resp.status_code == 429:
+                self.rate_limited += 1
+                try:
+                    retry_after = resp.json()["parameters"]["retry_after"]
+                except (ValueError, KeyError, TypeError):
+                    retry_after = 1
+                self.global_bucket.pause(retry_after)
+                chat.pause(retry_after)
+                continue
+            return resp.status_code == 200
+        return False
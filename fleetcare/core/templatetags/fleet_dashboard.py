@@ -0,0 +1,12 @@
+from django import template
+from ..dashboard import dashboard_stats
+from ..tenants import user_tenant_ids
+
+register = template.Library()
+
+
+# Сводка на главной странице админки (см. core/dashboard.py) по компаниям
+# менеджера
+@register.inclusion_tag("admin/core/dashboard.html", takes_context=True)
+def fleet_dashboard(context):
+    return {"stats": dashboard_stats(tenant_ids=user_tenant_ids(context["request"]))}
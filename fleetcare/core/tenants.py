@@ -0,0 +1,66 @@
+from .models import Tenant
+
+# Компании-клиенты (multi-tenant). Автомобили, водители и слоты принадлежат
+# компании, записи, уведомления, лист ожидания и история ТО - компании
+# водителя. API бота получает компанию параметром ?tenant=<id> (бот берет его
+# из ответа by_phone), админка показывает менеджеру только его компании
+
+
+# ?tenant=<id> в запросе API: id компании или None; ValueError - не число
+def tenant_param(params):
+    value = params.get("tenant")
+    return int(value) if value else None
+
+
+# Компании менеджера; None - суперпользователь (все компании).
+# Запоминаются на время запроса: админка спрашивает несколько раз
+def user_tenant_ids(request):
+    if request.user.is_superuser:
+        return None
+    if not hasattr(request, "_tenant_ids"):
+        request._tenant_ids = list(
+            Tenant.objects.filter(managers=request.user).values_list("pk", flat=True)
+        )
+    return request._tenant_ids
+
+
+def has_tenant(model) -> bool:
+    return any(f.name == "tenant" for f in model._meta.fields)
+
+
+# Админка в пределах компаний менеджера: списки, выбор связанных объектов
+# и компании нового объекта. tenant_field - путь к компании, если у модели
+# нет своего поля tenant
+class TenantAdminMixin:
+    tenant_field = "tenant"
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        tenant_ids = user_tenant_ids(request)
+        if tenant_ids is None:
+            return qs
+        return qs.filter(**{f"{self.tenant_field}__in": tenant_ids})
+
+    # Суперпользователю - колонка и фильтр по компании
+    def get_list_display(self, request):
+        fields = super().get_list_display(request)
+        if request.user.is_superuser and has_tenant(self.model):
+            return (*fields, "tenant")
+        return fields
+
+    def get_list_filter(self, request):
+        filters = super().get_list_filter(request)
+        if request.user.is_superuser:
+            return (self.tenant_field, *filters)
+        return filters
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        tenant_ids = user_tenant_ids(request)
+        related = db_field.related_model
+        if tenant_ids is not None and related is Tenant:
+            kwargs["queryset"] = Tenant.objects.filter(pk__in=tenant_ids)
+            if len(tenant_ids) == 1:
+                kwargs["initial"] = tenant_ids[0]
+        elif tenant_ids is not None and has_tenant(related):
+            kwargs["queryset"] = related._default_manager.filter(tenant__in=tenant_ids)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -1,3 +1,1675 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.http import HttpResponse
+from django.db.models import Q
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from telegram import Chat, Message, Update, User
+from bot_updates import PerUserUpdateProcessor
+from fleetcare import urls
+from profiler import Profiler, profiled
+from .api import free_dates_qs
+from .api_cache import get_versions, slots_ns
+from .archive import archive_notifications, archive_slots
+from .dashboard import compute_stats, dashboard_stats, failed_notifications
+from .db_pool import base as db_pool
+from .db_routing import PrimaryReplicaRouter, ReplicaRoutingMiddleware, use_primary
+from .ical import driver_feed_path
+from .idempotency import idempotent
+from .models import (
+    Appointment,
+    AppointmentHistory,
+    AppointmentStatus,
+    Automobile,
+    Broadcast,
+    BroadcastStatus,
+    DailyUtilization,
+    Driver,
+    IdempotencyKey,
+    Notification,
+    NotificationArchive,
+    OfferStatus,
+    ServiceRecord,
+    Slot,
+    SlotHistory,
+    SlotStatus,
+    Tenant,
+    WaitlistEntry,
+    WaitlistOffer,
+    WaitlistStatus,
+)
+from . import broadcast, profiling, throttling
+from .board import RESET, BoardHub, board_event, board_snapshot
+from .renderers import ORJSONRenderer
+from .rollups import COUNTERS, rebuild_days
+from .serializers import DRIVER_FAST, SLOT_FAST, DriverSerializer, SlotSerializer
+from .service import complete_appointment, history_page
+from . import waitlist
+from .waitlist import next_entry
 
-# Create your tests here.
+
+# Водитель с автомобилем в компании (для тестов поведения)
+def make_driver(tenant, phone, plate):
+    car = Automobile.objects.create(
+        tenant=tenant,
+        plate_number=plate,
+        make="Make",
+        model="Model",
+        last_service_mileage=0,
+    )
+    return Driver.objects.create(
+        tenant=tenant, first_name="Имя", last_name="Фамилия", phone=phone, car=car
+    )
+
+
+# Планы горячих запросов: основная таблица читается по своему индексу.
+# Seq Scan запрещается планировщику (enable_seqscan=off), поэтому он остается
+# в плане, только если подходящего индекса нет совсем, а проверка имени индекса
+# ловит случаи, когда запрос перестал попадать в предназначенный ему индекс
+class HotQueryPlanTests(TestCase):
+    DRIVERS = 200
+    DAYS = 60
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        Automobile.objects.bulk_create(
+            [
+                Automobile(
+                    tenant=tenant,
+                    plate_number=f"PL{i:05d}",
+                    make="Make",
+                    model="Model",
+                    last_service_mileage=0,
+                    next_service_mileage=10000,
+                )
+                for i in range(cls.DRIVERS)
+            ]
+        )
+        cars = list(Automobile.objects.order_by("id"))
+        Driver.objects.bulk_create(
+            [
+                Driver(
+                    tenant=tenant,
+                    first_name="Имя",
+                    last_name=f"Фамилия{i}",
+                    phone=f"+7900{i:07d}",
+                    car=car,
+                )
+                for i, car in enumerate(cars)
+            ]
+        )
+        drivers = list(Driver.objects.order_by("id"))
+
+        # Слоты за прошлые и будущие дни, часть закрыта
+        start = date.today() - timedelta(days=cls.DAYS // 2)
+        Slot.objects.bulk_create(
+            [
+                Slot(
+                    tenant=tenant,
+                    date=start + timedelta(days=d),
+                    time=time(h, 0),
+                    capacity=2,
+                    available=0 if (d + h) % 3 == 0 else 2,
+                    status=SlotStatus.BUSY if (d + h) % 3 == 0 else SlotStatus.FREE,
+                )
+                for d in range(cls.DAYS)
+                for h in range(8, 20)
+            ]
+        )
+        slots = list(Slot.objects.order_by("id"))
+        statuses = list(AppointmentStatus.values)
+        Appointment.objects.bulk_create(
+            [
+                Appointment(
+                    tenant=tenant,
+                    slot=slot,
+                    driver=drivers[i % len(drivers)],
+                    car=drivers[i % len(drivers)].car,
+                    status=statuses[i % len(statuses)],
+                )
+                for i, slot in enumerate(slots)
+            ]
+        )
+        now = timezone.now()
+        Notification.objects.bulk_create(
+            [
+                Notification(
+                    tenant=tenant,
+                    driver=drivers[i % len(drivers)],
+                    text=f"Уведомление {i}",
+                    created_at=now - timedelta(minutes=i),
+                    delivered=i % 50 != 0,
+                )
+                for i in range(5000)
+            ]
+        )
+
+        # Лист ожидания: у каждого водителя заявка на свой диапазон дат
+        statuses = list(WaitlistStatus.values)
+        WaitlistEntry.objects.bulk_create(
+            [
+                WaitlistEntry(
+                    tenant=tenant,
+                    driver=driver,
+                    date_from=start + timedelta(days=i % cls.DAYS),
+                    date_to=start + timedelta(days=i % cls.DAYS + 3),
+                    status=statuses[i % len(statuses)],
+                    created_at=now - timedelta(minutes=i),
+                )
+                for i, driver in enumerate(drivers)
+            ]
+        )
+
+        # История ТО: по 20 записей на автомобиль
+        ServiceRecord.objects.bulk_create(
+            [
+                ServiceRecord(
+                    tenant=tenant,
+                    car=car,
+                    date=start - timedelta(days=30 * n),
+                    mileage=10000 * (20 - n),
+                    work_done="Замена масла",
+                )
+                for car in cars
+                for n in range(20)
+            ]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.driver = drivers[0]
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    # Узлы плана: (тип, таблица или индекс); Bitmap Index Scan таблицы не
+    # называет, поэтому индексы проверяются по имени, а Seq Scan - по таблице
+    def nodes(self, plan):
+        found = [(plan["Node Type"], plan.get("Relation Name"), plan.get("Index Name"))]
+        for child in plan.get("Plans", []):
+            found += self.nodes(child)
+        return found
+
+    # Имя уникального индекса по колонкам (unique_together именуется автоматически)
+    def unique_on(self, table, *columns):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return next(
+            name
+            for name, info in constraints.items()
+            if info["unique"] and info["columns"] == list(columns)
+        )
+
+    # Таблица читается без Seq Scan и хотя бы по одному из индексов
+    def assertUsesIndex(self, qs, table, *indexes):
+        nodes = self.nodes(json.loads(qs.explain(format="json"))[0]["Plan"])
+        text = qs.explain()
+        self.assertNotIn(("Seq Scan", table), [n[:2] for n in nodes], text)
+        self.assertTrue(set(indexes) & {n[2] for n in nodes}, text)
+
+    def test_active_by_phone(self):
+        qs = (
+            Appointment.objects.filter(
+                driver=self.driver, status=AppointmentStatus.ACTIVE
+            )
+            .order_by("slot__date", "slot__time")
+            .values_list("id", "slot__date", "slot__time", "car__plate_number")
+        )
+        self.assertUsesIndex(qs, "core_appointment", "appointment_driver_status")
+
+    def test_free_slots_on_date(self):
+        qs = (
+            Slot.objects.for_tenant(self.tenant)
+            .filter(status=SlotStatus.FREE, date=date.today())
+            .order_by("date", "time")
+        )
+
+        # На одну дату подходит и уникальный индекс (tenant, date, time)
+        self.assertUsesIndex(
+            qs,
+            "core_slot",
+            "slot_free_date_time",
+            self.unique_on("core_slot", "tenant_id", "date", "time"),
+        )
+
+    def test_all_free_slots(self):
+        qs = (
+            Slot.objects.for_tenant(self.tenant)
+            .filter(status=SlotStatus.FREE)
+            .order_by("date", "time")
+        )
+        self.assertUsesIndex(qs, "core_slot", "slot_free_date_time")
+
+    def test_free_dates(self):
+        today = date.today()
+        self.assertUsesIndex(
+            free_dates_qs(self.tenant.pk, today, today + timedelta(days=7)),
+            "core_slot",
+            "slot_free_date_time",
+        )
+
+    def test_driver_notifications(self):
+        qs = Notification.objects.filter(driver=self.driver).order_by("-created_at")[
+            :20
+        ]
+        self.assertUsesIndex(qs, "core_notification", "notification_driver_created")
+
+    def test_failed_notifications(self):
+        qs = failed_notifications(timezone.now() - timedelta(days=7))
+        self.assertUsesIndex(qs, "core_notification", "notification_failed")
+
+    def test_car_service_history(self):
+        rows, key = history_page(5, self.driver.car_id)
+        qs = ServiceRecord.objects.filter(car_id=self.driver.car_id).order_by(
+            "-date", "-id"
+        )[:6]
+        self.assertUsesIndex(qs, "core_servicerecord", "service_car_date")
+        self.assertEqual(len(rows), 5)
+        self.assertTrue(key)
+
+    def test_fleet_service_history_page(self):
+        rows, key = history_page(50)
+        before = (rows[-1]["date"], rows[-1]["id"])
+        qs = (
+            ServiceRecord.objects.filter(date__lte=before[0])
+            .filter(Q(date__lt=before[0]) | Q(id__lt=before[1]))
+            .order_by("-date", "-id")[:51]
+        )
+        self.assertUsesIndex(qs, "core_servicerecord", "service_date")
+        self.assertEqual(
+            history_page(50, before=before)[0][0]["id"],
+            ServiceRecord.objects.order_by("-date", "-id")[50].id,
+        )
+
+    def test_tenant_service_history(self):
+        rows, _ = history_page(50, tenant=self.tenant.pk)
+        qs = ServiceRecord.objects.for_tenant(self.tenant).order_by("-date", "-id")[:51]
+        self.assertUsesIndex(qs, "core_servicerecord", "service_tenant_date")
+        self.assertEqual(len(rows), 50)
+
+    def test_waitlist_next_entry(self):
+        slot = Slot.objects.filter(date=date.today()).first()
+        self.assertUsesIndex(
+            next_entry(slot)[:1], "core_waitlistentry", "waitlist_queue"
+        )
+
+
+# Пробег следующего ТО пересчитывается в БД и при массовых изменениях
+class NextServiceMileageTests(TestCase):
+    def test_bulk_updates(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        Automobile.objects.bulk_create(
+            [
+                Automobile(
+                    tenant=tenant,
+                    plate_number=f"NS{i}",
+                    make="M",
+                    model="M",
+                    last_service_mileage=0,
+                )
+                for i in range(3)
+            ]
+        )
+        cars = Automobile.objects.order_by("plate_number")
+        cars.filter(plate_number="NS0").update(last_service_mileage=25000)
+        car = cars.get(plate_number="NS1")
+        car.service_interval_km = 15000
+        Automobile.objects.bulk_update([car], ["service_interval_km"])
+        self.assertEqual(
+            list(cars.values_list("next_service_mileage", flat=True)),
+            [35000, 15000, 10000],
+        )
+
+
+# Завершение записи: история ТО, статус и пробег автомобиля вместе
+class CompleteAppointmentTests(TestCase):
+    def setUp(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        self.car = Automobile.objects.create(
+            tenant=tenant,
+            plate_number="SRV001",
+            make="Make",
+            model="Model",
+            last_service_mileage=5000,
+        )
+        driver = Driver.objects.create(
+            tenant=tenant,
+            first_name="Имя",
+            last_name="Фамилия",
+            phone="+79000000002",
+            car=self.car,
+        )
+        slot = Slot.objects.create(tenant=tenant, date=date.today(), time=time(9, 0))
+        self.appointment = Appointment.objects.create(
+            slot=slot, driver=driver, car=self.car
+        )
+
+    def test_complete(self):
+        record = complete_appointment(self.appointment.pk, 15200, "Замена масла")
+        self.car.refresh_from_db()
+        self.appointment.refresh_from_db()
+        self.assertEqual(record.appointment.pk, self.appointment.pk)
+        self.assertEqual(self.appointment.status, AppointmentStatus.COMPLETED)
+        self.assertEqual(
+            (self.car.last_service_mileage, self.car.next_service_mileage),
+            (15200, 25200),
+        )
+
+        # Повторно и с пробегом меньше прежнего - ошибка, без изменений
+        with self.assertRaises(ValidationError):
+            complete_appointment(self.appointment.pk, 16000, "Повтор")
+        self.assertEqual(ServiceRecord.objects.count(), 1)
+
+    # Выполненную запись не отменить ни водителю, ни менеджеру
+    def test_cancel_completed(self):
+        complete_appointment(self.appointment.pk, 15200, "Замена масла")
+        rollups = list(DailyUtilization.objects.values_list())
+        response = self.client.post(
+            f"/api/appointments/{self.appointment.pk}/cancel_user/"
+        )
+        self.assertEqual(response.status_code, 409)
+
+        user = get_user_model().objects.create_superuser("admin")
+        self.client.force_login(user)
+        self.client.post(
+            "/admin/core/appointment/",
+            {"action": "cancel_by_manager", "_selected_action": [self.appointment.pk]},
+        )
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.status, AppointmentStatus.COMPLETED)
+        self.assertEqual(list(DailyUtilization.objects.values_list()), rollups)
+
+    def test_mileage_below_last(self):
+        with self.assertRaises(ValidationError):
+            complete_appointment(self.appointment.pk, 4000, "Замена масла")
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.status, AppointmentStatus.ACTIVE)
+
+
+# Календарь водителя: повторный опрос без изменений - 304 без запросов к БД
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        car = Automobile.objects.create(
+            tenant=tenant,
+            plate_number="CAL001",
+            make="Make",
+            model="Model",
+            last_service_mileage=0,
+        )
+        driver = Driver.objects.create(
+            tenant=tenant,
+            first_name="Имя",
+            last_name="Фамилия",
+            phone="+79000000001",
+            car=car,
+        )
+        slot = Slot.objects.create(
+            tenant=tenant, date=date.today() + timedelta(days=1), time=time(10, 0)
+        )
+        self.appointment = Appointment.objects.create(slot=slot, driver=driver, car=car)
+        self.url = driver_feed_path(driver.pk)
+        self.link = f"/api/drivers/{driver.pk}/calendar/"
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            f"UID:appointment-{self.appointment.pk}@fleetcare",
+            response.content.decode(),
+        )
+        with self.assertNumQueries(0):
+            again = self.client.get(
+                self.url, headers={"If-None-Match": response["ETag"]}
+            )
+        self.assertEqual(again.status_code, 304)
+
+        # Отмена записи меняет версию: лента пересобирается без события
+        self.appointment.status = AppointmentStatus.CANCELLED_USER
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.save()
+        changed = self.client.get(self.url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotIn("BEGIN:VEVENT", changed.content.decode())
+
+    def test_bad_token(self):
+        self.assertEqual(self.client.get(self.url[:-5] + "x.ics").status_code, 404)
+
+    # Подписанная ссылка на ленту - только боту и сотрудникам
+    @override_settings(THROTTLE_BOT_TOKEN="bot-secret")
+    def test_link_requires_bot_or_staff(self):
+        self.assertEqual(self.client.get(self.link).status_code, 403)
+        forged = self.client.get(self.link, headers={"X-Bot-Token": "wrong"})
+        self.assertEqual(forged.status_code, 403)
+        bot = self.client.get(self.link, headers={"X-Bot-Token": "bot-secret"})
+        self.assertTrue(bot.json()["url"].endswith(self.url))
+
+        # Менеджер - только для водителей своих компаний
+        user = get_user_model().objects.create_user("manager", is_staff=True)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(self.link).status_code, 403)
+        self.appointment.tenant.managers.add(user)
+        self.assertEqual(self.client.get(self.link).status_code, 200)
+
+
+# Лимиты частоты API: 429 с Retry-After, отдельные ведра для водителей бота
+@override_settings(
+    THROTTLE_BOT_TOKEN="bot-secret",
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {"client": "100/m", "slots.free_dates": "2/m"},
+    },
+)
+class ThrottlingTests(TestCase):
+    url = "/api/slots/free_dates/?tenant=1"
+
+    def setUp(self):
+        patcher = mock.patch.object(throttling, "_store", throttling.LocalBuckets())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, headers=None):
+        return self.client.get(self.url, headers=headers)
+
+    def test_retry_after(self):
+        self.assertEqual([self.get().status_code for _ in range(2)], [200, 200])
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+
+        # Другие endpoints ограничены только общим лимитом клиента
+        self.assertEqual(self.client.get("/api/slots/?tenant=1").status_code, 200)
+
+    def test_bot_limited_per_driver(self):
+        bot = {"X-Bot-Token": "bot-secret"}
+        for _ in range(2):
+            self.assertEqual(self.get({**bot, "X-Client-Id": "1"}).status_code, 200)
+        self.assertEqual(self.get({**bot, "X-Client-Id": "1"}).status_code, 429)
+        self.assertEqual(self.get({**bot, "X-Client-Id": "2"}).status_code, 200)
+
+        # С чужим токеном X-Client-Id не учитывается: лимит по IP
+        forged = {"X-Bot-Token": "wrong", "X-Client-Id": "3"}
+        self.assertEqual(
+            [self.get(forged).status_code for _ in range(3)], [200, 200, 429]
+        )
+
+    def test_bucket_refills(self):
+        state, wait = throttling.take(None, 0, 1.0, 2)
+        state, wait = throttling.take(state, 0, 1.0, 2)
+        self.assertEqual(wait, 0)
+        state, wait = throttling.take(state, 0.25, 1.0, 2)
+        self.assertAlmostEqual(wait, 0.75)
+        self.assertEqual(throttling.take(state, 1.0, 1.0, 2)[1], 0)
+
+    def test_scope_required(self):
+        request = RequestFactory().get(self.url)
+        self.assertTrue(throttling.ClientThrottle().allow_request(request, None))
+        with self.assertRaises(ImproperlyConfigured):
+            throttling.TokenBucketThrottle().allow_request(request, None)
+
+
+# Компании: слоты, списки API и запись не пересекаются между компаниями
+class TenantIsolationTests(TestCase):
+    def setUp(self):
+        self.day = date.today() + timedelta(days=1)
+        self.slots = {}
+        self.drivers = {}
+        for n, slug in enumerate(("north", "south")):
+            tenant = Tenant.objects.create(name=slug, slug=slug)
+            car = Automobile.objects.create(
+                tenant=tenant,
+                plate_number="A001AA",
+                make="Make",
+                model="Model",
+                last_service_mileage=0,
+            )
+            self.drivers[slug] = Driver.objects.create(
+                tenant=tenant,
+                first_name="Имя",
+                last_name="Фамилия",
+                phone=f"+7900000010{n}",
+                car=car,
+            )
+
+            # Одинаковые дата и время (и госномер) в разных компаниях
+            self.slots[slug] = Slot.objects.create(
+                tenant=tenant, date=self.day, time=time(9, 0)
+            )
+
+    def test_slots_api(self):
+        self.assertEqual(self.client.get("/api/slots/").status_code, 400)
+        tenant = self.slots["north"].tenant_id
+        response = self.client.get(
+            "/api/slots/", {"tenant": tenant, "date": self.day.isoformat()}
+        )
+        self.assertEqual(
+            [row["id"] for row in response.json()], [self.slots["north"].pk]
+        )
+        dates = self.client.get("/api/slots/free_dates/", {"tenant": tenant})
+        self.assertEqual([row["date"] for row in dates.json()], [self.day.isoformat()])
+
+    def test_foreign_slot(self):
+        driver = self.drivers["north"]
+        response = self.client.post(
+            "/api/appointments/",
+            {
+                "slot_id": self.slots["south"].pk,
+                "driver": driver.pk,
+                "car": driver.car_id,
+                "status": "active",
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.slots["south"].refresh_from_db()
+        self.assertEqual(self.slots["south"].available, 1)
+
+
+# Табло на сегодня: события по уведомлениям триггеров и раздача по компаниям
+class BoardTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        car = Automobile.objects.create(
+            tenant=self.tenant,
+            plate_number="BRD001",
+            make="Make",
+            model="Model",
+            last_service_mileage=0,
+        )
+        driver = Driver.objects.create(
+            tenant=self.tenant,
+            first_name="Имя",
+            last_name="Фамилия",
+            phone="+79000000003",
+            car=car,
+        )
+        self.slot = Slot.objects.create(
+            tenant=self.tenant, date=self.today, time=time(9, 0)
+        )
+        self.appointment = Appointment.objects.create(
+            slot=self.slot, driver=driver, car=car
+        )
+
+    def payload(self, kind, op, pk):
+        return {"kind": kind, "op": op, "id": pk, "tenant": self.tenant.pk}
+
+    def test_events(self):
+        event = board_event(
+            self.payload("appointment", "INSERT", self.appointment.pk), self.today
+        )
+        self.assertEqual(
+            (event["op"], event["row"]["time"], event["row"]["car"]),
+            ("INSERT", "09:00", "BRD001"),
+        )
+        self.assertEqual(
+            board_event(self.payload("slot", "UPDATE", self.slot.pk), self.today)[
+                "row"
+            ]["available"],
+            0,
+        )
+
+        # Слот перенесен на завтра: с табло убирается, новый на завтра не попадает
+        self.slot.date = self.today + timedelta(days=1)
+        self.slot.save()
+        self.assertEqual(
+            board_event(self.payload("slot", "UPDATE", self.slot.pk), self.today),
+            {"kind": "slot", "op": "DELETE", "id": self.slot.pk},
+        )
+        self.assertIsNone(
+            board_event(self.payload("slot", "INSERT", self.slot.pk), self.today)
+        )
+
+    def test_snapshot_by_tenant(self):
+        snapshot = board_snapshot(self.today, [self.tenant.pk])
+        self.assertEqual(
+            [row["id"] for row in snapshot["appointments"]], [self.appointment.pk]
+        )
+        self.assertEqual(board_snapshot(self.today, [])["slots"], [])
+
+    def test_publish(self):
+        hub = BoardHub()
+        mine, other, everyone = asyncio.Queue(), asyncio.Queue(), asyncio.Queue()
+        hub.subscribers = {mine: [1], other: [2], everyone: None}
+        hub.publish({"kind": "slot"}, 1)
+        self.assertEqual([q.qsize() for q in (mine, other, everyone)], [1, 0, 1])
+
+        # Отставший подписчик получает RESET и больше не получает событий
+        with mock.patch("core.board.QUEUE_LIMIT", 1):
+            hub.publish({"kind": "slot"}, 1)
+        self.assertNotIn(mine, hub.subscribers)
+        mine.get_nowait()
+        self.assertIs(mine.get_nowait(), RESET)
+
+
+# Архив уведомлений сохраняет статус доставки и связь с рассылкой
+class NotificationArchiveTests(TestCase):
+    def test_archive_keeps_delivery(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        driver = make_driver(tenant, "+79000000004", "ARC001")
+        broadcast = Broadcast.objects.create(text="Рассылка", tenant=tenant)
+        Notification.objects.create(
+            tenant=tenant,
+            driver=driver,
+            text="Рассылка",
+            broadcast=broadcast,
+            delivered=False,
+        )
+        self.assertEqual(archive_notifications(timezone.now() + timedelta(1)), 1)
+        row = NotificationArchive.objects.get()
+        self.assertEqual((row.broadcast_id, row.delivered), (broadcast.pk, False))
+
+
+# Чтение с реплик: запись, транзакция, use_primary и cookie закрепления после
+# записи переводят чтение на основную БД
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def setUp(self):
+        patcher = mock.patch.object(connection, "in_atomic_block", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_db(self):
+        return self.router.db_for_read(Slot)
+
+    def test_router(self):
+        self.assertEqual(self.read_db(), "replica")
+        with use_primary():
+            self.assertEqual(self.read_db(), "default")
+        connection.in_atomic_block = True
+        self.assertEqual(self.read_db(), "default")
+
+    # Ответ middleware и базы чтения внутри представления
+    def request(self, method="get", cookies=None, write=False):
+        seen = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Slot)
+            seen.append(self.read_db())
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)("/api/slots/")
+        request.COOKIES.update(cookies or {})
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen[0], response.cookies.get(ReplicaRoutingMiddleware.cookie_name)
+
+    def test_pin_cookie(self):
+        name = ReplicaRoutingMiddleware.cookie_name
+        db, cookie = self.request()
+        self.assertEqual((db, cookie), ("replica", None))
+
+        # Запись: остаток запроса - с основной БД, клиент закрепляется за ней
+        db, cookie = self.request("post")
+        self.assertEqual(db, "default")
+        self.assertEqual(cookie["max-age"], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(self.request(write=True)[0], "default")
+        self.assertIsNotNone(self.request(write=True)[1])
+
+        # Следующий GET с cookie читает свою запись с основной БД
+        self.assertEqual(self.request(cookies={name: "1"})[0], "default")
+        self.assertEqual(self.read_db(), "replica")
+
+
+# Инвалидация кэша API: версия меняется после COMMIT сохранения и удаления
+class ApiCacheInvalidationTests(TestCase):
+    def setUp(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        self.driver = make_driver(tenant, "+79000000005", "CAC001")
+        self.slot = Slot.objects.create(
+            tenant=tenant, date=date.today() + timedelta(days=1), time=time(10, 0)
+        )
+
+    def active(self):
+        return self.client.get(
+            "/api/appointments/active_by_phone/", {"phone": self.driver.phone}
+        ).json()
+
+    def test_save_and_delete(self):
+        self.assertEqual(self.active(), [])
+        with self.captureOnCommitCallbacks() as callbacks:
+            appointment = Appointment.objects.create(
+                slot=self.slot, driver=self.driver, car=self.driver.car
+            )
+
+            # До COMMIT старый ответ остается в кэше
+            self.assertEqual(self.active(), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual([row["id"] for row in self.active()], [appointment.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+        self.assertEqual(self.active(), [])
+
+    def test_rollback_keeps_version(self):
+        namespaces = [slots_ns(self.slot.tenant_id)]
+        before = get_versions(namespaces)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.slot.save()
+        self.assertTrue(callbacks)
+        self.assertEqual(get_versions(namespaces), before)
+
+
+# Быстрый путь сериализации отдает те же байты, что ModelSerializer + JSONRenderer
+class FastSerializerTests(TestCase):
+    def assertSameBytes(self, serializer_class, fast, queryset):
+        self.assertEqual(
+            ORJSONRenderer().render(fast.rows(queryset)),
+            JSONRenderer().render(serializer_class(queryset, many=True).data),
+        )
+
+    def test_driver_and_slot(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        make_driver(tenant, "+79000000006", "FST001")
+        driver = make_driver(tenant, "+79000000007", "FST002")
+
+        # Разделитель строк JSONRenderer экранирует - быстрый путь тоже
+        driver.first_name = "Имя\u2028Отчество"
+        driver.chat_id = 123456789012
+        driver.save()
+        Slot.objects.create(
+            tenant=tenant, date=date.today(), time=time(9, 30), capacity=3
+        )
+        Slot.objects.create(
+            tenant=tenant,
+            date=date.today() + timedelta(days=1),
+            time=time(14, 0),
+            status=SlotStatus.BUSY,
+            capacity=1,
+            available=0,
+        )
+        self.assertSameBytes(
+            DriverSerializer, DRIVER_FAST, Driver.objects.order_by("id")
+        )
+        self.assertSameBytes(SlotSerializer, SLOT_FAST, Slot.objects.order_by("id"))
+
+    def test_row_length(self):
+        with self.assertRaisesMessage(ValueError, "ожидалось 6 значений"):
+            SLOT_FAST.from_tuples([(1, date.today(), time(9, 0), "free")])
+
+
+# Вместимость слота: запись занимает место, полный слот - 400, отмена освобождает
+class SlotCapacityTests(TestCase):
+    def setUp(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        self.drivers = [
+            make_driver(tenant, f"+7900000002{n}", f"CAP00{n}") for n in range(3)
+        ]
+        self.slot = Slot.objects.create(
+            tenant=tenant,
+            date=date.today() + timedelta(days=1),
+            time=time(10, 0),
+            capacity=2,
+        )
+
+    def book(self, driver):
+        return self.client.post(
+            "/api/appointments/",
+            {"slot_id": self.slot.pk, "driver": driver.pk, "car": driver.car_id},
+            content_type="application/json",
+        )
+
+    def places(self):
+        self.slot.refresh_from_db()
+        return self.slot.available, self.slot.status
+
+    def test_full_slot_and_cancel(self):
+        first, second, third = self.drivers
+        booked = self.book(first)
+        self.assertEqual(booked.status_code, 201)
+        self.assertEqual(self.book(second).status_code, 201)
+        self.assertEqual(self.places(), (0, SlotStatus.BUSY))
+
+        response = self.book(third)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("slot_id", response.json())
+        self.assertEqual(Appointment.objects.filter(slot=self.slot).count(), 2)
+
+        # Отмена возвращает место, и его можно занять снова
+        cancel = self.client.post(
+            f"/api/appointments/{booked.json()['id']}/cancel_user/"
+        )
+        self.assertEqual(cancel.status_code, 200)
+        self.assertEqual(self.places(), (1, SlotStatus.FREE))
+        self.assertEqual(self.book(third).status_code, 201)
+        self.assertEqual(self.places(), (0, SlotStatus.BUSY))
+
+
+# Сводка загрузки: инкрементальные счетчики совпадают с полным пересчетом
+class RollupTests(TestCase):
+    def rollups(self):
+        return list(
+            DailyUtilization.objects.order_by("tenant", "day").values_list(
+                "tenant", "day", *COUNTERS
+            )
+        )
+
+    def test_incremental_matches_rebuild(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        drivers = [
+            make_driver(tenant, f"+7900000003{n}", f"ROL00{n}") for n in range(4)
+        ]
+        day = date.today() + timedelta(days=1)
+        morning = Slot.objects.create(tenant=tenant, date=day, time=time(9, 0))
+        evening = Slot.objects.create(
+            tenant=tenant, date=day, time=time(18, 0), capacity=3
+        )
+        later = Slot.objects.create(
+            tenant=tenant, date=day + timedelta(days=1), time=time(9, 0), capacity=2
+        )
+        booked = [
+            Appointment.objects.create(slot=slot, driver=driver, car=driver.car)
+            for slot, driver in zip((morning, evening, evening, later), drivers)
+        ]
+
+        # Отмена водителем и менеджером, выполнение и удаление записи
+        for appointment, status in zip(
+            booked[:3],
+            (
+                AppointmentStatus.CANCELLED_USER,
+                AppointmentStatus.CANCELLED_MANAGER,
+                AppointmentStatus.COMPLETED,
+            ),
+        ):
+            appointment.status = status
+            appointment.save()
+        booked[0].delete()
+        booked[3].delete()
+
+        incremental = self.rollups()
+        self.assertEqual([row[2:] for row in incremental], [(1, 0, 1, 3), (0, 0, 0, 2)])
+        DailyUtilization.objects.all().delete()
+        rebuild_days()
+        self.assertEqual(self.rollups(), incremental)
+
+
+# Архив слотов: история (рабочие таблицы + архив) и сводки не меняются
+class SlotArchiveTests(TestCase):
+    def history(self):
+        slots = SlotHistory.objects.order_by("id").values_list(
+            "id", "tenant", "date", "time", "status", "capacity", "available"
+        )
+        appointments = AppointmentHistory.objects.order_by("id").values_list(
+            "id", "slot", "driver", "car", "status", "created_at"
+        )
+        return list(slots), list(appointments)
+
+    def test_history_views(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        driver = make_driver(tenant, "+79000000040", "ARC002")
+        today = date.today()
+        past = Slot.objects.create(
+            tenant=tenant, date=today - timedelta(days=10), time=time(9, 0)
+        )
+        future = Slot.objects.create(
+            tenant=tenant, date=today + timedelta(days=1), time=time(9, 0)
+        )
+        old = Appointment.objects.create(slot=past, driver=driver, car=driver.car)
+        Appointment.objects.create(slot=future, driver=driver, car=driver.car)
+        old.status = AppointmentStatus.COMPLETED
+        old.save()
+
+        before = self.history()
+        rollups = list(DailyUtilization.objects.order_by("day").values_list())
+        self.assertEqual(archive_slots(today), 1)
+        self.assertEqual(self.history(), before)
+        self.assertEqual(
+            list(SlotHistory.objects.order_by("date").values_list("archived")),
+            [(True,), (False,)],
+        )
+        self.assertTrue(AppointmentHistory.objects.get(pk=old.pk).archived)
+
+        # Пересчет из истории после архивации дает те же сводки
+        rebuild_days()
+        self.assertEqual(
+            list(DailyUtilization.objects.order_by("day").values_list()), rollups
+        )
+
+
+# Idempotency-Key: повтор получает сохраненный ответ, ключ - в пределах клиента
+@override_settings(THROTTLE_BOT_TOKEN="bot-secret")
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        self.drivers = [
+            make_driver(tenant, f"+7900000005{n}", f"IDM00{n}") for n in range(2)
+        ]
+        self.slot = Slot.objects.create(
+            tenant=tenant,
+            date=date.today() + timedelta(days=1),
+            time=time(10, 0),
+            capacity=2,
+        )
+
+    def book(self, driver, client_id="1", key="book:1"):
+        return self.client.post(
+            "/api/appointments/",
+            {"slot_id": self.slot.pk, "driver": driver.pk, "car": driver.car_id},
+            content_type="application/json",
+            headers={
+                "Idempotency-Key": key,
+                "X-Bot-Token": "bot-secret",
+                "X-Client-Id": client_id,
+            },
+        )
+
+    def test_replay_and_mismatch(self):
+        first, second = self.drivers
+        created = self.book(first)
+        self.assertEqual(created.status_code, 201)
+        replayed = self.book(first)
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed["Idempotent-Replayed"], "true")
+        self.assertEqual(replayed.json(), created.json())
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        # Тот же ключ с другим телом - 422, запрос не выполняется
+        self.assertEqual(self.book(second).status_code, 422)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        # У другого клиента свои ключи
+        other = self.book(second, client_id="2")
+        self.assertEqual(other.status_code, 201)
+        self.assertFalse(other.has_header("Idempotent-Replayed"))
+
+    def test_handler_error_rolls_back(self):
+        def handler():
+            Slot.objects.filter(pk=self.slot.pk).update(capacity=5)
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            idempotent("k", "test", {}, handler, client="ip:127.0.0.1")
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+# Лист ожидания: каждое просроченное предложение уходит следующему водителю
+class WaitlistExpiryTests(TestCase):
+    def test_expire_offers_on_multi_place_slot(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        day = date.today() + timedelta(days=1)
+        slot = Slot.objects.create(tenant=tenant, date=day, time=time(9, 0), capacity=2)
+        entries = [
+            WaitlistEntry.objects.create(
+                driver=make_driver(tenant, f"+7900000006{n}", f"WLT00{n}"),
+                date_from=day,
+                date_to=day,
+            )
+            for n in range(4)
+        ]
+        first = [waitlist.offer_slot(slot.pk) for _ in range(3)]
+        self.assertIsNone(first[2])
+
+        expired = waitlist.expire_offers(timezone.now() + timedelta(days=1))
+        self.assertEqual(expired, 2)
+        pending = WaitlistOffer.objects.filter(slot=slot, status=OfferStatus.PENDING)
+        offered = {offer.entry_id for offer in first[:2]}
+        self.assertEqual(
+            set(pending.values_list("entry_id", flat=True)),
+            {entry.pk for entry in entries} - offered,
+        )
+
+
+# Прерванная рассылка продолжается только для тех, кому она еще не ушла
+class BroadcastResumeTests(TestCase):
+    def test_resume_stale(self):
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        drivers = [
+            make_driver(tenant, f"+7900000007{n}", f"BRD00{n}") for n in range(3)
+        ]
+        for n, driver in enumerate(drivers):
+            driver.chat_id = 1000 + n
+            driver.save()
+        old = timezone.now() - timedelta(seconds=broadcast.BROADCAST_STALE_SECONDS + 1)
+        stale = Broadcast.objects.create(
+            text="Рассылка",
+            tenant=tenant,
+            status=BroadcastStatus.RUNNING,
+            total=3,
+            recipients=[driver.pk for driver in drivers],
+            progress_at=old,
+        )
+        Notification.objects.create(
+            driver=drivers[0], text="Рассылка", broadcast=stale, delivered=True
+        )
+        NotificationArchive.objects.create(
+            id=Notification.objects.get().pk + 1,
+            driver=drivers[1],
+            tenant=tenant,
+            text="Рассылка",
+            created_at=old,
+            broadcast=stale,
+            delivered=True,
+        )
+
+        # Рассылка с недавним прогрессом идет в другом процессе
+        Broadcast.objects.create(
+            text="Идет",
+            status=BroadcastStatus.RUNNING,
+            total=1,
+            recipients=[drivers[0].pk],
+            progress_at=timezone.now(),
+        )
+        with mock.patch.object(broadcast, "run_broadcast") as run:
+            self.assertEqual(broadcast.resume_broadcasts(), 1)
+        run.assert_called_once_with(
+            stale.pk, "Рассылка", [(drivers[2].pk, tenant.pk, 1002)]
+        )
+
+
+# Замер API идет от имени бота: лимиты частоты по умолчанию его не отклоняют.
+# Потоки замера работают со своими соединениями, поэтому данные фиксируются
+@override_settings(THROTTLE_BOT_TOKEN="")
+class BenchApiTests(TransactionTestCase):
+    def setUp(self):
+
+        # Ведра с учетом ожиданий: ни один запрос замера не должен ждать
+        store = throttling.LocalBuckets()
+        take, self.waits = store.take, []
+
+        def counted_take(*args):
+            self.waits.append(take(*args))
+            return self.waits[-1]
+
+        store.take = counted_take
+        patcher = mock.patch.object(throttling, "_store", store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        make_driver(tenant, "+79000000080", "BEN001")
+        Slot.objects.create(
+            tenant=tenant, date=date.today() + timedelta(days=1), time=time(9, 0)
+        )
+
+    def test_not_throttled(self):
+        out = StringIO()
+        call_command("bench_api", requests=400, threads=2, stdout=out)
+        self.assertIn("Запросов: 400 в 2 потоков, ошибок: 0", out.getvalue())
+        self.assertEqual(len(self.waits), 800)
+        self.assertFalse(any(self.waits))
+
+
+# Профилирование по заголовку X-Profile: профиль сохраняется и содержит
+# представление - и под WSGI, и под ASGI (синхронное представление в потоке)
+@override_settings(PROFILE_TOKEN="profile-secret", PROFILE_SAMPLE_RATE=0)
+class ProfilingTests(TestCase):
+    url = "/api/slots/free_dates/"
+    headers = {"X-Profile": "profile-secret"}
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.directory = Path(directory)
+        override = override_settings(PROFILE_DIR=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+
+    def functions(self, path):
+        return {name for _, _, name in pstats.Stats(str(path)).stats}
+
+    def profiled_functions(self, response):
+        self.assertEqual(response.status_code, 200)
+        return self.functions(self.directory / response["X-Profile-File"])
+
+    def test_sync_request(self):
+        response = self.client.get(
+            self.url, {"tenant": self.tenant.pk}, headers=self.headers
+        )
+        self.assertIn("free_dates", self.profiled_functions(response))
+
+    async def test_async_request(self):
+        response = await self.async_client.get(
+            self.url, {"tenant": self.tenant.pk}, headers=self.headers
+        )
+        self.assertIn("free_dates", self.profiled_functions(response))
+
+        # Python 3.12+: один профиль на все потоки, без второго в потоке запроса
+        with mock.patch.object(profiling, "PER_THREAD_PROFILE", False):
+            response = await self.async_client.get(
+                self.url, {"tenant": self.tenant.pk}, headers=self.headers
+            )
+        self.assertIn("get_response_async", self.profiled_functions(response))
+
+    async def test_async_view(self):
+        async def slot_view(request):
+            await asyncio.sleep(0)
+            return HttpResponse()
+
+        middleware = profiling.ProfilingMiddleware(slot_view)
+        response = await middleware(RequestFactory().get("/", headers=self.headers))
+        self.assertIn("slot_view", self.profiled_functions(response))
+
+    def test_bot_handler(self):
+        @profiled(Profiler(1.0, self.directory))
+        async def on_start(update):
+            return update
+
+        self.assertEqual(asyncio.run(on_start(1)), 1)
+        (path,) = self.directory.glob("*bot-on_start*.prof")
+        self.assertIn("on_start", self.functions(path))
+
+
+# Маршруты под ASGI (ASYNC_API=1): async-представления перед DRF
+class AsyncUrls:
+    urlpatterns = [path("api/", include("core.api_async")), *urls.urlpatterns]
+
+
+# Async-версии endpoints бота отвечают так же, как DRF-версии
+@override_settings(
+    THROTTLE_BOT_TOKEN="bot-secret",
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {"client": "100/m", "slots.free_dates": "2/m"},
+    },
+)
+class AsyncApiTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(throttling, "_store", throttling.LocalBuckets())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        self.driver = make_driver(self.tenant, "+79000000090", "ASY001")
+        day = date.today() + timedelta(days=1)
+        self.slots = [
+            Slot.objects.create(tenant=self.tenant, date=day, time=time(hour, 0))
+            for hour in (9, 10, 11)
+        ]
+        Appointment.objects.create(
+            slot=self.slots[0], driver=self.driver, car=self.driver.car
+        )
+
+    def async_urls(self):
+        return override_settings(ROOT_URLCONF=AsyncUrls)
+
+    async def test_same_responses(self):
+        requests = [
+            ("/api/slots/free_dates/", {"tenant": self.tenant.pk}),
+            ("/api/slots/", {"tenant": self.tenant.pk}),
+            ("/api/slots/", {}),
+            ("/api/drivers/by_phone/", {"phone": "8 (900) 000-00-90"}),
+            ("/api/drivers/by_phone/", {"phone": "+79000000099"}),
+            ("/api/appointments/active_by_phone/", {"phone": self.driver.phone}),
+            ("/api/appointments/active_by_phone/", {"phone": "+79000000099"}),
+        ]
+        for url, params in requests:
+            with self.subTest(url=url, params=params):
+                # Кэш ответов общий у обеих версий: сравниваем свежие ответы
+                cache.clear()
+                expected = await self.async_client.get(url, params)
+                cache.clear()
+                with self.async_urls():
+                    response = await self.async_client.get(url, params)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.json(), expected.json())
+
+    async def test_idempotent_replay(self):
+        data = {
+            "slot_id": self.slots[1].pk,
+            "driver": self.driver.pk,
+            "car": self.driver.car_id,
+        }
+        headers = {
+            "Idempotency-Key": "book:1",
+            "X-Bot-Token": "bot-secret",
+            "X-Client-Id": "1",
+        }
+        with self.async_urls():
+            created = await self.async_client.post(
+                "/api/appointments/",
+                data,
+                content_type="application/json",
+                headers=headers,
+            )
+            replayed = await self.async_client.post(
+                "/api/appointments/",
+                data,
+                content_type="application/json",
+                headers=headers,
+            )
+        self.assertEqual(created.status_code, 201)
+        self.assertFalse(created.has_header("Idempotent-Replayed"))
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed["Idempotent-Replayed"], "true")
+        self.assertEqual(replayed.json(), created.json())
+        self.assertEqual(
+            await Appointment.objects.filter(slot=self.slots[1]).acount(), 1
+        )
+
+    async def test_retry_after(self):
+        url = "/api/slots/free_dates/"
+        with self.async_urls():
+            statuses = [
+                (
+                    await self.async_client.get(url, {"tenant": self.tenant.pk})
+                ).status_code
+                for _ in range(2)
+            ]
+            response = await self.async_client.get(url, {"tenant": self.tenant.pk})
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+        self.assertIn("detail", response.json())
+
+
+# Поиск: триграммы по госномеру и ФИО, фразы в кавычках в админке, компании
+class SearchTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(throttling, "_store", throttling.LocalBuckets())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        other = Tenant.objects.create(name="Такси", slug="taxi")
+        self.driver = make_driver(self.tenant, "+79000000091", "А123ВС77")
+        self.driver.last_name = "Иванов"
+        self.driver.first_name = "Анна Мария"
+        self.driver.save()
+        self.namesake = make_driver(self.tenant, "+79000000092", "К456МН77")
+        self.namesake.last_name = "Мария"
+        self.namesake.first_name = "Анна"
+        self.namesake.save()
+        self.foreign = make_driver(other, "+79000000093", "А123ВС99")
+
+    def search(self, q, **params):
+        return self.client.get("/api/search/", {"q": q, **params})
+
+    def plates(self, response):
+        return [car["plate_number"] for car in response.json()["automobiles"]]
+
+    def test_results(self):
+        response = self.search("а123вс", tenant=self.tenant.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.plates(response), ["А123ВС77"])
+        self.assertEqual(
+            [d["id"] for d in response.json()["drivers"]], [self.driver.pk]
+        )
+
+        # Опечатка в фамилии находится по триграммам
+        drivers = self.search("Иваное", tenant=self.tenant.pk).json()["drivers"]
+        self.assertEqual([d["id"] for d in drivers], [self.driver.pk])
+        self.assertEqual(drivers[0]["car_plate"], "А123ВС77")
+
+    def test_min_length(self):
+        self.assertEqual(self.search("А1").status_code, 400)
+        self.assertEqual(self.search("  А1  ").status_code, 400)
+        self.assertEqual(self.search("А12").status_code, 200)
+        self.assertEqual(self.search("А123", tenant="x").status_code, 400)
+
+    def test_tenant(self):
+        self.assertEqual(
+            sorted(self.plates(self.search("А123ВС"))), ["А123ВС77", "А123ВС99"]
+        )
+        foreign = self.search("А123ВС", tenant=self.foreign.tenant_id)
+        self.assertEqual(self.plates(foreign), ["А123ВС99"])
+        self.assertEqual(
+            [d["id"] for d in foreign.json()["drivers"]], [self.foreign.pk]
+        )
+
+    def test_admin_phrase(self):
+        model_admin = admin.site._registry[Driver]
+        request = RequestFactory().get("/admin/core/driver/")
+
+        def found(term):
+            qs, _ = model_admin.get_search_results(request, Driver.objects.all(), term)
+            return set(qs)
+
+        # Каждое слово - в любом поле; фраза в кавычках - целиком в одном поле
+        self.assertEqual(found("Анна Мария"), {self.driver, self.namesake})
+        self.assertEqual(found('"Анна Мария"'), {self.driver})
+        self.assertEqual(found("'Анна Мария' А123"), {self.driver})
+        self.assertEqual(found("К456"), {self.namesake})
+        self.assertEqual(found(""), set(Driver.objects.all()))
+
+
+# Пул соединений: соединение возвращается в пул и выдается снова, при
+# исчерпании пула запрос ждет timeout и падает с OperationalError
+class DbPoolTests(SimpleTestCase):
+    alias = "pool_test"
+
+    def setUp(self):
+        self.settings_dict = {
+            **connection.settings_dict,
+            "ENGINE": "core.db_pool",
+            "CONN_MAX_AGE": 0,
+            "OPTIONS": {"pool": {"min_size": 1, "max_size": 1, "timeout": 0.2}},
+        }
+        self.addCleanup(self.close_pool)
+
+        # Алиас нужен django.contrib.postgres (типы hstore при подключении)
+        patcher = mock.patch.dict(
+            connections.settings, {self.alias: self.settings_dict}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(connections.__delitem__, self.alias)
+        self.addCleanup(lambda: connections[self.alias].close())
+
+    def close_pool(self):
+        pool = db_pool._pools.pop((self.alias, self.settings_dict["NAME"]), None)
+        if pool is not None:
+            pool.close()
+
+    def wrapper(self):
+        return db_pool.DatabaseWrapper(self.settings_dict, self.alias)
+
+    def test_checkout_and_return(self):
+        first = connections[self.alias]
+        first.ensure_connection()
+        raw = first.connection
+        stats = db_pool.pool_stats()[self.alias]
+        self.assertEqual(stats["pool_size"], 1)
+        self.assertEqual(stats["pool_available"], 0)
+
+        # close() возвращает соединение в пул, следующий запрос получает его же
+        first.close()
+        self.assertIsNone(first.connection)
+        self.assertFalse(raw.closed)
+        self.assertEqual(db_pool.pool_stats()[self.alias]["pool_available"], 1)
+        second = self.wrapper()
+        with second.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            self.assertEqual(cursor.fetchone(), (1,))
+        self.assertIs(second.connection, raw)
+        second.close()
+        self.assertEqual(db_pool.pool_stats()[self.alias]["requests_num"], 2)
+
+    def test_exhausted(self):
+        busy = connections[self.alias]
+        busy.ensure_connection()
+        with self.assertRaises(OperationalError):
+            self.wrapper().ensure_connection()
+        self.assertEqual(db_pool.pool_stats()[self.alias]["requests_errors"], 1)
+
+        # После возврата соединения пул снова выдает его
+        busy.close()
+        waiting = self.wrapper()
+        waiting.ensure_connection()
+        waiting.close()
+
+    def test_conn_max_age(self):
+        with self.assertRaises(ImproperlyConfigured):
+            db_pool.DatabaseWrapper(
+                {**self.settings_dict, "CONN_MAX_AGE": 60}, self.alias
+            )
+
+
+# Обновление бота от водителя user_id
+def make_update(update_id, user_id):
+    message = Message(
+        update_id,
+        datetime.now(),
+        Chat(user_id, Chat.PRIVATE),
+        from_user=User(user_id, "Водитель", False),
+    )
+    return Update(update_id, message=message)
+
+
+# Обработка обновлений бота: по очереди для водителя, параллельно для разных
+class PerUserUpdateProcessorTests(SimpleTestCase):
+    async def process(self, processor, updates, handler):
+        await asyncio.wait_for(
+            asyncio.gather(
+                *(
+                    processor.process_update(update, handler(update))
+                    for update in updates
+                )
+            ),
+            timeout=5,
+        )
+
+    async def test_same_user_in_order(self):
+        done = []
+
+        # Ранние обновления обрабатываются дольше поздних
+        async def handler(update):
+            await asyncio.sleep(0.01 * (5 - update.update_id))
+            done.append(update.update_id)
+
+        processor = PerUserUpdateProcessor(4)
+        await self.process(processor, [make_update(n, 1) for n in range(5)], handler)
+        self.assertEqual(done, [0, 1, 2, 3, 4])
+        self.assertEqual(processor.stats()["max_user_queue"], 5)
+        self.assertEqual(processor.stats()["active_users"], 0)
+
+    async def test_users_concurrent(self):
+        started = {1: asyncio.Event(), 2: asyncio.Event()}
+
+        # Каждый обработчик ждет начала другого: по очереди они бы не завершились
+        async def handler(update):
+            user_id = update.effective_user.id
+            started[user_id].set()
+            await started[3 - user_id].wait()
+
+        processor = PerUserUpdateProcessor(2)
+        await self.process(processor, [make_update(1, 1), make_update(2, 2)], handler)
+        self.assertEqual(processor.stats()["processed"], 2)
+
+    async def test_concurrency_bound(self):
+        running = peak = 0
+
+        async def handler(update):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        processor = PerUserUpdateProcessor(2)
+        await self.process(processor, [make_update(n, n) for n in range(1, 7)], handler)
+        self.assertEqual(peak, 2)
+        stats = processor.stats()
+        self.assertEqual(stats["processed"], 6)
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(stats["waiting_worker"], 0)
+
+
+# Сводка админки: цифры по сводкам загрузки и уведомлениям, сброс кэша
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        # Среда через неделю: вторник - прошедший день недели, четверг - будущий
+        base = date.today() + timedelta(days=7)
+        self.today = base + timedelta(days=(2 - base.weekday()) % 7)
+        self.tenant = Tenant.objects.create(name="Автопарк", slug="fleet")
+        self.drivers = [
+            make_driver(self.tenant, f"+7900000010{n}", f"DSH00{n}") for n in range(5)
+        ]
+        self.slots = {
+            offset: Slot.objects.create(
+                tenant=self.tenant,
+                date=self.today + timedelta(days=offset),
+                time=time(9, 0),
+                capacity=capacity,
+            )
+            for offset, capacity in ((-1, 1), (0, 3), (1, 2), (5, 1))
+        }
+        for offset, driver, status in (
+            (0, 0, AppointmentStatus.ACTIVE),
+            (0, 1, AppointmentStatus.CANCELLED_USER),
+            (1, 2, AppointmentStatus.CANCELLED_MANAGER),
+            (-1, 3, AppointmentStatus.ACTIVE),
+            (5, 4, AppointmentStatus.ACTIVE),
+        ):
+            self.book(self.slots[offset], self.drivers[driver], status)
+
+        # Другая компания: видна только в общей сводке
+        other = Tenant.objects.create(name="Такси", slug="taxi")
+        make_driver(other, "+79000000105", "DSH005")
+        Slot.objects.create(tenant=other, date=self.today, time=time(9, 0), capacity=5)
+
+        tz = timezone.get_current_timezone()
+        for delivered, day in (
+            (False, self.today),
+            (False, self.today - timedelta(days=1)),
+            (True, self.today),
+            (False, self.today - timedelta(days=7)),
+        ):
+            notification = Notification.objects.create(
+                driver=self.drivers[0], text="Напоминание", delivered=delivered
+            )
+            Notification.objects.filter(pk=notification.pk).update(
+                created_at=datetime.combine(day, time(12, 0), tzinfo=tz)
+            )
+
+    def book(self, slot, driver, status=AppointmentStatus.ACTIVE):
+        appointment = Appointment.objects.create(
+            slot=slot, driver=driver, car=driver.car
+        )
+        if status != AppointmentStatus.ACTIVE:
+            appointment.status = status
+            appointment.save()
+        return appointment
+
+    def test_figures(self):
+        stats = compute_stats(self.today, [self.tenant.pk])
+        self.assertEqual(stats["week_start"], self.today - timedelta(days=2))
+        self.assertEqual(stats["week_end"], self.today + timedelta(days=4))
+        self.assertEqual(
+            {k: v for k, v in stats.items() if isinstance(v, int)},
+            {
+                "booked_today": 1,
+                "booked_week": 2,
+                "cancelled_today": 1,
+                "cancelled_week": 2,
+                "free_today": 2,
+                "free_week": 4,
+                "failed_today": 1,
+                "failed_week": 2,
+                "cars_without_booking": 3,
+            },
+        )
+
+        everything = compute_stats(self.today)
+        self.assertEqual(everything["free_today"], 7)
+        self.assertEqual(everything["cars_without_booking"], 4)
+
+    def test_invalidation(self):
+        stats = dashboard_stats(self.today, [self.tenant.pk])
+        self.assertEqual(stats["booked_week"], 2)
+
+        # Новая запись меняет версию SLOTS_NS после COMMIT
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.book(self.slots[1], self.drivers[1])
+        cached = dashboard_stats(self.today, [self.tenant.pk])
+        self.assertEqual(cached["computed_at"], stats["computed_at"])
+        for callback in callbacks:
+            callback()
+        stats = dashboard_stats(self.today, [self.tenant.pk])
+        self.assertEqual(stats["booked_week"], 3)
+        self.assertEqual(stats["cars_without_booking"], 2)
+
+        # Недоставленное уведомление меняет версию DASHBOARD_NS
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(
+                driver=self.drivers[1], text="Напоминание", delivered=False
+            )
+        recomputed = dashboard_stats(self.today, [self.tenant.pk])
+        self.assertGreater(recomputed["computed_at"], stats["computed_at"])
+
+
+# Профиль настроек DJANGO_ENV=production: настройки читаются в отдельном
+# процессе, так как выбираются один раз при импорте
+class ProductionSettingsTests(SimpleTestCase):
+    script = (
+        "import json; from fleetcare import settings as s; print(json.dumps({"
+        "'debug': s.DEBUG, 'templates': s.TEMPLATES[0], 'middleware': s.MIDDLEWARE,"
+        "'conn_max_age': s.DATABASES['default'].get('CONN_MAX_AGE'),"
+        "'staticfiles': s.STORAGES['staticfiles']['BACKEND']}))"
+    )
+
+    def load(self, **env):
+        environ = {
+            k: v
+            for k, v in os.environ.items()
+            if k not in ("DJANGO_DEBUG", "DB_CONN_MAX_AGE")
+        }
+        return subprocess.run(
+            [sys.executable, "-c", self.script],
+            cwd=settings.BASE_DIR,
+            env={**environ, "DB_POOL": "0", "THROTTLE_BOT_TOKEN": "", **env},
+            capture_output=True,
+            text=True,
+        )
+
+    def values(self, **env):
+        result = self.load(**env)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return json.loads(result.stdout)
+
+    def test_production(self):
+        values = self.values(DJANGO_ENV="production", THROTTLE_BOT_TOKEN="secret")
+        self.assertFalse(values["debug"])
+        self.assertEqual(values["conn_max_age"], 600)
+        self.assertFalse(values["templates"]["APP_DIRS"])
+        (loader,) = values["templates"]["OPTIONS"]["loaders"]
+        self.assertEqual(loader[0], "django.template.loaders.cached.Loader")
+
+        whitenoise = importlib.util.find_spec("whitenoise") is not None
+        self.assertEqual(
+            "whitenoise.middleware.WhiteNoiseMiddleware" in values["middleware"],
+            whitenoise,
+        )
+        self.assertEqual(
+            values["staticfiles"],
+            (
+                "whitenoise.storage.CompressedManifestStaticFilesStorage"
+                if whitenoise
+                else "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"
+            ),
+        )
+
+        # DEBUG можно включить явно
+        debug = self.values(
+            DJANGO_ENV="production", THROTTLE_BOT_TOKEN="secret", DJANGO_DEBUG="1"
+        )
+        self.assertTrue(debug["debug"])
+
+    def test_bot_token_required(self):
+        result = self.load(DJANGO_ENV="production")
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("ImproperlyConfigured", result.stderr)
+        self.assertIn("THROTTLE_BOT_TOKEN", result.stderr)
+
+    def test_development(self):
+        values = self.values(DJANGO_ENV="development")
+        self.assertTrue(values["debug"])
+        self.assertEqual(values["conn_max_age"], 60)
+        self.assertTrue(values["templates"]["APP_DIRS"])
+        self.assertNotIn("loaders", values["templates"]["OPTIONS"])
+        self.assertEqual(
+            values["staticfiles"],
+            "django.contrib.staticfiles.storage.StaticFilesStorage",
+        )
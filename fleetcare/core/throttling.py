@@ -0,0 +1,144 @@
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Ограничение частоты запросов к API (token bucket) без записей в БД.
+# Два уровня: общий лимит клиента на все endpoints ("client") и лимит клиента
+# на отдельный endpoint ("drivers.by_phone", "slots.free_dates", ...), если для
+# него задан rate. Rate - "запросов/период" (s, m, h, d): столько запросов
+# допускается подряд, дальше - равномерно. Отклоненный запрос получает 429
+# и Retry-After (через сколько секунд появится токен).
+# Клиент - IP-адрес; бот (заголовок X-Bot-Token = THROTTLE_BOT_TOKEN) ходит от
+# имени многих водителей, поэтому его клиент - водитель из X-Client-Id
+BOT_TOKEN_HEADER = "HTTP_X_BOT_TOKEN"
+CLIENT_ID_HEADER = "HTTP_X_CLIENT_ID"
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+# "120/m" -> (токенов в секунду, емкость ведра)
+def parse_rate(rate: str):
+    num, period = rate.split("/")
+    num = int(num)
+    return num / PERIODS[period[0]], num
+
+
+# Один шаг ведра: (новое состояние, сколько ждать; 0 - запрос пропущен)
+def take(state, now, rate, capacity):
+    tokens, updated = state or (capacity, now)
+    tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+# Ведра в памяти процесса: лимит на процесс (воркер), без сетевых вызовов.
+# Полные ведра (клиент давно не приходил) удаляются, когда их много
+class LocalBuckets:
+    max_keys = 10000
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated, full_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            state, wait = take(bucket and bucket[:2], now, rate, capacity)
+            full_at = now + (capacity - state[0]) / rate
+            self._buckets[key] = (*state, full_at)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now):
+        for key in [k for k, v in self._buckets.items() if v[2] <= now]:
+            del self._buckets[key]
+
+
+# Ведра в кэше Django: общий лимит для всех процессов при общем кэше
+# (CACHE_BACKEND=...RedisCache). Чтение и запись не атомарны, при гонке
+# могут пройти лишние запросы - для защиты от перегрузки это допустимо
+class CacheBuckets:
+    prefix = "throttle:"
+
+    def take(self, key, rate, capacity):
+        key = self.prefix + key
+        state, wait = take(cache.get(key), time.time(), rate, capacity)
+        cache.set(key, state, math.ceil(capacity / rate) + 1)
+        return wait
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = import_string(settings.THROTTLE_STORE)()
+    return _store
+
+
+# Запрос бота: X-Bot-Token совпадает с THROTTLE_BOT_TOKEN (пустой - не бот)
+def is_bot(request) -> bool:
+    token = settings.THROTTLE_BOT_TOKEN
+    return bool(token) and constant_time_compare(
+        request.META.get(BOT_TOKEN_HEADER, ""), token
+    )
+
+
+def client_key(request) -> str:
+    if is_bot(request):
+        return "bot:" + request.META.get(CLIENT_ID_HEADER, "")[:64]
+    return "ip:" + BaseThrottle().get_ident(request)
+
+
+# Проверка запроса по лимитам scopes: секунд до повтора (0 - пропущен).
+# Запрос тратит токены всех ведер, чтобы превышение не уходило в другое
+def check(request, *scopes) -> int:
+    rates = api_settings.DEFAULT_THROTTLE_RATES
+    client = client_key(request)
+    wait = 0
+    for scope in scopes:
+        rate = rates.get(scope)
+        if rate:
+            wait = max(wait, get_store().take(f"{scope}:{client}", *parse_rate(rate)))
+    return math.ceil(wait)
+
+
+# Для DRF: Retry-After ставит обработчик исключений по wait().
+# Лимит - атрибут scope (как у SimpleRateThrottle) или get_scope(view)
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+
+    def get_scope(self, view):
+        return self.scope
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        if not scope:
+            raise ImproperlyConfigured(
+                f"{type(self).__name__}: не задан scope ограничения"
+            )
+        self._wait = check(request, scope)
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+class ClientThrottle(TokenBucketThrottle):
+    scope = "client"
+
+
+class EndpointThrottle(TokenBucketThrottle):
+    def get_scope(self, view):
+        return f"{getattr(view, 'basename', None)}.{getattr(view, 'action', None)}"
@@ -1,3 +1,17 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from .api_cache import cache_stats
 
-# Create your views here.
+
+# Метрики пула соединений с БД (только для персонала)
+@staff_member_required
+def db_pool_metrics(request):
+    from .db_pool.base import pool_stats
+
+    return JsonResponse(pool_stats())
+
+
+# Статистика кэша API текущего процесса (только для персонала)
+@staff_member_required
+def api_cache_metrics(request):
+    return JsonResponse(cache_stats())
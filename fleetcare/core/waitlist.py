@@ -0,0 +1,239 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import (
+    Appointment,
+    OfferStatus,
+    Slot,
+    SlotStatus,
+    WaitlistEntry,
+    WaitlistOffer,
+    WaitlistStatus,
+    send_bot_notification,
+)
+from .serializers import AppointmentSerializer
+
+# Лист ожидания: вместо того чтобы опрашивать free_dates, водитель встает в
+# очередь на дату или диапазон дат. Освободившееся при отмене место сразу
+# предлагается следующему в очереди сообщением с кнопкой записи; предложение
+# действует WAITLIST_OFFER_TTL секунд, затем место уходит следующему
+
+# callback_data кнопок предложения (обрабатываются в bot.py)
+CB_TAKE = "WL_TAKE"  # WL_TAKE|offer_id
+CB_SKIP = "WL_SKIP"  # WL_SKIP|offer_id
+
+ACTIVE_STATUSES = (WaitlistStatus.WAITING, WaitlistStatus.OFFERED)
+
+
+# Встать в очередь (или поменять даты действующей заявки, место в очереди
+# при этом сохраняется): (заявка, создана ли)
+def join(driver, date_from, date_to):
+    entry = WaitlistEntry.objects.filter(
+        driver=driver, status__in=ACTIVE_STATUSES
+    ).first()
+    if entry is not None:
+        entry.date_from, entry.date_to = date_from, date_to
+        entry.save(update_fields=["date_from", "date_to"])
+        return entry, False
+    try:
+        with transaction.atomic():
+            entry = WaitlistEntry.objects.create(
+                driver=driver, date_from=date_from, date_to=date_to
+            )
+        return entry, True
+    except IntegrityError:
+
+        # Параллельный запрос того же водителя уже создал заявку
+        return (
+            WaitlistEntry.objects.get(driver=driver, status__in=ACTIVE_STATUSES),
+            False,
+        )
+
+
+# Покинуть очередь; неотвеченное предложение уходит следующему
+def leave(driver) -> int:
+    with transaction.atomic():
+        entries = WaitlistEntry.objects.select_for_update().filter(
+            driver=driver, status__in=ACTIVE_STATUSES
+        )
+        slot_ids = list(
+            WaitlistOffer.objects.filter(
+                entry__in=entries, status=OfferStatus.PENDING
+            ).values_list("slot_id", flat=True)
+        )
+        WaitlistOffer.objects.filter(
+            entry__in=entries, status=OfferStatus.PENDING
+        ).update(status=OfferStatus.DECLINED)
+        left = entries.update(status=WaitlistStatus.CANCELLED)
+        for slot_id in slot_ids:
+            transaction.on_commit(lambda slot_id=slot_id: place_released(slot_id))
+    return left
+
+
+# Следующая заявка для слота: ожидающая, покрывает дату слота и еще не
+# получала предложение на этот слот. Один запрос по индексу waitlist_queue
+def next_entry(slot: Slot):
+    offered = WaitlistOffer.objects.filter(entry=OuterRef("pk"), slot=slot)
+    return (
+        WaitlistEntry.objects.filter(
+            tenant_id=slot.tenant_id,
+            status=WaitlistStatus.WAITING,
+            date_from__lte=slot.date,
+            date_to__gte=slot.date,
+        )
+        .filter(~Exists(offered))
+        .order_by("created_at")
+    )
+
+
+# Предложить свободное место слота следующему водителю из очереди.
+# Мест предлагается не больше, чем свободно в слоте (None - нет
+# места или водителя в очереди)
+def offer_slot(slot_id) -> WaitlistOffer | None:
+    with transaction.atomic():
+        slot = (
+            Slot.objects.select_for_update()
+            .filter(pk=slot_id, status=SlotStatus.FREE, date__gte=timezone.localdate())
+            .first()
+        )
+        if slot is None:
+            return None
+        pending = slot.waitlist_offers.filter(status=OfferStatus.PENDING).count()
+        if slot.available <= pending:
+            return None
+        entry = (
+            next_entry(slot)
+            .select_for_update(skip_locked=True)
+            .select_related("driver")
+            .first()
+        )
+        if entry is None:
+            return None
+        offer = WaitlistOffer.objects.create(
+            entry=entry,
+            slot=slot,
+            expires_at=timezone.now() + timedelta(seconds=settings.WAITLIST_OFFER_TTL),
+        )
+        entry.status = WaitlistStatus.OFFERED
+        entry.save(update_fields=["status"])
+        transaction.on_commit(lambda: notify_offer(offer))
+    return offer
+
+
+def notify_offer(offer: WaitlistOffer):
+    expires = timezone.localtime(offer.expires_at)
+    send_bot_notification(
+        offer.entry.driver,
+        f"Освободилось место на ТО {offer.slot.date} в {offer.slot.time:%H:%M}.\n"
+        f"Предложение действует до {expires:%H:%M}.",
+        reply_markup={
+            "inline_keyboard": [
+                [
+                    {"text": "Записаться", "callback_data": f"{CB_TAKE}|{offer.pk}"},
+                    {"text": "Не подходит", "callback_data": f"{CB_SKIP}|{offer.pk}"},
+                ]
+            ]
+        },
+    )
+
+
+# Место освободилось (отмена записи): ошибки листа ожидания не должны
+# влиять на уже выполненную отмену
+def place_released(slot_id):
+    try:
+        offer_slot(slot_id)
+    except Exception:
+        logging.exception("Лист ожидания: не удалось предложить слот %s", slot_id)
+
+
+# Закрыть предложение и вернуть водителя в очередь (или отметить записанным)
+def _close(offer: WaitlistOffer, status, entry_status=WaitlistStatus.WAITING):
+    offer.status = status
+    offer.save(update_fields=["status"])
+    WaitlistEntry.objects.filter(
+        pk=offer.entry_id, status=WaitlistStatus.OFFERED
+    ).update(status=entry_status)
+
+
+# Предложение водителя с этим телефоном (заблокированное до конца транзакции)
+def _pending_offer(offer_id, phone):
+    offer = (
+        WaitlistOffer.objects.select_for_update(of=("self",))
+        .select_related("slot", "entry__driver")
+        .filter(pk=offer_id, entry__driver__phone=phone)
+        .first()
+    )
+    if offer is None:
+        return None, (404, {"detail": "offer not found"})
+    if offer.status == OfferStatus.PENDING and offer.expires_at <= timezone.now():
+        _close(offer, OfferStatus.EXPIRED)
+        transaction.on_commit(lambda: place_released(offer.slot_id))
+    if offer.status != OfferStatus.PENDING:
+        return None, (
+            410,
+            {"detail": "offer is no longer available", "status": offer.status},
+        )
+    return offer, None
+
+
+# Запись по предложению в одно нажатие: (status, data) как у create_appointment
+def accept_offer(offer_id, phone):
+    with transaction.atomic():
+        offer, error = _pending_offer(offer_id, phone)
+        if error:
+            return error
+        driver = offer.entry.driver
+        if not driver.car_id:
+            return 400, {"detail": "driver has no car"}
+        appointment = Appointment(slot=offer.slot, driver=driver, car_id=driver.car_id)
+        try:
+            with transaction.atomic():
+                appointment.save()
+        except ValidationError:
+
+            # Место успели занять напрямую, водитель остается в очереди
+            _close(offer, OfferStatus.TAKEN)
+            return 409, {"detail": "Выбранный слот уже занят"}
+        _close(offer, OfferStatus.ACCEPTED, WaitlistStatus.BOOKED)
+    return 201, AppointmentSerializer(appointment).data
+
+
+# Отказ от предложенного места: водитель остается в очереди, место - следующему
+def decline_offer(offer_id, phone):
+    with transaction.atomic():
+        offer, error = _pending_offer(offer_id, phone)
+        if error:
+            return error
+        _close(offer, OfferStatus.DECLINED)
+        transaction.on_commit(lambda: place_released(offer.slot_id))
+    return 200, {"detail": "declined"}
+
+
+# Просроченные предложения: водители возвращаются в очередь (на этот слот
+# им больше не предлагается), места предлагаются следующим
+def expire_offers(now=None) -> int:
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = list(
+            WaitlistOffer.objects.filter(
+                status=OfferStatus.PENDING, expires_at__lte=now
+            )
+            .select_for_update(skip_locked=True)
+            .values_list("id", "entry_id", "slot_id")
+        )
+        if not due:
+            return 0
+        ids, entry_ids, slot_ids = zip(*due)
+        WaitlistOffer.objects.filter(id__in=ids).update(status=OfferStatus.EXPIRED)
+        WaitlistEntry.objects.filter(
+            id__in=entry_ids, status=WaitlistStatus.OFFERED
+        ).update(status=WaitlistStatus.WAITING)
+
+    # Каждое просроченное предложение освобождает одно место слота
+    for slot_id in slot_ids:
+        place_released(slot_id)
+    return len(due)
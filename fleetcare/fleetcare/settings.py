@@ -1,5 +1,7 @@
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
+import importlib.util
 import os
 
 # Загружаем .env один раз при старте Django
@@ -15,10 +17,14 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv("DJANGO_SECRET_KEY", "some_key")
 
+# Профиль настроек: DJANGO_ENV=production - боевой режим (DEBUG и журнал SQL
+# выключены, кэш шаблонов, долгоживущие соединения с БД, сжатая статика с хэшами)
+PRODUCTION = os.getenv("DJANGO_ENV", "development") == "production"
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv("DJANGO_DEBUG", "0" if PRODUCTION else "1") == "1"
 
-ALLOWED_HOSTS = ["*"]
+ALLOWED_HOSTS = os.getenv("DJANGO_ALLOWED_HOSTS", "*").split(",")
 
 
 # Application definition
@@ -32,6 +38,8 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    # Триграммный поиск (pg_trgm)
+    "django.contrib.postgres",
     # Наше приложение
     "core",
     # DRF для бота
@@ -39,7 +47,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Выборочное профилирование запросов (выключено, пока не задано PROFILE_*)
+    "core.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # Чтение с реплик, запись и read-your-writes - с основной БД
+    "core.db_routing.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -48,6 +60,14 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Статика в боевом режиме раздается самим приложением (pip install whitenoise)
+WHITENOISE = PRODUCTION and importlib.util.find_spec("whitenoise") is not None
+if WHITENOISE:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("django.middleware.security.SecurityMiddleware") + 1,
+        "whitenoise.middleware.WhiteNoiseMiddleware",
+    )
+
 ROOT_URLCONF = "fleetcare.urls"
 
 TEMPLATES = [
@@ -66,7 +86,25 @@ TEMPLATES = [
     },
 ]
 
+# В боевом режиме шаблоны компилируются один раз на процесс и не перечитываются
+if PRODUCTION:
+    TEMPLATES[0]["APP_DIRS"] = False
+    TEMPLATES[0]["OPTIONS"]["loaders"] = [
+        (
+            "django.template.loaders.cached.Loader",
+            [
+                "django.template.loaders.filesystem.Loader",
+                "django.template.loaders.app_directories.Loader",
+            ],
+        )
+    ]
+
 WSGI_APPLICATION = "fleetcare.wsgi.application"
+ASGI_APPLICATION = "fleetcare.asgi.application"
+
+# Async-версии endpoints бота (core/api_async.py) - включать при запуске под ASGI:
+# ASYNC_API=1 uvicorn fleetcare.asgi:application --workers 4
+ASYNC_API = os.getenv("ASYNC_API", "0") == "1"
 
 
 # Database
@@ -81,9 +119,86 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", "1234"),
         "HOST": os.getenv("POSTGRES_HOST", "localhost"),
         "PORT": os.getenv("POSTGRES_PORT", "5432"),
+        # Постоянные соединения: не открывать новое на каждый запрос
+        "CONN_MAX_AGE": int(
+            os.getenv("DB_CONN_MAX_AGE", "600" if PRODUCTION else "60")
+        ),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Пул соединений psycopg 3 (DB_POOL=1): соединение берется из пула на запрос
+# и возвращается в него, CONN_MAX_AGE в этом режиме не используется
+if os.getenv("DB_POOL", "0") == "1":
+    DATABASES["default"].update(
+        {
+            "ENGINE": "core.db_pool",
+            "CONN_MAX_AGE": 0,
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+                    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+                    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+                    "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+                    "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                    "health_check": os.getenv("DB_POOL_HEALTH_CHECK", "1") == "1",
+                }
+            },
+        }
+    )
+
+# Реплики только для чтения: POSTGRES_REPLICA_HOSTS=host1:5432,host2
+# В тестах реплики зеркалируют default (отдельная тестовая БД не создается)
+DATABASE_REPLICAS = []
+for i, host in enumerate(
+    filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), 1
+):
+    host, _, port = host.strip().partition(":")
+    alias = f"replica_{i}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.db_routing.PrimaryReplicaRouter"]
+
+# Сколько секунд после записи клиент читает с основной БД (read-your-writes)
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "5"))
+
+# Кэш: по умолчанию в памяти процесса, для нескольких процессов - общий
+# (например CACHE_BACKEND=django.core.cache.backends.redis.RedisCache)
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "fleetcare"),
+    }
+}
+if CACHES["default"]["BACKEND"].endswith(("LocMemCache", "FileBasedCache")):
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": 10000}
+
+# Время жизни закэшированных ответов API (инвалидация - по сигналам)
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "60"))
+
+# Время жизни сводки на главной странице админки (сбрасывается и по сигналам)
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "30"))
+
+# Календари iCalendar (core/ical.py): время жизни текста ленты в кэше (ключ
+# содержит версию данных), длительность события ТО в минутах, токен лент
+# менеджеров по дням (пусто - отключены) и внешний адрес сайта для ссылок
+CALENDAR_CACHE_TTL = int(os.getenv("CALENDAR_CACHE_TTL", "3600"))
+SERVICE_DURATION_MINUTES = int(os.getenv("SERVICE_DURATION_MINUTES", "60"))
+CALENDAR_TOKEN = os.getenv("CALENDAR_TOKEN", "")
+PUBLIC_URL = os.getenv("PUBLIC_URL", "").rstrip("/")
+
+# Табло записей на сегодня (core/board.py, под ASGI): сколько секунд держится
+# поток событий, после чего браузер переподключается и получает свежий снимок
+BOARD_STREAM_SECONDS = int(os.getenv("BOARD_STREAM_SECONDS", "300"))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -105,6 +220,22 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "static"
 
+# Боевой режим: имена файлов с хэшем содержимого (долгий кэш в браузере),
+# с whitenoise - еще и заранее сжатые копии (gzip/brotli).
+# Перед запуском нужен python manage.py collectstatic
+if WHITENOISE:
+    STATICFILES_BACKEND = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+elif PRODUCTION:
+    STATICFILES_BACKEND = (
+        "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"
+    )
+else:
+    STATICFILES_BACKEND = "django.contrib.staticfiles.storage.StaticFilesStorage"
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": STATICFILES_BACKEND},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -114,15 +245,57 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [],
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"],
+    # JSON через orjson, для браузера - стандартная HTML-страница DRF
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    # Ограничение частоты (token bucket, см. core/throttling.py): общий лимит
+    # клиента и лимиты горячих endpoints ("<basename>.<action>")
+    "DEFAULT_THROTTLE_CLASSES": [
+        "core.throttling.ClientThrottle",
+        "core.throttling.EndpointThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "client": os.getenv("THROTTLE_CLIENT_RATE", "120/m"),
+        "drivers.by_phone": os.getenv("THROTTLE_LOOKUP_RATE", "30/m"),
+        "appointments.active_by_phone": os.getenv("THROTTLE_LOOKUP_RATE", "30/m"),
+        "slots.list": os.getenv("THROTTLE_SLOTS_RATE", "30/m"),
+        "slots.free_dates": os.getenv("THROTTLE_SLOTS_RATE", "30/m"),
+        "search.list": os.getenv("THROTTLE_SLOTS_RATE", "30/m"),
+        "service-records.list": os.getenv("THROTTLE_SLOTS_RATE", "30/m"),
+        "appointments.create": os.getenv("THROTTLE_WRITE_RATE", "10/m"),
+        "appointments.cancel_user": os.getenv("THROTTLE_WRITE_RATE", "10/m"),
+        "waitlist.create": os.getenv("THROTTLE_WRITE_RATE", "10/m"),
+    },
 }
 
+# Где хранятся ведра лимитов: в памяти процесса (лимит на воркер) или в кэше
+# Django (core.throttling.CacheBuckets - общий лимит при общем кэше, Redis)
+THROTTLE_STORE = os.getenv("THROTTLE_STORE", "core.throttling.LocalBuckets")
+
+# Токен бота (заголовок X-Bot-Token): запросы бота ограничиваются по водителю,
+# а не по IP бота; он же открывает боту ссылки на календари водителей.
+# Пусто - бот ограничивается как обычный клиент, то есть все водители делят
+# один лимит; это допустимо только при разработке
+THROTTLE_BOT_TOKEN = os.getenv("THROTTLE_BOT_TOKEN", "")
+if PRODUCTION and not THROTTLE_BOT_TOKEN:
+    raise ImproperlyConfigured("DJANGO_ENV=production требует THROTTLE_BOT_TOKEN")
+
+# MessagePack - если установлен (Accept: application/msgpack)
+if importlib.util.find_spec("msgpack"):
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].insert(
+        1, "core.renderers.MsgpackRenderer"
+    )
+
 # Брендинг и меню
 JAZZMIN_SETTINGS = {
     "site_title": "FleetCare Admin",
     "site_header": "FleetCare",
     "site_brand": "FleetCare",
     "welcome_sign": "Добро пожаловать в панель менеджера",
-    "show_ui_builder": True,
+    # Конструктор темы - только при разработке
+    "show_ui_builder": DEBUG,
     "related_modal_active": True,
     "changeform_format": "vertical_tabs",
 }
@@ -135,3 +308,26 @@ JAZZMIN_UI_TWEAKS = {
     "footer_fixed": False,
     "sidebar_fixed": True,
 }
+
+# Журнал уведомлений: сколько дней хранить в основной таблице
+# (старше - переносятся в архив командой archive_notifications)
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+
+# Слоты и записи: через сколько дней после даты слота переносить в архив
+# (команда archive_slots), история доступна через SlotHistory/AppointmentHistory
+SLOT_RETENTION_DAYS = int(os.getenv("SLOT_RETENTION_DAYS", "30"))
+
+# Лист ожидания: сколько секунд действует предложение освободившегося места
+WAITLIST_OFFER_TTL = int(os.getenv("WAITLIST_OFFER_TTL", "900"))
+
+# Idempotency-Key для записи/отмены: сколько хранить ответ для повторов (сек)
+# и через сколько считать зависший незавершенный запрос брошенным
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+# Профилирование запросов (core/profiling.py): доля профилируемых запросов 0..1,
+# токен для заголовка X-Profile, каталог .prof-файлов, минимальная длительность (мс)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(BASE_DIR / "profiles"))
+PROFILE_MIN_MS = float(os.getenv("PROFILE_MIN_MS", "0"))
@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from core.api import router as api_router
+from core.board import board_events
+from core.ical import day_calendar, driver_calendar
+from core.views import api_cache_metrics, db_pool_metrics
 
 urlpatterns = [
     
@@ -9,4 +13,18 @@ urlpatterns = [
     
     # Телега
     path("api/", include(api_router.urls)),
+
+    # Календари (.ics)
+    path("calendar/driver/<str:token>.ics", driver_calendar, name="driver_calendar"),
+    path("calendar/day/<str:day>.ics", day_calendar, name="day_calendar"),
+
+    # Метрики
+    path("metrics/db-pool/", db_pool_metrics),
+    path("metrics/api-cache/", api_cache_metrics),
 ]
+
+# Под ASGI горячие endpoints бота обслуживаются async-представлениями,
+# табло записей на сегодня получает изменения потоком server-sent events
+if settings.ASYNC_API:
+    urlpatterns.insert(0, path("api/", include("core.api_async")))
+    urlpatterns.append(path("board/events/", board_events, name="board_events"))
@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date, time as dtime, timedelta
+from pathlib import Path
+import uvicorn
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from loadtest.fake_telegram import FakeTelegram  # noqa: E402
+
+load_dotenv(ROOT / ".env")
+
+# Сквозной нагрузочный прогон бота: локальный Telegram (fake_telegram) +
+# настоящий bot.py + работающий Django (API_BASE). Виртуальные водители проходят
+# сценарии /start, запись, информация о ТО и отмена; для каждого сценария -
+# перцентили времени от действия водителя до ответа бота и вызовы Bot API.
+#   python manage.py runserver  (или uvicorn, см. README)
+#   python -m loadtest.bot_e2e --seed --drivers 2000 --concurrency 200
+# Бот должен ходить в API с тем же THROTTLE_BOT_TOKEN, что у Django: тогда
+# лимиты частоты считаются по водителю, а не по IP бота, и задержки не
+# включают ожидание после 429
+
+USER_BASE = 10_000_000
+FLOWS = ("start", "book", "info", "cancel")
+
+
+def phone_for(index: int) -> str:
+    return f"+7990{index:07d}"
+
+
+# Компания, водители, автомобили и слоты для прогона (через ORM, та же БД,
+# что у Django)
+def seed(drivers: int, days: int):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fleetcare.settings")
+    import django
+
+    django.setup()
+    from core.api_cache import invalidate_slots
+    from core.models import Automobile, Driver, Slot, Tenant
+    from core.rollups import rebuild_days
+
+    tenant, _ = Tenant.objects.get_or_create(
+        slug="loadtest", defaults={"name": "Нагрузочный тест"}
+    )
+    plates = [f"LT{i:07d}" for i in range(drivers)]
+    Automobile.objects.bulk_create(
+        [
+            Automobile(
+                tenant=tenant,
+                plate_number=plate,
+                make="Loadtest",
+                model="E2E",
+                last_service_mileage=0,
+                next_service_mileage=10000,
+            )
+            for plate in plates
+        ],
+        ignore_conflicts=True,
+    )
+    car_ids = dict(
+        Automobile.objects.for_tenant(tenant)
+        .filter(plate_number__in=plates)
+        .values_list("plate_number", "id")
+    )
+    Driver.objects.bulk_create(
+        [
+            Driver(
+                tenant=tenant,
+                first_name=f"Водитель{i}",
+                last_name="Нагрузочный",
+                phone=phone_for(i),
+                car_id=car_ids[plate],
+            )
+            for i, plate in enumerate(plates)
+        ],
+        ignore_conflicts=True,
+    )
+
+    # Слоты на ближайшие дни с вместимостью на всех водителей
+    capacity = min(drivers, 32767)
+    dates = [date.today() + timedelta(days=d) for d in range(1, days + 1)]
+    Slot.objects.bulk_create(
+        [
+            Slot(
+                tenant=tenant,
+                date=d,
+                time=dtime(h, 0),
+                capacity=capacity,
+                available=capacity,
+            )
+            for d in dates
+            for h in range(9, 18)
+        ],
+        ignore_conflicts=True,
+    )
+    invalidate_slots(tenant.pk)
+    rebuild_days(dates)
+
+
+def percentiles(timings):
+    if len(timings) < 2:
+        return "—"
+    q = statistics.quantiles(timings, n=100)
+    return (
+        f"p50 {q[49] * 1000:.0f} мс, p95 {q[94] * 1000:.0f} мс, "
+        f"p99 {q[98] * 1000:.0f} мс"
+    )
+
+
+def buttons(message):
+    markup = message.get("reply_markup") or {}
+    return [
+        b["callback_data"] for row in markup.get("inline_keyboard", []) for b in row
+    ]
+
+
+class FlowError(Exception):
+    pass
+
+
+# Виртуальный водитель: действие -> ожидание нужного числа ответов бота
+class VirtualDriver:
+    def __init__(self, tg: FakeTelegram, index: int, timeout: float):
+        self.tg = tg
+        self.phone = phone_for(index)
+        self.user = {"id": USER_BASE + index, "is_bot": False, "first_name": "d"}
+        self.timeout = timeout
+        self.menu = None  # последнее сообщение бота с главным меню
+
+    async def step(self, action, *args, replies=1):
+        action(self.user, *args)
+        inbox = self.tg.inbox[self.user["id"]]
+        messages = []
+        for _ in range(replies):
+            messages.append(await asyncio.wait_for(inbox.get(), self.timeout))
+        return messages[-1]
+
+    async def press(self, message, prefix):
+        choices = [d for d in buttons(message) if d.startswith(prefix)]
+        if not choices:
+            raise FlowError(f"нет кнопки {prefix}: {message.get('text', '')[:60]}")
+        return await self.step(self.tg.press, message, random.choice(choices))
+
+    async def start(self):
+        await self.step(self.tg.send_text, "/start")
+        self.menu = await self.step(self.tg.send_contact, self.phone, replies=2)
+        if not buttons(self.menu):
+            raise FlowError(self.menu.get("text", "")[:60])
+
+    async def book(self):
+        dates = await self.press(self.menu, "BOOK")
+        times = await self.press(dates, "BOOK_DATE|")
+        self.menu = await self.press(times, "BOOK_TIME|")
+        if not self.menu.get("text", "").startswith("Отлично"):
+            raise FlowError(self.menu.get("text", "")[:60])
+
+    async def info(self):
+        kinds = await self.press(self.menu, "INFO")
+        self.menu = await self.press(kinds, "INFO_PICK|")
+
+    async def cancel(self):
+        items = await self.press(self.menu, "CANCEL")
+        confirm = await self.press(items, "CANCEL_PICK|")
+        self.menu = await self.press(confirm, "CANCEL_PICK|YES|")
+        if self.menu.get("text") != "Запись отменена.":
+            raise FlowError(self.menu.get("text", "")[:60])
+
+
+async def drive(tg, index, timeout, results, calls):
+    driver = VirtualDriver(tg, index, timeout)
+    chat = driver.user["id"]
+    for flow in FLOWS:
+        before = Counter(tg.chat_calls[chat])
+        started = time.perf_counter()
+        try:
+            await getattr(driver, flow)()
+        except (FlowError, asyncio.TimeoutError) as e:
+            results[flow]["errors"].append(repr(e))
+            return
+        results[flow]["timings"].append(time.perf_counter() - started)
+        calls[flow].update(tg.chat_calls[chat] - before)
+
+
+async def run(args):
+    tg = FakeTelegram()
+    server = uvicorn.Server(
+        uvicorn.Config(
+            tg, host="127.0.0.1", port=args.port, log_level="warning", lifespan="off"
+        )
+    )
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    bot = None
+    if not args.no_bot:
+        env = {
+            **os.environ,
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{args.port}",
+            "TELEGRAM_BOT_TOKEN": "123456:loadtest",
+            "API_BASE": args.api_base,
+            "THROTTLE_BOT_TOKEN": args.bot_token,
+        }
+        with open(args.bot_log, "w") as log:
+            bot = subprocess.Popen(
+                [sys.executable, "bot.py"], cwd=ROOT, env=env, stdout=log, stderr=log
+            )
+
+    # Бот готов, когда начал опрашивать getUpdates
+    deadline = time.monotonic() + 60
+    while not tg.calls["getUpdates"]:
+        if time.monotonic() > deadline:
+            raise SystemExit("бот не подключился к fake Telegram за 60 с")
+        await asyncio.sleep(0.1)
+
+    results = defaultdict(lambda: {"timings": [], "errors": []})
+    calls = defaultdict(Counter)
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(index):
+        async with limit:
+            await drive(tg, index, args.timeout, results, calls)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.drivers)))
+    elapsed = time.perf_counter() - started
+
+    if bot:
+        bot.terminate()
+        bot.wait(timeout=30)
+    server.should_exit = True
+    await server_task
+
+    print(
+        f"Водителей: {args.drivers}, одновременно: {args.concurrency}, "
+        f"время: {elapsed:.1f} с, getUpdates: {tg.calls['getUpdates']}"
+    )
+    for flow in FLOWS:
+        data = results[flow]
+        ok = len(data["timings"])
+        per_flow = ", ".join(
+            f"{method} {count / ok:.1f}"
+            for method, count in sorted(calls[flow].items())
+        )
+        print(
+            f"{flow:>6}: успешно {ok}, ошибок {len(data['errors'])}, "
+            f"{percentiles(data['timings'])}; Bot API на сценарий: {per_flow or '—'}"
+        )
+        for error in Counter(data["errors"]).most_common(3):
+            print(f"        {error[1]} x {error[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30, help="ожидание ответа, с")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--api-base", default="http://127.0.0.1:8000/api")
+    parser.add_argument(
+        "--seed", action="store_true", help="создать водителей и слоты для прогона"
+    )
+    parser.add_argument("--seed-days", type=int, default=7)
+    parser.add_argument(
+        "--no-bot", action="store_true", help="bot.py запущен отдельно (см. порт)"
+    )
+    parser.add_argument("--bot-log", default="loadtest_bot.log")
+    parser.add_argument(
+        "--bot-token",
+        default=os.getenv("THROTTLE_BOT_TOKEN", ""),
+        help="THROTTLE_BOT_TOKEN запущенного Django",
+    )
+    args = parser.parse_args()
+    if not args.bot_token and not args.no_bot:
+        parser.error("нужен THROTTLE_BOT_TOKEN Django (--bot-token или окружение)")
+    if args.seed:
+        seed(args.drivers, args.seed_days)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs
+
+# Локальная замена Telegram Bot API для нагрузочных прогонов бота.
+# Бот ходит сюда вместо api.telegram.org (TELEGRAM_API_URL), обновления
+# подкладывает симулятор водителей (push_update), ответы бота (sendMessage,
+# editMessageText, answerCallbackQuery) записываются и раздаются по чатам.
+#   TELEGRAM_API_URL=http://127.0.0.1:8081 python bot.py
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FleetCare", "username": "fc_bot"}
+
+# Методы, которые водитель "видит" в чате
+VISIBLE = ("sendMessage", "editMessageText")
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.updates = []  # ожидающие getUpdates
+        self.new_update = asyncio.Event()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.calls = Counter()  # метод -> число вызовов
+        self.chat_calls = defaultdict(Counter)  # chat_id -> метод -> число
+        self.inbox = defaultdict(asyncio.Queue)  # chat_id -> видимые ответы бота
+        self.callbacks = {}  # callback_query_id -> chat_id
+
+    # Обновления от "водителя"
+    def push_update(self, payload: dict) -> int:
+        update_id = next(self.update_ids)
+        self.updates.append({"update_id": update_id, **payload})
+        self.new_update.set()
+        return update_id
+
+    def message(self, chat_id, user, text=None, contact=None, reply_markup=None):
+        data = {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if user:
+            data["from"] = user
+        if text is not None:
+            data["text"] = text
+            if text.startswith("/"):
+                data["entities"] = [
+                    {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+                ]
+        if contact:
+            data["contact"] = contact
+        if reply_markup:
+            data["reply_markup"] = reply_markup
+        return data
+
+    def send_text(self, user, text):
+        self.push_update({"message": self.message(user["id"], user, text=text)})
+
+    def send_contact(self, user, phone):
+        contact = {
+            "phone_number": phone,
+            "first_name": user["first_name"],
+            "user_id": user["id"],
+        }
+        self.push_update({"message": self.message(user["id"], user, contact=contact)})
+
+    # Нажатие inline-кнопки под сообщением бота
+    def press(self, user, bot_message: dict, data: str):
+        query_id = f"{user['id']}-{next(self.update_ids)}"
+        self.callbacks[query_id] = user["id"]
+        self.push_update(
+            {
+                "callback_query": {
+                    "id": query_id,
+                    "from": user,
+                    "chat_instance": str(user["id"]),
+                    "message": bot_message,
+                    "data": data,
+                }
+            }
+        )
+
+    # --- Bot API ---
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+        if offset:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and timeout:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    # Сообщение бота; в Message Telegram возвращает только inline-клавиатуру
+    def bot_message(self, params, message_id=None):
+        markup = params.get("reply_markup")
+        message = self.message(
+            int(params["chat_id"]),
+            BOT_USER,
+            text=params.get("text", ""),
+            reply_markup=markup if markup and "inline_keyboard" in markup else None,
+        )
+        if message_id:
+            message["message_id"] = int(message_id)
+        return message
+
+    async def call(self, method, params):
+        self.calls[method] += 1
+        chat_id = params.get("chat_id")
+        if method == "answerCallbackQuery":
+            chat_id = self.callbacks.pop(params.get("callback_query_id"), None)
+        if chat_id is not None:
+            self.chat_calls[int(chat_id)][method] += 1
+
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return await self.get_updates(params)
+        if method in VISIBLE:
+            result = self.bot_message(params, params.get("message_id"))
+            self.inbox[int(chat_id)].put_nowait(result)
+            return result
+        return True
+
+    # ASGI-приложение: /bot<token>/<method>
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            event = await receive()
+            body += event.get("body", b"")
+            if not event.get("more_body"):
+                break
+        method = scope["path"].rsplit("/", 1)[-1]
+        result = await self.call(method, parse_params(scope, body))
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": payload})
+
+
+# Параметры запроса: JSON или form-urlencoded (как шлет python-telegram-bot),
+# сложные значения (reply_markup и т.п.) закодированы в JSON
+def parse_params(scope, body: bytes) -> dict:
+    headers = dict(scope["headers"])
+    if headers.get(b"content-type", b"").startswith(b"application/json"):
+        return json.loads(body or b"{}")
+    params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+    params.update(
+        {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+    )
+    for key in ("reply_markup", "entities"):
+        if key in params:
+            params[key] = json.loads(params[key])
+    return params
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from telegram import Chat, Message, Update, User
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bot_updates import PerUserUpdateProcessor  # noqa: E402
+
+# Нагрузочная проверка PerUserUpdateProcessor без Telegram и API:
+# много водителей шлют серии обновлений, обработчик "ходит в API" со случайной задержкой.
+# Проверяется, что обновления одного водителя обработаны строго по порядку,
+# и как растет пропускная способность с числом параллельных обработчиков.
+#   python -m loadtest.update_order --drivers 500 --updates 5 --concurrency 1 32 128
+
+
+def make_update(update_id, user_id):
+    user = User(id=user_id, first_name="driver", is_bot=False)
+    chat = Chat(id=user_id, type=Chat.PRIVATE)
+    message = Message(
+        message_id=update_id, date=datetime.now(), chat=chat, from_user=user, text="x"
+    )
+    return Update(update_id=update_id, message=message)
+
+
+async def run(drivers, updates_per_driver, concurrency, latency_ms):
+    processor = PerUserUpdateProcessor(concurrency)
+    seen = {}  # user_id -> номера обновлений в порядке обработки
+
+    async def handler(update):
+        await asyncio.sleep(random.uniform(*latency_ms) / 1000)
+        seen.setdefault(update.effective_user.id, []).append(update.update_id)
+
+    # Обновления перемешаны между водителями, но у каждого идут по возрастанию
+    stream = [
+        make_update(seq * drivers + user_id, user_id)
+        for seq in range(updates_per_driver)
+        for user_id in range(1, drivers + 1)
+    ]
+    async with processor:
+        started = time.perf_counter()
+
+        # Как Application при concurrent_updates: задача на каждое обновление
+        await asyncio.gather(
+            *(
+                asyncio.create_task(processor.process_update(u, handler(u)))
+                for u in stream
+            )
+        )
+        elapsed = time.perf_counter() - started
+    reordered = sum(ids != sorted(ids) for ids in seen.values())
+    return len(stream) / elapsed, reordered, processor.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--drivers", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 32, 128])
+    parser.add_argument("--latency-ms", type=float, nargs=2, default=[5, 50])
+    args = parser.parse_args()
+    for concurrency in args.concurrency:
+        rate, reordered, stats = asyncio.run(
+            run(args.drivers, args.updates, concurrency, args.latency_ms)
+        )
+        print(
+            f"concurrency={concurrency}: {rate:.0f} updates/s, "
+            f"водителей с нарушенным порядком: {reordered}, "
+            f"max_user_queue={stats['max_user_queue']}, "
+            f"max_wait_ms={stats['max_wait_ms']:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
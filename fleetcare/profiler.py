@@ -0,0 +1,95 @@
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+# Выборочное профилирование (cProfile) веб-приложения и бота.
+# Профилируется доля запросов/обновлений sample_rate (0..1), профили пишутся
+# файлами .prof, которые открываются стандартными средствами:
+#   python -m pstats profiles/<файл>.prof   или   snakeviz profiles/<файл>.prof
+# Выключенный профайлер (sample_rate=0) в цепочку вызовов не встраивается.
+# Одновременно снимается только один профиль на процесс: в async-коде cProfile
+# видит все задачи цикла событий, поэтому пересекающиеся запросы пропускаются
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    def __init__(self, sample_rate: float = 0.0, directory="profiles", min_ms=0.0):
+        self.sample_rate = sample_rate
+        self.directory = Path(directory)
+        self.min_ms = min_ms  # не сохранять профили быстрее порога
+        self._busy = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def sampled(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    # Начать профиль; None - если уже снимается другой
+    def start(self):
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    # Остановить профиль и сохранить файл; возвращает путь (или None).
+    # extra - уже остановленные профили других потоков того же запроса,
+    # они сохраняются в тот же файл
+    def stop(self, profile, label: str, elapsed: float, force=False, extra=()):
+        profile.disable()
+        self._busy.release()
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < self.min_ms and not force:
+            return None
+        name = re.sub(r"[^\w.-]+", "_", label).strip("_")[:80]
+        path = self.directory / (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-"
+            f"{name}-{elapsed_ms:.0f}ms.prof"
+        )
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            stats = pstats.Stats(profile)
+            for other in extra:
+                other.create_stats()
+                if other.stats:
+                    stats.add(other)
+            stats.dump_stats(path)
+        except OSError:
+            logger.exception("Не удалось сохранить профиль %s", path)
+            return None
+        return path
+
+
+# Декоратор async-обработчиков бота: профилирует выборку вызовов.
+# При выключенном профайлере возвращает обработчик без обертки
+def profiled(profiler: Profiler):
+    def decorator(handler):
+        if not profiler.enabled:
+            return handler
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            profile = profiler.start() if profiler.sampled() else None
+            if profile is None:
+                return await handler(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                profiler.stop(
+                    profile, f"bot-{handler.__name__}", time.perf_counter() - started
+                )
+
+        return wrapper
+
+    return decorator